@@ -11,10 +11,12 @@ import sys
 import threading
 import time
 import zipfile
-from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from datetime import datetime, timedelta
-from typing import List, Optional
-from urllib.parse import urljoin
+from typing import Iterable, List, Optional, Set, Tuple, Union
+from urllib.parse import unquote, urljoin, urlsplit
 
 import octoprint.filemanager
 import octoprint.plugin
@@ -25,13 +27,41 @@ from octoprint.access.permissions import Permissions
 from octoprint.logging.handlers import CleaningTimedRotatingFileHandler
 from octoprint.server import app
 from octoprint.util.version import is_octoprint_compatible
-from PIL import Image
 from werkzeug.utils import secure_filename
 
 from .commands.commands import Commands
 from .emoji import Emoji
-from .telegram_notifications import TMSG, telegramMsgDict
+from .media import (
+    CLIP_FORMAT_AVI,
+    CLIP_FORMAT_GIF,
+    PRINTER_IDLE,
+    PRINTER_PAUSED,
+    PRINTER_PRINTING,
+    CaptureSessionManager,
+    ClipBuffer,
+    DeferredClip,
+    EncodePolicy,
+    EncoderProbe,
+    ImageWorkerPool,
+    MediaWorkspace,
+    PrintRecap,
+    ResourceGovernor,
+    SegmentRecorder,
+    SnapshotClipBuilder,
+    ThumbnailCache,
+    WebcamHealthTracker,
+    WebcamUnavailableError,
+    get_tmpfs_dir,
+    plan_clip_encoding,
+    run_to_buffer,
+)
+from .notification_queue import NotificationQueue
+from .plugin_data import PluginDataProviders
+from .printer_state import PrinterStateCache
+from .serial_triggers import SerialTriggerMatcher
+from .telegram_notifications import EXTERNAL_VARIABLE_SOURCES, TMSG, telegramMsgDict
 from .telegram_utils import TOKEN_REGEX, TelegramUtils, get_chat_title, is_group_or_channel
+from .utils import ImageUtils
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -651,6 +681,52 @@ class WebcamProfile:
         )
 
 
+class CapturedMedia:
+    """Snapshots and gifs captured from the webcams, ready to be shared by several chats"""
+
+    def __init__(self, workspace: Optional[MediaWorkspace] = None):
+        self.workspace = workspace  # Workspace owning the gif files, if any
+        self.snapshots: List[Tuple[WebcamProfile, bytes]] = []
+        self.gifs: List[Tuple[WebcamProfile, Union[str, ClipBuffer, DeferredClip]]] = []
+
+    @property
+    def has_deferred_gifs(self) -> bool:
+        return any(isinstance(gif, DeferredClip) for _, gif in self.gifs)
+
+    def finish_deferred_gifs(self, logger: logging.Logger):
+        """Encode the gifs whose encoding has been deferred, dropping the ones that fail. May wait a long time."""
+        finished_gifs = []
+        for webcam_profile, gif in self.gifs:
+            if isinstance(gif, DeferredClip):
+                try:
+                    finished_gifs.append((webcam_profile, gif.finish()))
+                except Exception:
+                    logger.exception("Caught an exception encoding deferred gif %s", gif.name)
+                finally:
+                    gif.close()
+            else:
+                finished_gifs.append((webcam_profile, gif))
+        self.gifs = finished_gifs
+
+    def close(self):
+        """Release the gifs, kept in memory or in the workspace"""
+        for _, gif in self.gifs:
+            if isinstance(gif, (ClipBuffer, DeferredClip)):
+                gif.close()
+            elif self.workspace is not None:
+                self.workspace.discard(gif)
+
+    def select(self, webcam_names: Optional[Set[str]] = None) -> "CapturedMedia":
+        """Return the media taken from the given webcams only (all webcams if webcam_names is None)"""
+        if webcam_names is None:
+            return self
+
+        selected = CapturedMedia(self.workspace)
+        selected.snapshots = [(p, c) for p, c in self.snapshots if (p.name or "") in webcam_names]
+        selected.gifs = [(p, g) for p, g in self.gifs if (p.name or "") in webcam_names]
+        return selected
+
+
 ########################################
 ########################################
 ############## THE PLUGIN ##############
@@ -666,6 +742,18 @@ class TelegramPlugin(
     octoprint.plugin.AssetPlugin,
     octoprint.plugin.WizardPlugin,
 ):
+    # Seconds without data from a webcam stream after which gif recording is aborted
+    GIF_STREAM_TIMEOUT = 15
+
+    # Beginnings of the serial lines handled by hook_gcode_received()
+    GCODE_RECEIVED_PREFIXES = ("ok", "echo:busy: paused for user", "// action:paused", "echo:UserNotif")
+
+    # Periodic notifications, whose gifs may be encoded later while the host is under pressure
+    NON_URGENT_EVENTS = {"StatusPrinting", "ZChange"}
+
+    # Events changing the print job, for which the pushed printer state may still describe the previous job
+    JOB_STATE_EVENTS = {"PrintStarted", "PrintDone", "PrintFailed", "PrintCancelled", "PrintPaused", "PrintResumed"}
+
     # For more init stuff see also on_after_startup()
     def __init__(self):
         self._logger = logging.getLogger("octoprint.plugins.telegram")
@@ -681,6 +769,7 @@ class TelegramPlugin(
         self.commands = Commands(self)
         self.telegram_utils = None
         self.tmsg = None
+        self.printer_state = None
 
         self.new_chat_settings = {}  # Initial settings for new chat. See on_after_startup()
 
@@ -688,6 +777,53 @@ class TelegramPlugin(
 
         self.user_pause_already_notified = False
 
+        self.webcam_health = WebcamHealthTracker(self._logger, self.probe_webcam)
+        self.capture_sessions = CaptureSessionManager(
+            self._logger,
+            self.pre_image,
+            self.post_image,
+            lambda: self._settings.get_int(["PostImgDelay"], min=0),
+        )
+        self.image_workers = ImageWorkerPool(self._logger)
+
+        # Maximum number of ffmpeg processes recording gifs at the same time
+        self.max_gif_encoders = max(1, multiprocessing.cpu_count() // 2)
+        self.gif_encoder_slots = threading.BoundedSemaphore(self.max_gif_encoders)
+
+        self.encoder_probe = None  # Cached tools and encoder capabilities. See on_after_startup()
+        self.resource_governor = None  # Priorities of background encoders. See on_after_startup()
+        self.media_workspace = None  # Temporary media files. See on_after_startup()
+
+        self.gif_recorders = {}  # Pre-event ring buffer recorders, by stream url. See start_gif_recorders()
+        self.snapshot_resolutions = {}  # (width, height) of the snapshots, by snapshot url. See fetch_snapshot()
+
+        # Event notifications, built and sent off the threads that dispatch events
+        self.notification_queue = NotificationQueue(
+            self._logger, lambda event, payload, kwargs: self.tmsg.startEvent(event, payload, **kwargs)
+        )
+
+        self.serial_triggers = None  # User defined serial triggers. See load_serial_triggers()
+
+        # Data of third-party plugins used by notification templates, fetched in the background
+        self.plugin_data = PluginDataProviders(self._logger)
+        self.plugin_data.add("display_layer_progress", self.fetch_layer_progress_values, interval=10)
+        self.plugin_data.add("resource_monitor", self.fetch_resource_monitor_stats, interval=30)
+        self.plugin_data.add("prusammu", self.fetch_prusammu_state, interval=30)
+
+        # Execution time of the gcode hooks. Each hook is always called by the same thread, so no lock is needed.
+        self.hook_stats = {
+            hook_name: {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            for hook_name in ("gcode_received", "gcode_sent")
+        }
+
+        self.gif_encode_stats = deque(maxlen=20)  # Parameters and outcome of the last gif encodes, for tuning
+
+        # Recap clip of the current print. See handle_print_recap_event()
+        self.print_recap = PrintRecap(
+            self._logger, run=self.image_workers.run, discard=lambda path: self.media_workspace.discard(path)
+        )
+        self.thumbnails = ThumbnailCache(self._logger)  # Print thumbnails read from storage. See get_thumbnail()
+
     # Starts the telegram bot
     def start_bot(self):
         token = self._settings.get(["token"])
@@ -778,6 +914,13 @@ class TelegramPlugin(
     def get_tmpgif_dir(self):
         return os.path.join(self.get_plugin_data_folder(), "tmpgif")
 
+    def get_gif_buffer_dir(self):
+        """Directory of the ring buffer recorders: memory backed if possible, since they write continuously"""
+        tmpfs_dir = get_tmpfs_dir()
+        if tmpfs_dir:
+            return os.path.join(tmpfs_dir, f"octoprint-{self._identifier}-gifbuffer")
+        return os.path.join(self.get_plugin_data_folder(), "gifbuffer")
+
     ##########
     ### Template API
     ##########
@@ -836,8 +979,15 @@ class TelegramPlugin(
 
         self.telegram_utils = TelegramUtils(self)
 
+        # Printer state pushed by OctoPrint, read by notifications and commands instead of polling the printer
+        self.printer_state = PrinterStateCache(self._logger, self._printer)
+        self._printer.register_callback(self.printer_state)
+
         # Notification Message Handler class. Called only by on_event()
         self.tmsg = TMSG(self)
+        self.notification_queue.start()
+        self.plugin_data.start()
+        self.load_serial_triggers()
 
         # Initial settings for new chat.
         self.new_chat_settings = {
@@ -847,19 +997,52 @@ class TelegramPlugin(
             "type": "private",
             "image": "",
             "allow_users": False,
+            "cameras": [],
             "commands": {k: False for k, v in self.commands.commands_dict.items() if "bind_none" not in v},
             "notifications": {k: False for k, v in telegramMsgDict.items()},
         }
 
         # Create / clean tmpgif folder
-        shutil.rmtree(self.get_tmpgif_dir(), ignore_errors=True)
-        os.makedirs(self.get_tmpgif_dir(), exist_ok=True)
+        self.media_workspace = MediaWorkspace(self._logger, self.get_tmpgif_dir())
+        self.media_workspace.start()
+
+        self.webcam_health.start()
+        self.image_workers.configure(self._settings.get_int(["image_worker_processes"], min=0) or 0)
+
+        self.encoder_probe = EncoderProbe(
+            self._logger,
+            self.get_ffmpeg_path,
+            os.path.join(self.get_plugin_data_folder(), "encoder_probe.json"),
+            lambda: self.get_printer_activity() != PRINTER_IDLE,
+            self.wrap_recorder_command,
+        )
+
+        self.resource_governor = ResourceGovernor(
+            self._logger,
+            self.get_printer_activity,
+            lambda: self.encoder_probe.cpu_count,
+            lambda: self.encoder_probe.nice_path,
+            lambda: self.encoder_probe.ionice_path,
+        )
+
+        self.encoder_probe.start()
+
+        self.start_gif_recorders()
 
         self.start_bot()
 
     def on_shutdown(self):
         self.on_event("PrinterShutdown", {})
+        self.notification_queue.stop(timeout=10)  # Send the pending notifications, including PrinterShutdown
+        if self.printer_state:
+            self._printer.unregister_callback(self.printer_state)
+        self.plugin_data.stop()
         self.stop_bot()
+        self.webcam_health.stop()
+        self.capture_sessions.stop()
+        self.image_workers.shutdown()
+        self.stop_gif_recorders()
+        self.media_workspace.stop()
 
     ##########
     ### Settings API
@@ -877,12 +1060,35 @@ class TelegramPlugin(
             },  # zBOTTOMOFCHATS is a dummy element to avoid bug https://github.com/OctoPrint/OctoPrint/issues/5177
             send_icon=True,
             send_gif=False,
+            send_text_first=False,
             no_mistake=False,
             select_file_after_upload=False,
             sort_files_by_date=False,
             show_models_in_files=True,
-            no_cpulimit=False,
-            ffmpeg_preset="medium",
+            ffmpeg_preset="auto",
+            gif_memory_limit=20,
+            gif_ring_buffer=False,
+            gif_ring_buffer_seconds=30,
+            gif_engine="auto",
+            gif_snapshot_fps=2,
+            gif_snapshot_max_dimension=480,
+            gif_snapshot_format="gif",
+            gif_max_size=0,
+            gif_max_fps=0,
+            gif_max_dimension=0,
+            gif_encoding_overrides={},
+            print_recap=False,
+            print_recap_interval=30,
+            print_recap_image_actions=False,
+            serial_triggers=[],
+            image_max_dimension=2560,
+            image_quality=75,
+            image_max_size=0,
+            webcam_image_settings={},
+            image_collage=False,
+            image_collage_max_dimension=2560,
+            image_collage_max_size=1024,
+            image_worker_processes=0,
             PreImgMethod="None",
             PreImgCommand="",
             PreImgDelay=0,
@@ -900,6 +1106,20 @@ class TelegramPlugin(
             dict(
                 notification_height=lambda x: float(x),
                 notification_time=lambda x: int(x),
+                image_max_dimension=lambda x: int(x),
+                image_quality=lambda x: int(x),
+                image_max_size=lambda x: int(x),
+                image_collage_max_dimension=lambda x: int(x),
+                image_collage_max_size=lambda x: int(x),
+                image_worker_processes=lambda x: int(x),
+                gif_memory_limit=lambda x: int(x),
+                gif_ring_buffer_seconds=lambda x: int(x),
+                gif_snapshot_fps=lambda x: int(x),
+                gif_snapshot_max_dimension=lambda x: int(x),
+                gif_max_size=lambda x: int(x),
+                gif_max_fps=lambda x: int(x),
+                gif_max_dimension=lambda x: int(x),
+                print_recap_interval=lambda x: int(x),
             ),
         )
 
@@ -913,7 +1133,8 @@ class TelegramPlugin(
         # 1.5.1:  5
         # 1.9.0:  6
         # 1.10.0: 7
-        return 7
+        # 1.12.0: 9
+        return 9
 
     def on_settings_migrate(self, target, current=None):
         self._logger.warning("Migration - start migration from %s to %s", current, target)
@@ -988,6 +1209,7 @@ class TelegramPlugin(
                 "message_at_print_failed",
                 "image_not_connected",
                 "gif_not_connected",
+                "no_cpulimit",
             ]
 
             # Update chats
@@ -1099,6 +1321,20 @@ class TelegramPlugin(
         # Now save settings
         octoprint.plugin.SettingsPlugin.on_settings_save(self, data)
 
+        self.image_workers.configure(self._settings.get_int(["image_worker_processes"], min=0) or 0)
+
+        # Message templates are compiled once: recompile them with the new settings
+        if self.tmsg:
+            self.tmsg.clear_templates()
+            self.tmsg.load_settings()
+
+        if "serial_triggers" in data:
+            self.load_serial_triggers()
+
+        # Restart the gif ring buffer if its settings changed
+        if any(key in data for key in ("send_gif", "gif_ring_buffer", "gif_ring_buffer_seconds")):
+            self.start_gif_recorders()
+
         # Reconnect if the token changed
         if "token" in data and data["token"] != old_token:
             self.stop_bot()
@@ -1138,6 +1374,9 @@ class TelegramPlugin(
 
     def on_event(self, event, payload, **kwargs):
         try:
+            if event in self.JOB_STATE_EVENTS and self.printer_state:
+                self.printer_state.on_job_event(event, payload)
+
             if not self.tmsg:
                 self._logger.debug("Received an event, but tmsg is not initialized yet")
                 return
@@ -1152,10 +1391,25 @@ class TelegramPlugin(
                 elif payload["state"] in ("UNLOADING", "UNLOADING_FINAL", "LOADING", "LOADED", "CUTTING", "EJECTING"):
                     event = "PrusaMMU_Status"
 
+            self.handle_print_recap_event(event)
+            self.handle_plugin_data_event(event, payload)
+
             # If we know the event, start handler
             if event in self.tmsg.msgCmdDict:
+                if not self.tmsg.is_event_wanted(event, payload):
+                    return
                 self._logger.debug("Received a known event: %s - Payload: %s", event, payload)
-                self.tmsg.startEvent(event, payload, **kwargs)
+                if "chatID" in kwargs:
+                    # Replies to commands already run on a bot thread
+                    self.tmsg.startEvent(event, payload, **kwargs)
+                else:
+                    # Only snapshot the event here, notifications are built and sent by the notification queue.
+                    # The pushed printer state lags behind the job changes: the queue waits for the next push.
+                    if event in self.JOB_STATE_EVENTS:
+                        printer_data = None
+                    else:
+                        printer_data = self.printer_state.get_data()
+                    self.notification_queue.put(event, dict(payload or {}), {**kwargs, "printer_data": printer_data})
         except Exception:
             self._logger.exception("Caught an exception handling an event")
 
@@ -1212,22 +1466,22 @@ class TelegramPlugin(
                 }
             )
 
+        # /?webcams
+        if request_args and "webcams" in request_args:
+            return jsonify(
+                {
+                    "webcams": [p.name for p in self.get_webcam_profiles() if p.name],
+                    "health": self.webcam_health.get_status(),
+                }
+            )
+
         # /?default_messages
         if request_args and "default_messages" in request_args:
             return jsonify(telegramMsgDict)
 
         # /?requirements
         if request_args and "requirements" in request_args:
-            settings_ffmpeg = self._settings.global_get(["webcam", "ffmpeg"])
-            ffmpeg_path = (
-                settings_ffmpeg
-                if isinstance(settings_ffmpeg, str)
-                and os.path.isfile(settings_ffmpeg)
-                and os.access(settings_ffmpeg, os.X_OK)
-                else shutil.which("ffmpeg")
-            )
-
-            cpulimiter_path = shutil.which("cpulimit") or shutil.which("limitcpu")
+            self.encoder_probe.refresh_tools()
 
             def get_plugin_status(plugin_id):
                 info = self._plugin_manager.get_plugin_info(plugin_id, require_enabled=False)
@@ -1274,8 +1528,22 @@ class TelegramPlugin(
 
             return jsonify(
                 {
-                    "ffmpeg_path": ffmpeg_path,
-                    "cpulimiter_path": cpulimiter_path,
+                    "ffmpeg_path": self.encoder_probe.ffmpeg_path,
+                    "resource_governor": self.resource_governor.get_status(),
+                    "media_workspace": self.media_workspace.get_status(),
+                    "capture_sessions": self.capture_sessions.get_status(),
+                    "notification_queue": self.notification_queue.get_status(),
+                    "plugin_data": self.plugin_data.get_status(),
+                    "thumbnails": self.thumbnails.get_status(),
+                    "printer_state": self.printer_state.get_status() if self.printer_state else None,
+                    "gcode_hooks": self.get_hook_stats(),
+                    "print_recap": self.print_recap.get_status(),
+                    "gif_encodes": list(self.gif_encode_stats),
+                    "encoder_probe": {
+                        **self.encoder_probe.capabilities,
+                        "running": self.encoder_probe.is_running,
+                        "deferred": self.encoder_probe.deferred,
+                    },
                     **{id: get_plugin_status(id) for id in suggested_plugin_ids},
                 }
             )
@@ -1304,6 +1572,7 @@ class TelegramPlugin(
             stopEnrollmentCountdown=[],
             testEvent=["event"],
             testToken=["token"],
+            probeEncoders=[],
         )
 
     def on_api_command(self, command, data):
@@ -1393,9 +1662,17 @@ class TelegramPlugin(
                     {"ok": False, "error": f"Invalid values: {', '.join(invalid_keys)} must be boolean"}
                 ), 400
 
+            # Check that cameras, if provided, is a list of webcam names
+            cameras = data.get("cameras")
+            if cameras is not None and (not isinstance(cameras, list) or not all(isinstance(c, str) for c in cameras)):
+                self._logger.warning("Received cameras arg is not a list of strings")
+                return jsonify({"ok": False, "error": "Invalid values: cameras must be a list of strings"}), 400
+
             # Update user
             for key in settings_keys:
                 settings_chat[key] = data[key]
+            if cameras is not None:
+                settings_chat["cameras"] = cameras
             self._settings.set(["chats", chat_id], settings_chat)
             self._settings.save()
 
@@ -1414,6 +1691,13 @@ class TelegramPlugin(
             )
             return jsonify({"ok": True, "duration": duration})
 
+        elif command == "probeEncoders":
+            # While printing, the probe waits for the printer to be idle
+            self.encoder_probe.start(force=True)
+            return jsonify(
+                {"ok": True, "running": self.encoder_probe.is_running, "deferred": self.encoder_probe.deferred}
+            )
+
         elif command == "stopEnrollmentCountdown":
             self.enrollment_countdown_end = None
             self._plugin_manager.send_plugin_message(self._identifier, {"type": "enrollment_countdown", "remaining": 0})
@@ -1438,6 +1722,7 @@ class TelegramPlugin(
 
                 self._logger.debug("Send_msg() - Found event: %s | chats settings=%s", event, settings_chats)
 
+                recipients = []
                 for chat_id, chat_settings in settings_chats.items():
                     if chat_id == "zBOTTOMOFCHATS":
                         continue
@@ -1448,11 +1733,59 @@ class TelegramPlugin(
                         is_shut_up = str(chat_id) in self.shut_up
 
                         if notifications.get(event) and send_notifications and not is_shut_up:
-                            kwargs["chatID"] = chat_id
-                            threading.Thread(target=self._send_msg, kwargs=kwargs).run()
+                            recipients.append(chat_id)
                     except Exception:
                         self._logger.exception("Caught an exception processing chat %s", chat_id)
 
+                # Send the text right away, the media will follow as replies once ready
+                if (
+                    recipients
+                    and (self._settings.get_boolean(["send_text_first"]) or kwargs.get("media_as_reply"))
+                    and any(kwargs.get(key) for key in ("with_image", "with_gif", "thumbnail", "movie"))
+                ):
+                    text_kwargs = {**kwargs, "with_image": False, "with_gif": False, "thumbnail": None, "movie": None}
+                    reply_to_message_ids = {}
+                    for chat_id in recipients:
+                        reply_to_message_ids[chat_id] = self._send_msg(**{**text_kwargs, "chatID": chat_id})
+                else:
+                    reply_to_message_ids = None
+
+                # Capture webcams only once, and only the ones selected by at least one recipient
+                if recipients and (kwargs.get("with_image") or kwargs.get("with_gif")):
+                    try:
+                        recipients_webcams = [self.get_selected_webcam_names(chat_id, event) for chat_id in recipients]
+                        if any(webcam_names is None for webcam_names in recipients_webcams):
+                            webcams_union = None
+                        else:
+                            webcams_union = set().union(*recipients_webcams)
+
+                        with ExitStack() as stack:
+                            for chat_id in recipients:
+                                stack.enter_context(self.telegram_action_context(chat_id, "record_video"))
+
+                            kwargs["captured_media"] = self.capture_media(
+                                webcams_union,
+                                kwargs.get("with_image", False),
+                                kwargs.get("with_gif", False),
+                                kwargs.get("gif_duration", 5),
+                                urgent=event not in self.NON_URGENT_EVENTS,
+                                gif_source=event,
+                            )
+                    except Exception:
+                        self._logger.exception("Caught an exception capturing media for event %s", event)
+
+                captured_media = kwargs.get("captured_media")
+                if captured_media is not None and captured_media.has_deferred_gifs:
+                    # Encoding may wait for the host load to drop: not on the thread sending notifications
+                    threading.Thread(
+                        target=self.send_deferred_notification,
+                        args=(recipients, kwargs, reply_to_message_ids),
+                        name="TelegramDeferredMedia",
+                        daemon=True,
+                    ).start()
+                else:
+                    self.send_notification(recipients, kwargs, reply_to_message_ids)
+
             # Message is a broadcast
             elif "chatID" not in kwargs:
                 for chat_id in settings_chats:
@@ -1475,6 +1808,46 @@ class TelegramPlugin(
         except Exception:
             self._logger.exception("Caught an exception in send_msg()")
 
+    def send_notification(self, recipients, kwargs, reply_to_message_ids=None):
+        """
+        Send an event notification to its recipients (see send_msg()), then release its media.
+
+        Args:
+            reply_to_message_ids (dict): Ids of the texts already sent by chat id, the media being sent as replies
+        """
+        for chat_id in recipients:
+            try:
+                kwargs["chatID"] = chat_id
+                chat_kwargs = kwargs
+                if reply_to_message_ids and reply_to_message_ids.get(chat_id):
+                    # Only the media, silently, as a reply to the text already sent
+                    chat_kwargs = {
+                        **kwargs,
+                        "message": "",
+                        "responses": None,
+                        "silent": True,
+                        "delay": 0,  # Already waited before sending the text
+                        "reply_to_message_id": reply_to_message_ids[chat_id],
+                    }
+                threading.Thread(target=self._send_msg, kwargs=chat_kwargs).run()
+            except Exception:
+                self._logger.exception("Caught an exception processing chat %s", chat_id)
+
+        if kwargs.get("captured_media") is not None:
+            kwargs["captured_media"].close()
+
+        # Movies created by the plugin (e.g. the print recap) are deleted once sent
+        if kwargs.get("movie"):
+            self.media_workspace.discard(kwargs["movie"])
+
+    def send_deferred_notification(self, recipients, kwargs, reply_to_message_ids=None):
+        """Encode the deferred gifs of an event notification, then send it (see send_notification())"""
+        try:
+            kwargs["captured_media"].finish_deferred_gifs(self._logger)
+        except Exception:
+            self._logger.exception("Caught an exception finishing deferred gifs")
+        self.send_notification(recipients, kwargs, reply_to_message_ids)
+
     # Edits the text of an existing message (by msg_id) previously sent.
     # Automatically called by send_msg() when a valid msg_id is provided.
     def _send_edit_msg(
@@ -1542,10 +1915,20 @@ class TelegramPlugin(
         show_web=False,
         silent=False,
         gif_duration=5,
+        reply_to_message_id=None,
         **kwargs,
     ):
+        """
+        Send a message, with its media, to a chat.
+
+        Returns:
+            Optional[int]: The id of the message, if it was sent as a text-only message
+        """
         self._logger.debug("Start _send_msg with args: %s", locals())
 
+        owned_media = None  # Media captured by this call, to be released when done
+        sent_message_id = None
+
         try:
             # Check if bot is ready
             if not self.bot_ready:
@@ -1569,6 +1952,11 @@ class TelegramPlugin(
                 else:
                     self._logger.warning("Invalid markup: %s", markup)
 
+            if reply_to_message_id:
+                message_data["reply_parameters"] = json.dumps(
+                    {"message_id": reply_to_message_id, "allow_sending_without_reply": True}
+                )
+
             if responses:
                 inline_keyboard_buttons = []
                 for k in responses:
@@ -1585,8 +1973,7 @@ class TelegramPlugin(
             if thumbnail:
                 try:
                     self._logger.debug("Get thumbnail: %s", thumbnail)
-                    thumbnail_response = self.send_octoprint_request(f"/{thumbnail}")
-                    images_to_send.append(thumbnail_response.content)
+                    images_to_send.append(self.get_thumbnail(thumbnail))
                 except Exception:
                     self._logger.exception("Caught an exception getting thumbnail")
 
@@ -1604,32 +1991,36 @@ class TelegramPlugin(
                     gifs_to_send.append(movie)
 
             if with_image or with_gif:
-                with self.telegram_action_context(chatID, "record_video"):
-                    # Pre image
-                    try:
-                        self.pre_image()
-                    except Exception:
-                        self._logger.exception("Caught an exception calling pre_image()")
+                chat_webcam_names = self.get_selected_webcam_names(chatID, kwargs.get("event"))
+
+                # Media may have already been captured once for all the recipients of a notification
+                captured_media = kwargs.get("captured_media")
+                if captured_media is None:
+                    with self.telegram_action_context(chatID, "record_video"):
+                        captured_media = owned_media = self.capture_media(
+                            chat_webcam_names,
+                            with_image,
+                            with_gif,
+                            gif_duration,
+                            gif_source=kwargs.get("gif_source") or kwargs.get("event"),
+                        )
 
-                    # Add webcam images to images to send
-                    if with_image:
-                        try:
-                            images_to_send += self.take_all_images()
-                        except Exception:
-                            self._logger.exception("Caught an exception taking all images")
+                chat_media = captured_media.select(chat_webcam_names)
 
-                    # Add gifs to gifs to send
-                    if with_gif:
-                        try:
-                            gifs_to_send += self.take_all_gifs(gif_duration)
-                        except Exception:
-                            self._logger.exception("Caught an exception taking all gifs")
-
-                    # Post image
+                # Add webcam images to images to send
+                if with_image:
                     try:
-                        self.post_image()
+                        images_to_send += self.render_snapshots(chat_media.snapshots)
                     except Exception:
-                        self._logger.exception("Caught an exception calling post_image()")
+                        self._logger.exception("Caught an exception rendering images")
+
+                # Add gifs to gifs to send
+                if with_gif:
+                    gifs_to_send += [gif_path for _, gif_path in chat_media.gifs]
+
+            # Animated GIFs can't be part of a media group: they are sent separately as animations
+            animations_to_send = [g for g in gifs_to_send if self.get_clip_name(g).lower().endswith(".gif")]
+            gifs_to_send = [g for g in gifs_to_send if g not in animations_to_send]
 
             # Initialize files and media
             files = {}
@@ -1658,12 +2049,11 @@ class TelegramPlugin(
             # Add gifs to send to files and media
             for i, gif_to_send in enumerate(gifs_to_send):
                 try:
-                    if os.path.getsize(gif_to_send) > 50 * 1024 * 1024:
+                    if self.get_clip_size(gif_to_send) > 50 * 1024 * 1024:
                         self._logger.warning("Skipping a gif bigger than 50MB")
                         continue
 
-                    with open(gif_to_send, "rb") as gif_file:
-                        files[f"video_{i}"] = gif_file.read()
+                    files[f"video_{i}"] = (self.get_clip_name(gif_to_send), self.read_clip(gif_to_send))
 
                     input_media_video = {
                         "type": "video",
@@ -1697,18 +2087,31 @@ class TelegramPlugin(
                         files=files,
                     )
 
-            # If there aren't media, send a text-only message
+            # Animated GIFs are sent one by one. If there are no other media, the message is sent as caption of the
+            # first one sent.
+            animation_sent = self.send_animations(
+                chatID, animations_to_send, message_data, silent, message if not media else None
+            )
+
+            # A follow-up of a message already sent, but no media are ready: nothing to send
+            if media or animation_sent:
+                pass
+            elif reply_to_message_id and message == "":
+                self._logger.debug("No media to send as follow-up, chat id: %s", chatID)
+
+            # If there aren't media (or none of the animations could be sent), send a text-only message
             else:
                 self._logger.debug("Sending text-only message, chat id: %s", chatID)
 
                 with self.telegram_action_context(chatID, "typing"):
                     message_data["text"] = message
 
-                    self.telegram_utils.send_telegram_request(
+                    response = self.telegram_utils.send_telegram_request(
                         f"{self.bot_url}/sendMessage",
                         "post",
                         data=message_data,
                     )
+                    sent_message_id = (response.get("result") or {}).get("message_id")
 
         except Exception:
             self._logger.exception("Caught an exception in _send_msg()")
@@ -1721,6 +2124,76 @@ class TelegramPlugin(
                     "text": "I tried to send you a message, but an exception occurred. Please check the logs.",
                 },
             )
+        finally:
+            if owned_media is not None:
+                owned_media.close()
+
+        return sent_message_id
+
+    def send_animations(
+        self, chat_id, animations: List[Union[str, ClipBuffer]], message_data: dict, silent=False, caption=None
+    ) -> bool:
+        """
+        Send animated GIFs to a chat, one message each.
+
+        If caption is not None, it is sent along with the first animation that is sent successfully, with the parse
+        mode and the reply markup of message_data. Animations bigger than 50MB are skipped.
+
+        Returns:
+            bool: Whether at least one animation was sent
+        """
+        animation_sent = False
+
+        for animation in animations:
+            # Keep workspace files around while they are uploaded, whoever else releases them meanwhile
+            acquired = isinstance(animation, str) and self.media_workspace.acquire(animation)
+            try:
+                if self.get_clip_size(animation) > 50 * 1024 * 1024:
+                    self._logger.warning("Skipping an animation bigger than 50MB")
+                    continue
+
+                animation_data = {"chat_id": chat_id, "disable_notification": silent}
+                if message_data.get("reply_parameters"):
+                    animation_data["reply_parameters"] = message_data["reply_parameters"]
+                if caption is not None and not animation_sent:
+                    animation_data.update(
+                        {k: v for k, v in message_data.items() if k in ("parse_mode", "reply_markup")}
+                    )
+                    if caption != "":
+                        animation_data["caption"] = caption
+
+                self._logger.debug("Sending animation, chat id: %s", chat_id)
+
+                with self.telegram_action_context(chat_id, "upload_video"):
+                    self.telegram_utils.send_telegram_request(
+                        f"{self.bot_url}/sendAnimation",
+                        "post",
+                        data=animation_data,
+                        files={"animation": (self.get_clip_name(animation), self.read_clip(animation))},
+                    )
+                animation_sent = True
+            except Exception:
+                self._logger.exception("Caught an exception sending an animation")
+            finally:
+                if acquired:
+                    self.media_workspace.release(animation)
+
+        return animation_sent
+
+    @staticmethod
+    def get_clip_name(clip: Union[str, ClipBuffer]) -> str:
+        return clip.name if isinstance(clip, ClipBuffer) else os.path.basename(clip)
+
+    @staticmethod
+    def get_clip_size(clip: Union[str, ClipBuffer]) -> int:
+        return clip.size if isinstance(clip, ClipBuffer) else os.path.getsize(clip)
+
+    @staticmethod
+    def read_clip(clip: Union[str, ClipBuffer]) -> bytes:
+        if isinstance(clip, ClipBuffer):
+            return clip.read()
+        with open(clip, "rb") as f:
+            return f.read()
 
     def send_file(self, chat_id, path, caption=""):
         if not self.bot_ready:
@@ -1856,9 +2329,9 @@ class TelegramPlugin(
                 return ""
 
             img_bytes = self.get_file(file_id)
-            with Image.open(io.BytesIO(img_bytes)) as img:
-                img = img.resize((40, 40), Image.LANCZOS)
-                img.save(output_filename, format="JPEG")
+            resized_img_bytes = self.image_workers.run(ImageUtils.resize_image, img_bytes, (40, 40))
+            with open(output_filename, "wb") as f:
+                f.write(resized_img_bytes)
 
             self._logger.info("Saved chat picture for chat id %s", chat_id)
 
@@ -1960,6 +2433,77 @@ class TelegramPlugin(
 
         return False
 
+    def get_selected_webcam_names(self, chat_id, event=None) -> Optional[Set[str]]:
+        """
+        Get the names of the webcams whose media must be sent to a chat for an event.
+
+        Both notification messages and chats can restrict the webcams to use (an empty list means all webcams).
+        When both do, only the webcams selected by both are used.
+
+        Returns:
+            Optional[Set[str]]: The names of the selected webcams, or None if all webcams are selected.
+        """
+        selections = []
+
+        if event:
+            event_webcams = self._settings.get(["messages", event, "cameras"]) or []
+            if event_webcams:
+                selections.append(set(event_webcams))
+
+        chat_webcams = (self._settings.get(["chats", str(chat_id)]) or {}).get("cameras") or []
+        if chat_webcams:
+            selections.append(set(chat_webcams))
+
+        if not selections:
+            return None
+
+        return set.intersection(*selections)
+
+    def capture_media(
+        self,
+        webcam_names: Optional[Iterable[str]] = None,
+        with_image=False,
+        with_gif=False,
+        gif_duration=5,
+        urgent=True,
+        gif_source=None,
+    ) -> CapturedMedia:
+        """
+        Capture snapshots and/or gifs from the given webcams, running the pre/post image actions around them.
+
+        Args:
+            webcam_names (Optional[Iterable[str]]): Names of the webcams to capture. None means all webcams.
+            with_image (bool): Whether to take snapshots
+            with_gif (bool): Whether to take gifs
+            gif_duration (int): Duration of the gifs in seconds
+            urgent (bool): Whether gif encoding can't be deferred when the host is under pressure
+            gif_source (str): Command or event the gifs are taken for, selecting their encoding settings
+
+        Returns:
+            CapturedMedia: The captured media
+        """
+        captured_media = CapturedMedia(self.media_workspace)
+
+        webcam_profiles = self.get_webcam_profiles(webcam_names)
+        if not webcam_profiles or not (with_image or with_gif):
+            return captured_media
+
+        # Pre / post image actions run once for overlapping captures
+        with self.capture_sessions.session():
+            if with_image:
+                try:
+                    captured_media.snapshots = self.take_all_snapshots(webcam_profiles)
+                except Exception:
+                    self._logger.exception("Caught an exception taking all images")
+
+            if with_gif:
+                try:
+                    captured_media.gifs = self.take_all_gifs(gif_duration, webcam_profiles, urgent, gif_source)
+                except Exception:
+                    self._logger.exception("Caught an exception taking all gifs")
+
+        return captured_media
+
     def pre_image(self):
         method = self._settings.get(["PreImgMethod"])
 
@@ -1994,6 +2538,7 @@ class TelegramPlugin(
             time.sleep(delay)
 
     def post_image(self):
+        # PostImgDelay is waited by capture_sessions, as the grace window before ending the session
         method = self._settings.get(["PostImgMethod"])
 
         if method == "None":
@@ -2004,13 +2549,8 @@ class TelegramPlugin(
             return
 
         command = self._settings.get(["PostImgCommand"])
-        delay = self._settings.get_int(["PostImgDelay"], min=0)
-
-        self._logger.debug("Executing post_image: method=%s, command=%s, delay=%ss", method, command, delay)
 
-        if delay:
-            self._logger.debug("Post_image: sleeping for %ss", delay)
-            time.sleep(delay)
+        self._logger.debug("Executing post_image: method=%s, command=%s", method, command)
 
         if method == "EVENT":
             self._event_bus.fire("plugin_telegram_postimg")
@@ -2026,7 +2566,13 @@ class TelegramPlugin(
             except Exception:
                 self._logger.exception("Caught an exception running post_image SYSTEM command '%s'", command)
 
-    def get_webcam_profiles(self) -> List[WebcamProfile]:
+    def get_webcam_profiles(self, webcam_names: Optional[Iterable[str]] = None) -> List[WebcamProfile]:
+        """
+        Get the configured webcam profiles.
+
+        Args:
+            webcam_names (Optional[Iterable[str]]): If given, only the profiles with these names are returned.
+        """
         webcam_profiles: List[WebcamProfile] = []
 
         # New webcam integration (OctoPrint >= 1.9.0)
@@ -2107,94 +2653,398 @@ class TelegramPlugin(
             except Exception:
                 self._logger.exception("Caught exception getting legacy webcam settings")
 
+        if webcam_names is not None:
+            webcam_names = set(webcam_names)
+            webcam_profiles = [p for p in webcam_profiles if (p.name or "") in webcam_names]
+
         self._logger.debug("Final webcam profiles: %s", [p.__dict__ for p in webcam_profiles])
 
         return webcam_profiles
 
-    def take_all_images(self) -> List[bytes]:
-        taken_images_contents = []
+    def take_all_snapshots(self, webcam_profiles: List[WebcamProfile]) -> List[Tuple[WebcamProfile, bytes]]:
+        snapshots = []
 
         self._logger.debug("Taking all images")
 
-        webcam_profiles = self.get_webcam_profiles()
         for webcam_profile in webcam_profiles:
             try:
                 if not webcam_profile.snapshot:
                     self._logger.debug("Skipped a webcam without snapshot url")
                     continue
 
-                taken_image_content = self.take_image(
-                    webcam_profile.snapshot,
-                    webcam_profile.flipH,
-                    webcam_profile.flipV,
-                    webcam_profile.rotate90,
-                    webcam_profile.snapshotTimeout,
-                )
-                taken_images_contents.append(taken_image_content)
+                snapshot_content = self.fetch_snapshot(webcam_profile.snapshot, webcam_profile.snapshotTimeout)
+                snapshots.append((webcam_profile, snapshot_content))
+            except WebcamUnavailableError as e:
+                self._logger.debug("Skipped webcam %s: %s", webcam_profile.name, e)
             except Exception:
                 self._logger.exception("Caught an exception taking an image")
 
-        return taken_images_contents
+        return snapshots
+
+    def render_snapshots(self, snapshots: List[Tuple[WebcamProfile, bytes]]) -> List[bytes]:
+        """Apply webcam transformations and output settings to raw snapshots, or combine them in a collage"""
+        rendered_images = []
+
+        if not snapshots:
+            return rendered_images
+
+        # In collage mode, frames are transformed while composing the collage and encoded only once
+        if self._settings.get_boolean(["image_collage"]):
+            try:
+                collage_frames = [(c, p.flipH, p.flipV, p.rotate90) for p, c in snapshots]
+                collage_settings = self.get_collage_settings()
+                self._logger.debug("Composing a collage of %s images: %s", len(collage_frames), collage_settings)
+                rendered_images.append(
+                    self.image_workers.run(ImageUtils.compose_collage, collage_frames, **collage_settings)
+                )
+            except Exception:
+                self._logger.exception("Caught an exception composing the collage")
+            return rendered_images
+
+        for webcam_profile, snapshot_content in snapshots:
+            try:
+                rendered_images.append(
+                    self.process_image(
+                        snapshot_content,
+                        webcam_profile.flipH,
+                        webcam_profile.flipV,
+                        webcam_profile.rotate90,
+                        webcam_profile.name,
+                    )
+                )
+            except Exception:
+                self._logger.exception("Caught an exception processing an image")
+
+        return rendered_images
+
+    def get_collage_settings(self) -> dict:
+        """
+        Get the output resolution and quality settings for collages.
+
+        Returns:
+            dict: A dict with max_dimension (px), quality (1-95) and max_bytes (0 = unlimited) keys.
+        """
+        return {
+            "max_dimension": self._settings.get_int(["image_collage_max_dimension"], min=0) or 0,
+            "quality": self._settings.get_int(["image_quality"], min=1, max=95) or 75,
+            "max_bytes": (self._settings.get_int(["image_collage_max_size"], min=0) or 0) * 1024,
+        }
+
+    def get_image_settings(self, webcam_name=None) -> dict:
+        """
+        Get the output resolution and quality settings for the images taken from a webcam.
+
+        Global settings can be overridden per webcam (by webcam name) in the webcam_image_settings setting,
+        e.g. webcam_image_settings: {"Nozzle": {"image_max_dimension": 1280, "image_quality": 60}}.
+
+        Returns:
+            dict: A dict with max_dimension (px), quality (1-95) and max_bytes (0 = unlimited) keys.
+        """
+        image_settings = {
+            "image_max_dimension": self._settings.get_int(["image_max_dimension"], min=0) or 0,
+            "image_quality": self._settings.get_int(["image_quality"], min=1, max=95) or 75,
+            "image_max_size": self._settings.get_int(["image_max_size"], min=0) or 0,
+        }
+
+        webcam_overrides = (self._settings.get(["webcam_image_settings"]) or {}).get(webcam_name or "") or {}
+        for key in image_settings:
+            try:
+                if webcam_overrides.get(key) is not None:
+                    image_settings[key] = int(webcam_overrides[key])
+            except (TypeError, ValueError):
+                self._logger.warning("Ignoring invalid %s override for webcam %s", key, webcam_name)
+
+        return {
+            "max_dimension": max(0, image_settings["image_max_dimension"]),
+            "quality": max(1, min(image_settings["image_quality"], 95)),
+            "max_bytes": max(0, image_settings["image_max_size"]) * 1024,
+        }
+
+    def process_image(self, image_content, flipH=False, flipV=False, rotate=False, webcam_name=None) -> bytes:
+        image_settings = self.get_image_settings(webcam_name)
+
+        self._logger.debug(
+            "Processing image: flipH=%s, flipV=%s, rotate=%s, settings=%s", flipH, flipV, rotate, image_settings
+        )
 
-    def take_image(self, snapshot_url, flipH=False, flipV=False, rotate=False, timeout=15) -> bytes:
+        return self.image_workers.run(
+            ImageUtils.process_snapshot, image_content, flipH, flipV, rotate, **image_settings
+        )
+
+    def fetch_snapshot(self, snapshot_url, timeout=15) -> bytes:
         snapshot_url = urljoin("http://localhost/", snapshot_url)
 
-        self._logger.debug("Taking image from url: %s", snapshot_url)
+        if not self.webcam_health.allow_request("snapshot", snapshot_url):
+            raise WebcamUnavailableError(f"snapshot url {snapshot_url} is not responding")
 
-        r = requests.get(snapshot_url, timeout=timeout, verify=False)
-        r.raise_for_status()
+        timeout = self.webcam_health.get_timeout("snapshot", snapshot_url, timeout)
+        self._logger.debug("Taking image from url: %s (timeout=%ss)", snapshot_url, timeout)
 
-        image_content = r.content
+        start = time.monotonic()
+        try:
+            r = requests.get(snapshot_url, timeout=timeout, verify=False)
+            r.raise_for_status()
+        except Exception:
+            self.webcam_health.record_failure("snapshot", snapshot_url)
+            raise
 
-        with io.BytesIO(image_content) as image_buffer:
-            with Image.open(image_buffer) as image:
-                image.load()
+        self.webcam_health.record_success("snapshot", snapshot_url, time.monotonic() - start)
 
-                if any([flipH, flipV, rotate]):
-                    self._logger.debug(
-                        "Applying image transformations: flipH=%s, flipV=%s, rotate=%s", flipH, flipV, rotate
-                    )
+        # Webcams usually stream at the resolution of their snapshots: it helps choosing how to encode gifs
+        if snapshot_url not in self.snapshot_resolutions:
+            resolution = ImageUtils.get_image_size(r.content)
+            if resolution:
+                self.snapshot_resolutions[snapshot_url] = resolution
 
-                    if flipH:
-                        image = image.transpose(Image.FLIP_LEFT_RIGHT)
-                    if flipV:
-                        image = image.transpose(Image.FLIP_TOP_BOTTOM)
-                    if rotate:
-                        image = image.transpose(Image.ROTATE_90)
+        return r.content
 
-                with io.BytesIO() as output:
-                    image.save(output, format="JPEG")
-                    return output.getvalue()
+    def is_webcam_responding(self, kind, url) -> bool:
+        """Probe a webcam url right away (see probe_webcam()), returning False on errors"""
+        try:
+            return self.probe_webcam(kind, url)
+        except Exception as e:
+            self._logger.debug("Webcam %s url %s is not responding: %s", kind, url, e)
+            return False
+
+    def probe_webcam(self, kind, url) -> bool:
+        """Check whether a dead webcam is responding again. Called by the webcam health tracker."""
+        if kind == "stream":
+            with requests.get(url, timeout=5, verify=False, stream=True) as r:
+                r.raise_for_status()
+                return bool(next(r.iter_content(chunk_size=1024), b""))
+
+        r = requests.get(url, timeout=5, verify=False)
+        r.raise_for_status()
+        return bool(r.content)
 
-    def take_all_gifs(self, duration=5) -> List[str]:
+    def take_all_gifs(
+        self, duration=5, webcam_profiles: Optional[List[WebcamProfile]] = None, urgent=True, gif_source=None
+    ) -> List[Tuple[WebcamProfile, Union[str, ClipBuffer]]]:
         taken_gif_paths = []
 
         self._logger.debug("Taking all gifs")
 
-        webcam_profiles = self.get_webcam_profiles()
+        if webcam_profiles is None:
+            webcam_profiles = self.get_webcam_profiles()
+
+        gif_engine = self.get_gif_engine()
+        self._logger.debug("Using gif engine: %s", gif_engine)
+
+        # The snapshots engine builds clips out of snapshots, the ffmpeg one records streams
+        source_profiles = []
         for webcam_profile in webcam_profiles:
-            try:
-                if not webcam_profile.stream:
-                    self._logger.debug("Skipped a webcam without stream url")
-                    continue
+            if webcam_profile.snapshot if gif_engine == "snapshots" else webcam_profile.stream:
+                source_profiles.append(webcam_profile)
+            else:
+                self._logger.debug(
+                    "Skipped a webcam without %s url", "snapshot" if gif_engine == "snapshots" else "stream"
+                )
+
+        if not source_profiles:
+            return taken_gif_paths
 
+        # Record all webcams at the same time, so that clips cover the same time window.
+        # The number of ffmpeg processes actually running is capped by gif_encoder_slots in take_gif().
+        concurrent_encoders = min(len(source_profiles), self.max_gif_encoders)
+
+        with ThreadPoolExecutor(max_workers=len(source_profiles), thread_name_prefix="TelegramGif") as executor:
+            futures = []
+            for webcam_profile in source_profiles:
                 profile_name = webcam_profile.name or "default"
-                gif_filename = secure_filename(f"gif_{profile_name}.mp4")
-
-                taken_gif_path = self.take_gif(
-                    webcam_profile.stream,
-                    duration,
-                    gif_filename,
-                    webcam_profile.flipH,
-                    webcam_profile.flipV,
-                    webcam_profile.rotate90,
-                )
-                taken_gif_paths.append(taken_gif_path)
-            except Exception:
-                self._logger.exception("Caught an exception taking a gif")
+
+                if gif_engine == "snapshots":
+                    future = executor.submit(
+                        self.take_snapshot_clip,
+                        webcam_profile,
+                        duration,
+                        secure_filename(f"gif_{profile_name}.{self.get_snapshot_clip_format()}"),
+                    )
+                else:
+                    future = executor.submit(
+                        self.take_gif,
+                        webcam_profile.stream,
+                        duration,
+                        secure_filename(f"gif_{profile_name}.mp4"),
+                        webcam_profile.flipH,
+                        webcam_profile.flipV,
+                        webcam_profile.rotate90,
+                        concurrent_encoders,
+                        urgent,
+                        gif_source,
+                        webcam_profile.snapshot,
+                    )
+                futures.append((webcam_profile, future))
+
+            for webcam_profile, future in futures:
+                try:
+                    taken_gif_paths.append((webcam_profile, future.result()))
+                except WebcamUnavailableError as e:
+                    self._logger.debug("Skipped webcam %s: %s", webcam_profile.name, e)
+                except Exception:
+                    self._logger.exception("Caught an exception taking a gif")
 
         return taken_gif_paths
 
+    def get_gif_engine(self) -> str:
+        """
+        Get the engine to use to take gifs: "ffmpeg" (records webcam streams) or "snapshots" (animated GIF built
+        from snapshots with Pillow).
+
+        In "auto" mode, the snapshots engine is used if ffmpeg is missing, or if the host is already under heavy load.
+        """
+        gif_engine = self._settings.get(["gif_engine"])
+        if gif_engine in ("ffmpeg", "snapshots"):
+            return gif_engine
+
+        if not self.encoder_probe.ffmpeg_path:
+            return "snapshots"
+
+        # Clips from the pre-event ring buffer are cheap to build
+        if self.gif_recorders:
+            return "ffmpeg"
+
+        pressure = self.resource_governor.get_pressure()
+        if pressure:
+            self._logger.debug("Host under pressure (%s), building gifs from snapshots", pressure)
+            return "snapshots"
+
+        return "ffmpeg"
+
+    def get_snapshot_clip_format(self) -> str:
+        """Get the format of the clips built from snapshots: CLIP_FORMAT_GIF or CLIP_FORMAT_AVI"""
+        clip_format = self._settings.get(["gif_snapshot_format"])
+        return clip_format if clip_format in (CLIP_FORMAT_GIF, CLIP_FORMAT_AVI) else CLIP_FORMAT_GIF
+
+    def take_snapshot_clip(
+        self, webcam_profile: WebcamProfile, duration=5, clip_filename="gif.gif"
+    ) -> Union[str, ClipBuffer]:
+        """
+        Build a clip sampling snapshots from a webcam over the given duration.
+
+        Frames are written to the clip as soon as they are taken (see SnapshotClipBuilder), in the format chosen
+        in the gif_snapshot_format setting.
+        """
+        duration = max(1, min(duration, 60))
+        fps = max(1, min(self._settings.get_int(["gif_snapshot_fps"], min=1) or 2, 10))
+        fps = min(fps, SnapshotClipBuilder.MAX_FRAMES / duration)
+        max_dimension = self._settings.get_int(["gif_snapshot_max_dimension"], min=16) or 480
+        clip_format = self.get_snapshot_clip_format()
+
+        self._logger.debug(
+            "Taking snapshot clip from %s: duration=%s, fps=%s, max_dimension=%s, format=%s",
+            webcam_profile.snapshot,
+            duration,
+            fps,
+            max_dimension,
+            clip_format,
+        )
+
+        gif_memory_limit = self.get_gif_memory_limit()
+        if gif_memory_limit:
+            clip = ClipBuffer(clip_filename, gif_memory_limit)
+        else:
+            clip = self.media_workspace.allocate(clip_filename)
+
+        try:
+            with ExitStack() as stack:
+                clip_file = clip.file if isinstance(clip, ClipBuffer) else stack.enter_context(open(clip, "wb"))
+                clip_builder = SnapshotClipBuilder(clip_file, fps, max_dimension, clip_format, self.image_workers.run)
+                self.record_snapshot_clip(webcam_profile, duration, fps, clip_builder)
+                clip_builder.close()
+        except Exception:
+            if isinstance(clip, ClipBuffer):
+                clip.close()
+            else:
+                self.media_workspace.discard(clip)
+            raise
+
+        self._logger.debug("Snapshot clip created with %s frames", clip_builder.frame_count)
+        return clip
+
+    def record_snapshot_clip(self, webcam_profile: WebcamProfile, duration, fps, clip_builder: SnapshotClipBuilder):
+        """Take snapshots at the given pace for duration seconds, adding each one to clip_builder as it arrives"""
+        start = time.monotonic()
+        for frame_index in range(max(1, int(duration * fps))):
+            # Keep the pace: frames that take too long to arrive are skipped
+            frame_time = start + frame_index / fps
+            now = time.monotonic()
+            if now < frame_time:
+                time.sleep(frame_time - now)
+            elif now - frame_time > 1 / fps:
+                continue
+
+            try:
+                snapshot_content = self.fetch_snapshot(webcam_profile.snapshot, webcam_profile.snapshotTimeout)
+            except WebcamUnavailableError:
+                raise
+            except Exception:
+                if not clip_builder.frame_count:
+                    raise
+                self._logger.debug("Skipped a frame of the snapshot clip", exc_info=True)
+                continue
+
+            clip_builder.add_frame(
+                snapshot_content, webcam_profile.flipH, webcam_profile.flipV, webcam_profile.rotate90
+            )
+
+    def handle_print_recap_event(self, event):
+        """Start, feed and stop the print recap according to the printer events"""
+        if event == "PrintStarted":
+            if self._settings.get_boolean(["print_recap"]):
+                try:
+                    self.print_recap.start(
+                        self._settings.get_int(["print_recap_interval"], min=1) or 30,
+                        self.media_workspace.allocate("print_recap.gif"),
+                    )
+                except Exception:
+                    self._logger.exception("Caught an exception starting the print recap")
+            else:
+                self.print_recap.stop()
+        elif event == "ZChange":
+            if self.print_recap.claim_frame():
+                threading.Thread(target=self.take_print_recap_frame, name="TelegramPrintRecap", daemon=True).start()
+        elif event in ("PrintFailed", "PrintCancelled"):
+            self.print_recap.stop()
+
+    def take_print_recap_frame(self):
+        """
+        Add a frame of the first webcam to the print recap.
+
+        Unless print_recap_image_actions is set, the pre / post image actions are not run for recap frames, so that
+        e.g. an enclosure light is not toggled at every frame.
+        """
+        try:
+            webcam_profile = next((p for p in self.get_webcam_profiles() if p.snapshot), None)
+            if webcam_profile is None:
+                return
+
+            with ExitStack() as stack:
+                if self._settings.get_boolean(["print_recap_image_actions"]):
+                    stack.enter_context(self.capture_sessions.session())
+                snapshot_content = self.fetch_snapshot(webcam_profile.snapshot, webcam_profile.snapshotTimeout)
+
+            self.print_recap.add_frame(
+                snapshot_content, webcam_profile.flipH, webcam_profile.flipV, webcam_profile.rotate90
+            )
+        except WebcamUnavailableError as e:
+            self._logger.debug("Skipped a print recap frame: %s", e)
+        except Exception:
+            self._logger.exception("Caught an exception taking a print recap frame")
+
+    def finish_print_recap(self) -> Optional[str]:
+        """
+        Finish the print recap. Its frames were written while printing: this only completes the file.
+
+        Returns:
+            Optional[str]: The path of the recap clip, in the media workspace, or None if there is no recap
+        """
+        try:
+            return self.print_recap.finish()
+        except Exception:
+            self._logger.exception("Caught an exception finishing the print recap")
+            self.print_recap.stop()
+            return None
+
     def take_gif(
         self,
         stream_url,
@@ -2203,98 +3053,133 @@ class TelegramPlugin(
         flipH=False,
         flipV=False,
         rotate=False,
-    ) -> str:
+        concurrent_encoders=1,
+        urgent=True,
+        gif_source=None,
+        snapshot_url=None,
+        source_path=None,
+    ) -> Union[str, ClipBuffer, DeferredClip]:
+        """
+        Record a gif (actually a mp4 video) from a webcam stream.
+
+        The clip is encoded to fit the size budget, frame rate and resolution caps set for gif_source
+        (see get_gif_encoding_settings()), with the encoder and the preset that the encoder probe found best for
+        the resolution of the stream (see get_stream_resolution()).
+
+        If the clip is not urgent and the host is under pressure, the footage is only copied as is (the capture
+        window never moves) and a DeferredClip is returned, to be encoded later by a thread nobody waits for.
+
+        Args:
+            source_path (str): Footage already captured for this clip, to be encoded instead of the stream
+
+        Returns:
+            Union[str, ClipBuffer, DeferredClip]: The gif, kept in memory if gif_memory_limit is set, or else its
+                path. A DeferredClip if its encoding has been deferred.
+        """
         stream_url = urljoin("http://localhost/", stream_url)
 
         self._logger.debug("Taking gif from url: %s", stream_url)
 
-        gif_path = os.path.join(self.get_tmpgif_dir(), gif_filename)
-
-        self._logger.debug("Removing file %s", gif_path)
-        try:
-            os.remove(gif_path)
-        except FileNotFoundError:
-            pass
+        gif_memory_limit = self.get_gif_memory_limit()
 
-        settings_ffmpeg = self._settings.global_get(["webcam", "ffmpeg"])
-        ffmpeg_path = (
-            settings_ffmpeg
-            if isinstance(settings_ffmpeg, str)
-            and os.path.isfile(settings_ffmpeg)
-            and os.access(settings_ffmpeg, os.X_OK)
-            else shutil.which("ffmpeg")
-        )
+        ffmpeg_path = self.encoder_probe.ffmpeg_path
         if not ffmpeg_path:
             self._logger.error("ffmpeg not installed")
             raise RuntimeError("ffmpeg not installed")
 
-        cpulimiter_path = shutil.which("cpulimit") or shutil.which("limitcpu")
-        cpulimiter_disabled = self._settings.get(["no_cpulimit"]) or False
-        if cpulimiter_disabled:
-            self._logger.debug("CPU limiter disabled via settings")
-        elif cpulimiter_path:
-            self._logger.debug("Using CPU limiter: %s", cpulimiter_path)
-        else:
-            self._logger.error("Neither cpulimit nor limitcpu is installed")
-            raise RuntimeError("No CPU limiter (cpulimit or limitcpu) available")
-
         duration = max(1, min(duration, 60))
         self._logger.debug("duration=%s", duration)
 
         time_sec = str(timedelta(seconds=duration))
         self._logger.debug("timeSec=%s", time_sec)
 
-        used_cpu, limit_cpu = 1, 65
-        try:
-            nb_cpu = multiprocessing.cpu_count()
-            if nb_cpu > 1:
-                used_cpu = nb_cpu // 2
-                limit_cpu = 65 * used_cpu
-            self._logger.debug("limit_cpu=%s | used_cpu=%s | because nb_cpu=%s", limit_cpu, used_cpu, nb_cpu)
-        except Exception:
-            self._logger.exception("Caught an exception getting number of cpu. Using defaults...")
+        clip_parameters = plan_clip_encoding(duration, **self.get_gif_encoding_settings(gif_source))
+        self._logger.debug("clip_parameters=%s", clip_parameters.to_dict())
+
+        # Priorities and threads depend on the printer state and on the host load
+        policy = self.resource_governor.get_policy()
+
+        # The threads budget is shared by all the encoders running at the same time
+        concurrent_encoders = max(1, concurrent_encoders)
+        used_cpu = max(1, policy.threads // concurrent_encoders)
+        self._logger.debug(
+            "used_cpu=%s | because policy=%s and concurrent_encoders=%s",
+            used_cpu,
+            policy.to_dict(),
+            concurrent_encoders,
+        )
+
+        # Encoding cost depends on the output resolution: the stream one, capped by max_dimension
+        output_resolution = self.get_stream_resolution(stream_url, snapshot_url)
+        if output_resolution:
+            output_resolution = ImageUtils.get_target_size(output_resolution, clip_parameters.max_dimension)
+        elif clip_parameters.max_dimension:
+            output_resolution = (clip_parameters.max_dimension, clip_parameters.max_dimension * 9 // 16)
+        self._logger.debug("output_resolution=%s", output_resolution)
+
+        video_encoder = self.encoder_probe.get_video_encoder()
 
         valid_presets = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow", "slower", "veryslow"]
         preset_setting = self._settings.get(["ffmpeg_preset"])
-        preset = preset_setting if preset_setting in valid_presets else "medium"
+        if video_encoder != "libx264":
+            preset = None  # Hardware encoders don't take x264 presets
+        elif preset_setting in valid_presets:
+            preset = preset_setting
+        else:
+            # Auto: best quality preset that the benchmark found to encode faster than real time
+            preset = self.encoder_probe.get_recommended_preset(*(output_resolution or ())) or "veryfast"
+        if policy.throttled and preset:
+            preset = "ultrafast"
+        self._logger.debug("video_encoder=%s | preset=%s", video_encoder, preset)
 
         cmd = []
-        if shutil.which("nice"):
-            cmd = ["nice", "-n", "20"]
-
-        if not cpulimiter_disabled:
-            cmd += [
-                cpulimiter_path,
-                "-l",
-                str(limit_cpu),
-                "-f",
-                "-z",
-                "--",
-            ]
-
         cmd += [
             ffmpeg_path,
             # Overwrite output file
             "-y",
             # Limit threads
             "-threads", str(used_cpu),
-            # Video source
-            "-i", str(stream_url),
-            # Duration
-            "-t", str(time_sec),
-            # Video encoding
-            "-color_range", "tv",
-            "-c:v", "libx264",
-            "-preset", preset,
-            "-profile:v", "baseline",
-            # Audio encoding
-            "-c:a", "aac",
-            "-ac", "2",
-            # Enable fast start for streaming
-            "-movflags", "+faststart",
         ]  # fmt: skip
 
-        filters = ["format=yuv420p"]
+        # Use the pre-event ring buffer, if it holds enough footage
+        recorder = None if source_path else self.gif_recorders.get(stream_url)
+        buffered_segments, buffered_seconds = recorder.get_recent_segments(duration) if recorder else ([], 0.0)
+
+        if source_path:
+            cmd += [
+                # Video source: footage captured earlier
+                "-i", source_path,
+            ]  # fmt: skip
+        elif buffered_segments:
+            self._logger.debug("Using %s buffered segments for %s", len(buffered_segments), stream_url)
+
+            concat_list_path = self.media_workspace.allocate(f"{gif_filename}.txt")
+            with open(concat_list_path, "w") as f:
+                f.writelines(f"file '{segment_path}'\n" for segment_path in buffered_segments)
+
+            # Whole segments are buffered: skip the footage older than the requested duration
+            if buffered_seconds > duration:
+                cmd += ["-ss", f"{buffered_seconds - duration:.3f}"]
+
+            cmd += [
+                # Video source: concatenation of the buffered segments
+                "-f", "concat",
+                "-safe", "0",
+                "-i", concat_list_path,
+                # Duration
+                "-t", str(time_sec),
+            ]  # fmt: skip
+        else:
+            cmd += [
+                # Give up if the stream stops sending data
+                "-rw_timeout", str(self.GIF_STREAM_TIMEOUT * 1000000),
+                # Video source
+                "-i", str(stream_url),
+                # Duration
+                "-t", str(time_sec),
+            ]  # fmt: skip
+
+        filters = []
 
         if flipV:
             filters.append("vflip")
@@ -2303,36 +3188,358 @@ class TelegramPlugin(
         if rotate:
             filters.append("transpose=2")
 
-        filter_str = ",".join(filters)
-        cmd += ["-vf", filter_str]
+        # Buffered H.264 footage can be remuxed as is, without encoding, if it doesn't need capping. Stream copy
+        # starts at the keyframe before the seek point, so the whole segments are counted against the budget.
+        copy_video = (
+            buffered_segments
+            and recorder.codec == "h264"
+            and not filters
+            and not clip_parameters.fps
+            and not clip_parameters.max_dimension
+            and (
+                not clip_parameters.max_bytes
+                or sum(os.path.getsize(segment_path) for segment_path in buffered_segments) <= clip_parameters.max_bytes
+            )
+        )
+
+        # Under pressure, non-urgent footage is only captured now, and encoded later
+        defer_encoding = policy.throttled and not urgent and not copy_video and not source_path
+        raw_path = self.media_workspace.allocate(f"{gif_filename}.mkv") if defer_encoding else None
+
+        if defer_encoding:
+            cmd += ["-c:v", "copy"]
+        elif copy_video:
+            cmd += ["-c:v", "copy"]
+        elif video_encoder == "libx264":
+            cmd += [
+                # Video encoding
+                "-color_range", "tv",
+                "-c:v", "libx264",
+                "-preset", preset,
+                "-profile:v", "baseline",
+                *clip_parameters.get_rate_control_args(),
+                "-vf", ",".join(filters + clip_parameters.get_filters() + ["format=yuv420p"]),
+            ]  # fmt: skip
+        else:
+            cmd += [
+                # Video encoding, in hardware: no CRF, the bitrate cap is the target
+                "-color_range", "tv",
+                "-c:v", video_encoder,
+                *clip_parameters.get_rate_control_args(constant_quality=False),
+                "-vf", ",".join(filters + clip_parameters.get_filters() + ["format=yuv420p"]),
+            ]  # fmt: skip
+
+        cmd += [
+            # Audio encoding
+            "-c:a", "aac",
+            "-ac", "2",
+        ]  # fmt: skip
+
+        # Each gif gets its own file, so that overlapping requests don't overwrite each other
+        gif_path = None if gif_memory_limit or defer_encoding else self.media_workspace.allocate(gif_filename)
+
+        if defer_encoding:
+            cmd += [
+                # Matroska takes any codec, e.g. the MJPEG of most webcam streams
+                "-f", "matroska",
+                raw_path,
+            ]  # fmt: skip
+        elif gif_memory_limit:
+            cmd += [
+                # Fragmented mp4 can be written to a pipe, since it doesn't need seeking back
+                "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+                "-f", "mp4",
+                "pipe:1",
+            ]  # fmt: skip
+        else:
+            cmd += [
+                # Enable fast start for streaming
+                "-movflags", "+faststart",
+                gif_path,
+            ]  # fmt: skip
+
+        cmd = self.resource_governor.wrap_command(cmd, policy)
+
+        # Kill ffmpeg if it hangs, leaving generous room for encoding on slow hosts
+        timeout = self.GIF_STREAM_TIMEOUT + duration * 6
 
-        cmd.append(gif_path)
+        # The live stream is opened only from here on: once let through by the webcam breaker (possibly as its
+        # single half-open trial), the outcome must always be recorded
+        live_stream = not buffered_segments and not source_path
+        if live_stream and not self.webcam_health.allow_request("stream", stream_url):
+            for path in (gif_path, raw_path):
+                if path:
+                    self.media_workspace.discard(path)
+            raise WebcamUnavailableError(f"stream url {stream_url} is not responding")
 
         self._logger.debug("Creating video by running command: %s", cmd)
-        subprocess.run(cmd, check=True)
-        self._logger.debug("Video created")
+        gif_buffer = None
+        encode_start = time.monotonic()
+        stream_ok = False
+        try:
+            if defer_encoding:
+                # Copying is cheap, and waiting for an encoder slot would move the capture window
+                subprocess.run(cmd, check=True, timeout=timeout)
+            else:
+                with self.gif_encoder_slots:
+                    if gif_memory_limit:
+                        gif_buffer = ClipBuffer(gif_filename, gif_memory_limit)
+                        run_to_buffer(cmd, gif_buffer, timeout)
+                    else:
+                        subprocess.run(cmd, check=True, timeout=timeout)
+            stream_ok = True
+        except Exception:
+            if gif_buffer:
+                gif_buffer.close()
+            for path in (gif_path, raw_path):
+                if path:
+                    self.media_workspace.discard(path)
+            raise
+        finally:
+            if live_stream:
+                # ffmpeg also fails on encoder errors, or when a throttled encode times out: blame the stream only
+                # if it doesn't respond to a probe either
+                if stream_ok or self.is_webcam_responding("stream", stream_url):
+                    self.webcam_health.record_success("stream", stream_url)
+                else:
+                    self.webcam_health.record_failure("stream", stream_url)
+            elif buffered_segments:
+                self.media_workspace.discard(concat_list_path)
+
+        if defer_encoding:
+            self._logger.info("Host under pressure (%s), deferring the encoding of %s", policy.reason, gif_filename)
+            return DeferredClip(
+                gif_filename,
+                encode=lambda: self.encode_deferred_gif(
+                    raw_path, stream_url, duration, gif_filename, flipH, flipV, rotate, gif_source, snapshot_url
+                ),
+                discard=lambda: self.media_workspace.discard(raw_path),
+            )
+
+        gif_size = gif_buffer.size if gif_buffer else (os.path.getsize(gif_path) if os.path.isfile(gif_path) else 0)
+        encode_stats = {
+            "source": gif_source,
+            "stream_url": stream_url,
+            "copied": bool(copy_video),
+            "encoder": video_encoder,
+            "preset": preset,
+            **clip_parameters.to_dict(),
+            "size": gif_size,
+            "encode_seconds": round(time.monotonic() - encode_start, 1),
+        }
+        self.gif_encode_stats.append(encode_stats)
+        self._logger.debug("Video created: %s", encode_stats)
+        if clip_parameters.max_bytes and gif_size > clip_parameters.max_bytes:
+            self._logger.info("Gif exceeded its size budget: %s", encode_stats)
+
+        if gif_buffer:
+            self._logger.debug("Gif kept in memory: %s", gif_buffer)
+            return gif_buffer
 
         if not os.path.isfile(gif_path):
+            self.media_workspace.discard(gif_path)
             raise FileNotFoundError("Expected gif file was not created: %s", gif_path)
 
         return gif_path
 
-    def get_layer_progress_values(self):
-        layer_progress_values = None
+    def encode_deferred_gif(
+        self, raw_path, stream_url, duration, gif_filename, flipH, flipV, rotate, gif_source, snapshot_url
+    ) -> Union[str, ClipBuffer]:
+        """Encode the footage of a DeferredClip, once the host has spare capacity (see take_gif())"""
+        self.resource_governor.wait_for_capacity()
+        return self.take_gif(
+            stream_url,
+            duration,
+            gif_filename,
+            flipH,
+            flipV,
+            rotate,
+            gif_source=gif_source,
+            snapshot_url=snapshot_url,
+            source_path=raw_path,
+        )
+
+    def get_stream_resolution(self, stream_url, snapshot_url=None) -> Optional[Tuple[int, int]]:
+        """
+        Get the (width, height) of a webcam stream: the one reported by its ring buffer recorder, if running,
+        otherwise the one of the last snapshot taken from the same webcam. None if unknown.
+        """
+        recorder = self.gif_recorders.get(stream_url)
+        if recorder and recorder.resolution:
+            return recorder.resolution
+        if snapshot_url:
+            return self.snapshot_resolutions.get(urljoin("http://localhost/", snapshot_url))
+        return None
+
+    def get_gif_memory_limit(self) -> int:
+        """Get the size in bytes up to which gifs are kept in memory (0: gifs are always written to disk)"""
+        return (self._settings.get_int(["gif_memory_limit"], min=0) or 0) * 1024 * 1024
+
+    def get_gif_encoding_settings(self, gif_source=None) -> dict:
+        """
+        Get the size budget and the frame rate / resolution caps of gifs taken for a command or an event.
+
+        Global settings can be overridden per command or event in the gif_encoding_overrides setting,
+        e.g. gif_encoding_overrides: {"/supergif": {"gif_max_size": 8192}, "PrintFailed": {"gif_max_fps": 10}}.
+
+        Returns:
+            dict: A dict with max_bytes, max_fps and max_dimension keys (0 = unlimited).
+        """
+        gif_settings = {
+            "gif_max_size": self._settings.get_int(["gif_max_size"], min=0) or 0,
+            "gif_max_fps": self._settings.get_int(["gif_max_fps"], min=0) or 0,
+            "gif_max_dimension": self._settings.get_int(["gif_max_dimension"], min=0) or 0,
+        }
+
+        source_overrides = (self._settings.get(["gif_encoding_overrides"]) or {}).get(gif_source or "") or {}
+        for key in gif_settings:
+            try:
+                if source_overrides.get(key) is not None:
+                    gif_settings[key] = int(source_overrides[key])
+            except (TypeError, ValueError):
+                self._logger.warning("Ignoring invalid %s override for %s", key, gif_source)
+
+        return {
+            "max_bytes": max(0, gif_settings["gif_max_size"]) * 1024,
+            "max_fps": max(0, gif_settings["gif_max_fps"]),
+            "max_dimension": max(0, gif_settings["gif_max_dimension"]),
+        }
+
+    def get_printer_activity(self) -> str:
+        """Get the printer state as seen by the resource governor: printing, paused or idle"""
+        if self._printer.is_paused() or self._printer.is_pausing():
+            return PRINTER_PAUSED
+        if self._printer.is_printing():
+            return PRINTER_PRINTING
+        return PRINTER_IDLE
+
+    def get_ffmpeg_path(self) -> Optional[str]:
+        settings_ffmpeg = self._settings.global_get(["webcam", "ffmpeg"])
+        return (
+            settings_ffmpeg
+            if isinstance(settings_ffmpeg, str)
+            and os.path.isfile(settings_ffmpeg)
+            and os.access(settings_ffmpeg, os.X_OK)
+            else shutil.which("ffmpeg")
+        )
+
+    def start_gif_recorders(self):
+        """(Re)start the pre-event ring buffer recorders of all webcams, if enabled in settings"""
+        self.stop_gif_recorders()
+
+        if not self._settings.get_boolean(["send_gif"]) or not self._settings.get_boolean(["gif_ring_buffer"]):
+            return
+
+        ffmpeg_path = self.encoder_probe.ffmpeg_path
+        if not ffmpeg_path:
+            self._logger.error("Can't start the gif ring buffer: ffmpeg not installed")
+            return
+
+        buffer_seconds = max(1, min(self._settings.get_int(["gif_ring_buffer_seconds"], min=1) or 30, 60))
+
+        for webcam_profile in self.get_webcam_profiles():
+            if not webcam_profile.stream:
+                continue
+
+            stream_url = urljoin("http://localhost/", webcam_profile.stream)
+            if stream_url in self.gif_recorders:
+                continue
+
+            directory = os.path.join(self.get_gif_buffer_dir(), secure_filename(webcam_profile.name or "default"))
+            recorder = SegmentRecorder(
+                self._logger, ffmpeg_path, stream_url, directory, buffer_seconds, self.wrap_recorder_command
+            )
+            recorder.start()
+            self.gif_recorders[stream_url] = recorder
+
+        self._logger.info("Started gif ring buffer for %s webcams (%ss)", len(self.gif_recorders), buffer_seconds)
+
+    def wrap_recorder_command(self, cmd: List[str]) -> List[str]:
+        # Recorders run for hours whatever the printer state, the encoder probe runs heavy encodes in the
+        # background: always at the lowest CPU and IO priority
+        return self.resource_governor.wrap_command(
+            cmd, EncodePolicy(PRINTER_PRINTING, nice=19, ionice_class=3, threads=1)
+        )
+
+    def stop_gif_recorders(self):
+        recorders, self.gif_recorders = self.gif_recorders, {}
+        for recorder in recorders.values():
+            recorder.stop()
+
+    def handle_plugin_data_event(self, event, payload):
+        """
+        Refresh third-party plugin data continuously only while printing, and on the events of the plugins.
+
+        While printing, only the data used by the notifications enabled in some chat is refreshed continuously.
+        """
+        if event in ("PrintStarted", "PrintResumed"):
+            used_variables = self.tmsg.get_used_variables()
+            self.plugin_data.set_wanted(
+                EXTERNAL_VARIABLE_SOURCES[name] for name in used_variables if name in EXTERNAL_VARIABLE_SOURCES
+            )
+            self.plugin_data.set_active(True)
+        elif event in ("PrintDone", "PrintFailed", "PrintCancelled", "PrintPaused", "Disconnected"):
+            self.plugin_data.set_active(False)
+        elif event in ("PrusaMMU_Error", "PrusaMMU_Status"):
+            # The event payload is the new MMU state: no need to wait for the plugin API to report it
+            self.plugin_data["prusammu"].update(payload or {})
+
+    # Fetchers of the third-party plugin data providers, run in the background. They return None if the plugin
+    # is not enabled, and raise on errors.
+
+    def fetch_layer_progress_values(self) -> Optional[dict]:
+        displaylayerprogress_plugin_id = "DisplayLayerProgress"
+        if not self._plugin_manager.get_plugin(displaylayerprogress_plugin_id, True):
+            return None
+        return self.send_octoprint_request(f"/plugin/{displaylayerprogress_plugin_id}/values", timeout=5).json()
+
+    def fetch_resource_monitor_stats(self) -> Optional[dict]:
+        if not self._plugin_manager.get_plugin("resource_monitor", True):
+            return None
+        return self.send_octoprint_request("/plugin/resource_monitor/stats").json()
+
+    def fetch_prusammu_state(self) -> Optional[dict]:
+        if not self._plugin_manager.get_plugin("prusammu", True):
+            return None
+        return self.send_octoprint_simpleapi_command("prusammu", "getmmu").json()
+
+    def get_thumbnail(self, thumbnail_url: str) -> bytes:
+        """
+        Get a print thumbnail, given its url from the file metadata.
+
+        Thumbnails are read from storage through the thumbnail cache when their file can be located, otherwise
+        they are downloaded from OctoPrint.
+        """
+        thumbnail_path = self.resolve_thumbnail_path(thumbnail_url)
+        if thumbnail_path:
+            return self.thumbnails.get(thumbnail_path)
+
+        self._logger.debug("Thumbnail %s not found in storage, downloading it", thumbnail_url)
+        return self.send_octoprint_request(f"/{thumbnail_url}").content
+
+    def resolve_thumbnail_path(self, thumbnail_url: str) -> Optional[str]:
+        """
+        Locate the file of a thumbnail served by a plugin.
 
+        Thumbnail plugins (e.g. PrusaSlicer Thumbnails, Cura Thumbnails) serve their thumbnails at urls like
+        "plugin/<plugin_id>/thumbnail/<path>?<timestamp>", from the files at <path> in their data folder.
+
+        Returns:
+            Optional[str]: The absolute path of the thumbnail file, or None if it can't be located
+        """
         try:
-            displaylayerprogress_plugin_id = "DisplayLayerProgress"
-            if self._plugin_manager.get_plugin(displaylayerprogress_plugin_id, True):
-                values_request = self.send_octoprint_request(
-                    f"/plugin/{displaylayerprogress_plugin_id}/values", timeout=5
-                )
-                layer_progress_values = values_request.json()
-            else:
-                self._logger.debug("DisplayLayerProgress plugin not installed or disabled")
+            parts = unquote(urlsplit(thumbnail_url).path).lstrip("/").split("/", 3)
+            if len(parts) != 4 or parts[0] != "plugin" or parts[2] != "thumbnail":
+                return None
+
+            plugin_data_folder = os.path.realpath(os.path.join(self._settings.global_get_basefolder("data"), parts[1]))
+            thumbnail_path = os.path.realpath(os.path.join(plugin_data_folder, parts[3]))
+            if not thumbnail_path.startswith(plugin_data_folder + os.sep) or not os.path.isfile(thumbnail_path):
+                return None
+            return thumbnail_path
         except Exception:
-            self._logger.exception("Caught an exception in get_layer_progress_values")
-
-        return layer_progress_values
+            self._logger.exception("Caught an exception resolving thumbnail %s", thumbnail_url)
+            return None
 
     def calculate_ETA(self, printTime):
         current_time = datetime.now()
@@ -2391,28 +3598,72 @@ class TelegramPlugin(
             ),
         ]
 
+    # The gcode hooks run on the printer communication threads, for every line: they must return as soon as possible.
+    # Anything more than a prefix check is left to the notification queue.
+
     def hook_gcode_sent(self, comm_instance, phase, cmd, cmd_type, gcode, *args, **kwargs):
+        start = time.perf_counter()
         try:
-            if gcode and gcode == "M600":
-                self.on_event("gCode_M600", {})
+            if gcode == "M600":
+                self.enqueue_hook_event("gCode_M600", {})
         except Exception:
             self._logger.exception("Caught an exception on hook_gcode_sent")
+        finally:
+            self.record_hook_time("gcode_sent", start)
 
     def hook_gcode_received(self, comm_instance, line, *args, **kwargs):
+        start = time.perf_counter()
         try:
-            if line.startswith("echo:busy: paused for user") or line.startswith("// action:paused"):
-                if not self.user_pause_already_notified:
-                    self.on_event("PausedForUser", {})
+            if line.startswith(self.GCODE_RECEIVED_PREFIXES):
+                if line.startswith("ok"):
+                    self.user_pause_already_notified = False
+                elif line.startswith("echo:UserNotif"):
+                    self.enqueue_hook_event("UserNotif", {"UserNotif": line[15:]})
+                elif not self.user_pause_already_notified:
+                    self.enqueue_hook_event("PausedForUser", {})
                     self.user_pause_already_notified = True
-            elif line.startswith("echo:UserNotif"):
-                self.on_event("UserNotif", {"UserNotif": line[15:]})
-            elif line.startswith("ok"):
-                self.user_pause_already_notified = False
+            elif self.serial_triggers is not None:
+                trigger_payload = self.serial_triggers.match(line)
+                if trigger_payload:
+                    self.enqueue_hook_event("SerialTrigger", trigger_payload)
         except Exception:
             self._logger.exception("Caught an exception on hook_gcode_received")
+        finally:
+            self.record_hook_time("gcode_received", start)
 
         return line
 
+    def load_serial_triggers(self):
+        """Compile the serial triggers configured in settings"""
+        serial_triggers = SerialTriggerMatcher(self._logger, self._settings.get(["serial_triggers"]) or [])
+        self.serial_triggers = serial_triggers if serial_triggers.triggers else None
+        self._logger.debug("Loaded %s serial triggers", len(serial_triggers.triggers))
+
+    def enqueue_hook_event(self, event, payload):
+        """Hand an event over to the notification queue, without blocking (the event is dropped if the queue is full)"""
+        if self.tmsg and self.bot_ready:
+            self.notification_queue.put(event, payload, {})
+
+    def record_hook_time(self, hook_name, start):
+        hook_stats = self.hook_stats[hook_name]
+        elapsed = time.perf_counter() - start
+        hook_stats["calls"] += 1
+        hook_stats["total_seconds"] += elapsed
+        if elapsed > hook_stats["max_seconds"]:
+            hook_stats["max_seconds"] = elapsed
+
+    def get_hook_stats(self) -> dict:
+        return {
+            hook_name: {
+                "calls": hook_stats["calls"],
+                "avg_us": round(hook_stats["total_seconds"] / hook_stats["calls"] * 1000000, 1)
+                if hook_stats["calls"]
+                else 0.0,
+                "max_us": round(hook_stats["max_seconds"] * 1000000, 1),
+            }
+            for hook_name, hook_stats in self.hook_stats.items()
+        }
+
     def send_octoprint_simpleapi_command(self, plugin_id: str, command: str, parameters: dict = None, timeout: int = 5):
         """
         Sends a SimpleAPI command to an OctoPrint plugin via the HTTP API.
@@ -890,7 +890,7 @@ class CmdFiles(BaseCommand):
                             # Copy the file
                             self.main._file_manager.copy_file(from_storage_name, from_path, final_to_path)
                         elif operation == "move":
-                            current_job_file = (self.main._printer.get_current_data() or {}).get("job", {}).get(
+                            current_job_file = (self.main.printer_state.get_data() or {}).get("job", {}).get(
                                 "file"
                             ) or {}
                             current_origin = current_job_file.get("origin")
@@ -1150,7 +1150,7 @@ class CmdFiles(BaseCommand):
             )
             return
 
-        current_data = self.main._printer.get_current_data() or {}
+        current_data = self.main.printer_state.get_data() or {}
         job_info = (current_data.get("job") or {}).get("file") or {}
         job_file_name = job_info.get("name") or file
 
@@ -17,5 +17,6 @@ class CmdGif(BaseCommand):
             msg,
             chatID=context.chat_id,
             with_gif=with_gif,
+            gif_source="/gif",
             msg_id=context.msg_id_to_update,
         )
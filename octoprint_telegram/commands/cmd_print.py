@@ -19,7 +19,7 @@ class CmdPrint(BaseCommand):
             )
             return
 
-        current_data = self.main._printer.get_current_data()
+        current_data = self.main.printer_state.get_data()
         job_file_name = current_data.get("job", {}).get("file", {}).get("name", "")
 
         if context.parameter == "y":  # Print the file selected for printing
@@ -19,6 +19,7 @@ class CmdSuperGif(BaseCommand):
             msg,
             chatID=context.chat_id,
             with_gif=with_gif,
+            gif_source="/supergif",
             gif_duration=self.SUPERGIF_DURATION,
             msg_id=context.msg_id_to_update,
         )
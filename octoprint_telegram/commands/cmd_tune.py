@@ -267,7 +267,7 @@ class CmdTune(BaseCommand):
     def _handle_temp_control(self, context, tool_key, tool_display_name, emoji_name, tool_identifier):
         """Handle temperature controls"""
         params = context.parameter.split("_")
-        temps = self.main._printer.get_current_temperatures()
+        temps = self.main.printer_state.get_temperatures()
 
         if len(params) <= len(tool_identifier.split("_")):
             self.temp_target_temps[tool_key] = temps[tool_key]["target"]
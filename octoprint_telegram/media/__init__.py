@@ -0,0 +1,41 @@
+from .capture_session import CaptureSessionManager
+from .clip_buffer import ClipBuffer, get_tmpfs_dir, run_to_buffer
+from .clip_encoding import ClipParameters, plan_clip_encoding
+from .deferred_clip import DeferredClip
+from .encoder_probe import EncoderProbe
+from .image_worker import ImageWorkerPool
+from .print_recap import PrintRecap
+from .resource_governor import PRINTER_IDLE, PRINTER_PAUSED, PRINTER_PRINTING, EncodePolicy, ResourceGovernor
+from .segment_recorder import SegmentRecorder
+from .snapshot_clip import CLIP_FORMAT_AVI, CLIP_FORMAT_GIF, SnapshotClipBuilder
+from .thumbnail_cache import ThumbnailCache
+from .webcam_health import WebcamHealth, WebcamHealthTracker, WebcamUnavailableError
+from .workspace import MediaWorkspace, WorkspaceFullError
+
+__all__ = [
+    "CLIP_FORMAT_AVI",
+    "CLIP_FORMAT_GIF",
+    "PRINTER_IDLE",
+    "PRINTER_PAUSED",
+    "PRINTER_PRINTING",
+    "CaptureSessionManager",
+    "ClipBuffer",
+    "ClipParameters",
+    "DeferredClip",
+    "EncodePolicy",
+    "EncoderProbe",
+    "ImageWorkerPool",
+    "MediaWorkspace",
+    "PrintRecap",
+    "ResourceGovernor",
+    "SegmentRecorder",
+    "SnapshotClipBuilder",
+    "ThumbnailCache",
+    "WebcamHealth",
+    "WebcamHealthTracker",
+    "WebcamUnavailableError",
+    "WorkspaceFullError",
+    "get_tmpfs_dir",
+    "plan_clip_encoding",
+    "run_to_buffer",
+]
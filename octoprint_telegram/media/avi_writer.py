@@ -0,0 +1,136 @@
+import struct
+from typing import IO, List, Optional, Tuple
+
+# Start Of Frame markers of the JPEG formats (DHT, JPG and DAC share the range)
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def get_jpeg_size(jpeg_content: bytes) -> Tuple[int, int]:
+    """Return the size (width, height) of a JPEG image, reading its headers only"""
+    if jpeg_content[:2] != b"\xff\xd8":
+        raise ValueError("Not a JPEG")
+
+    pos = 2
+    while pos + 9 <= len(jpeg_content):
+        if jpeg_content[pos] != 0xFF:
+            raise ValueError("Invalid JPEG marker")
+        marker = jpeg_content[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # Fill byte
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", jpeg_content[pos + 5 : pos + 9])
+            return width, height
+        (segment_length,) = struct.unpack(">H", jpeg_content[pos + 2 : pos + 4])
+        pos += 2 + segment_length
+
+    raise ValueError("JPEG has no frame header")
+
+
+class MjpegAviWriter:
+    """
+    Writes a Motion JPEG AVI frame by frame, so that frames don't need to be kept in memory until the end.
+
+    Frames are JPEG images, stored as they are: building such a clip costs one JPEG encode per frame (or nothing,
+    for snapshots that don't need to be scaled nor transformed), much less than quantizing GIF frames. The sizes
+    and frame counts of the headers are only known at the end: fp must be seekable, they are patched by close().
+    """
+
+    def __init__(self, fp: IO[bytes], fps: float):
+        self._fp = fp
+        self._fps = max(0.1, fps)
+        self._start = 0
+        self._movi_start = 0
+        self._index: List[Tuple[int, int]] = []  # (offset from the movi fourcc, size) of each frame
+        self._max_frame_size = 0
+        self.size: Optional[Tuple[int, int]] = None
+
+    @property
+    def frame_count(self) -> int:
+        return len(self._index)
+
+    def write_frame(self, jpeg_content: bytes):
+        if self.size is None:
+            self.size = get_jpeg_size(jpeg_content)
+            self._start = self._fp.tell()
+            self._fp.write(self._get_headers(0, 0))
+            self._movi_start = self._fp.tell() - 4
+
+        self._index.append((self._fp.tell() - self._movi_start, len(jpeg_content)))
+        self._max_frame_size = max(self._max_frame_size, len(jpeg_content))
+        self._fp.write(b"00dc" + struct.pack("<I", len(jpeg_content)) + jpeg_content)
+        if len(jpeg_content) % 2:
+            self._fp.write(b"\x00")  # Chunks are word aligned
+
+    def close(self):
+        """Write the index and patch the headers. Raises ValueError if no frame was written."""
+        if not self._index:
+            raise ValueError("Can't write an AVI without frames")
+
+        movi_end = self._fp.tell()
+        self._fp.write(b"idx1" + struct.pack("<I", 16 * len(self._index)))
+        for offset, size in self._index:
+            self._fp.write(b"00dc" + struct.pack("<III", 0x10, offset, size))  # 0x10: keyframe
+        end = self._fp.tell()
+
+        self._fp.seek(self._start)
+        self._fp.write(self._get_headers(movi_end - self._movi_start, end - self._start - 8))
+        self._fp.seek(end)
+
+    def _get_headers(self, movi_size: int, riff_size: int) -> bytes:
+        width, height = self.size
+        frame_count = len(self._index)
+        scale, rate = 1000, round(self._fps * 1000)
+
+        avih = struct.pack(
+            "<IIIIIIIIII16x",
+            round(1000000 / self._fps),  # Microseconds per frame
+            self._max_frame_size * rate // scale,  # Max bytes per second
+            0,  # Padding granularity
+            0x10,  # Flags: has an index
+            frame_count,
+            0,  # Initial frames
+            1,  # Streams
+            self._max_frame_size,  # Suggested buffer size
+            width,
+            height,
+        )
+        strh = struct.pack(
+            "<4s4sIHHIIIIIIiIhhhh",
+            b"vids",
+            b"MJPG",
+            0,  # Flags
+            0,  # Priority
+            0,  # Language
+            0,  # Initial frames
+            scale,
+            rate,
+            0,  # Start
+            frame_count,  # Length
+            self._max_frame_size,  # Suggested buffer size
+            -1,  # Quality: default
+            0,  # Sample size: varies
+            0,
+            0,
+            width,
+            height,
+        )
+        strf = struct.pack(
+            "<IiiHH4sIiiII", 40, width, height, 1, 24, b"MJPG", width * height * 3, 0, 0, 0, 0
+        )  # BITMAPINFOHEADER
+
+        strl = b"strl" + self._chunk(b"strh", strh) + self._chunk(b"strf", strf)
+        hdrl = b"hdrl" + self._chunk(b"avih", avih) + self._chunk(b"LIST", strl)
+        return (
+            b"RIFF"
+            + struct.pack("<I", riff_size)
+            + b"AVI "
+            + self._chunk(b"LIST", hdrl)
+            + b"LIST"
+            + struct.pack("<I", movi_size)
+            + b"movi"
+        )
+
+    @staticmethod
+    def _chunk(fourcc: bytes, data: bytes) -> bytes:
+        return fourcc + struct.pack("<I", len(data)) + data
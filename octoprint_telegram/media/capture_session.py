@@ -0,0 +1,126 @@
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Callable
+
+SESSION_OFF = "off"
+SESSION_TURNING_ON = "turning_on"
+SESSION_ON = "on"
+SESSION_TURNING_OFF = "turning_off"
+
+
+class CaptureSessionManager:
+    """
+    Runs the pre / post image actions (e.g. turning an enclosure light on and off) once for overlapping captures.
+
+    The first capture of a session runs the pre action (including its delay), while captures starting when the
+    session is already on proceed right away. Once the last capture ends, the post action runs after a grace
+    window, so that a capture starting shortly after reuses the session instead of toggling the light again.
+    """
+
+    MIN_GRACE_SECONDS = 2
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        turn_on: Callable[[], None],
+        turn_off: Callable[[], None],
+        get_grace_seconds: Callable[[], float],
+    ):
+        self._logger = logger.getChild("CaptureSessionManager")
+        self._turn_on = turn_on
+        self._turn_off = turn_off
+        self._get_grace_seconds = get_grace_seconds
+        self._condition = threading.Condition()
+        self._state = SESSION_OFF
+        self._captures = 0
+        self._off_timer = None
+        self._stats = {"sessions": 0, "captures": 0}
+
+    @contextmanager
+    def session(self):
+        """Context manager wrapping a capture"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self):
+        """Start a capture, running the pre action first if the session is off"""
+        with self._condition:
+            self._captures += 1
+            self._stats["captures"] += 1
+            self._cancel_off_timer()
+
+            # Wait for a pending transition, then reuse the session if it is on
+            while self._state in (SESSION_TURNING_ON, SESSION_TURNING_OFF):
+                self._condition.wait()
+            if self._state == SESSION_ON:
+                return
+
+            self._state = SESSION_TURNING_ON
+            self._stats["sessions"] += 1
+
+        try:
+            self._logger.debug("Starting capture session")
+            self._turn_on()
+        except Exception:
+            self._logger.exception("Caught an exception starting capture session")
+        finally:
+            with self._condition:
+                self._state = SESSION_ON
+                self._condition.notify_all()
+
+    def release(self):
+        """End a capture, scheduling the post action if it was the last one"""
+        with self._condition:
+            self._captures = max(0, self._captures - 1)
+            if self._captures or self._state != SESSION_ON:
+                return
+
+            try:
+                grace_seconds = max(self.MIN_GRACE_SECONDS, self._get_grace_seconds() or 0)
+            except Exception:
+                grace_seconds = self.MIN_GRACE_SECONDS
+
+            timer = threading.Timer(grace_seconds, self._expire)
+            timer.args = (timer,)
+            timer.daemon = True
+            self._off_timer = timer
+            timer.start()
+
+    def stop(self):
+        """End the session right away (e.g. on shutdown), if no capture is running"""
+        with self._condition:
+            self._cancel_off_timer()
+        self._expire(None)
+
+    def get_status(self) -> dict:
+        with self._condition:
+            return {**self._stats, "state": self._state, "active_captures": self._captures}
+
+    def _cancel_off_timer(self):
+        if self._off_timer is not None:
+            self._off_timer.cancel()
+            self._off_timer = None
+
+    def _expire(self, timer):
+        with self._condition:
+            # A timer cancelled while already firing must not end a newer session
+            if timer is not None and timer is not self._off_timer:
+                return
+            self._off_timer = None
+            if self._captures or self._state != SESSION_ON:
+                return
+            self._state = SESSION_TURNING_OFF
+
+        try:
+            self._logger.debug("Ending capture session")
+            self._turn_off()
+        except Exception:
+            self._logger.exception("Caught an exception ending capture session")
+        finally:
+            with self._condition:
+                self._state = SESSION_OFF
+                self._condition.notify_all()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import IO, List, Optional
+
+# Memory backed filesystems, used for clips spilled out of memory before falling back to the system temp dir
+TMPFS_DIRS = ["/dev/shm", "/run/shm"]
+
+
+def get_tmpfs_dir() -> Optional[str]:
+    """Return a writable memory backed directory, if the system has one"""
+    for tmpfs_dir in TMPFS_DIRS:
+        if os.path.isdir(tmpfs_dir) and os.access(tmpfs_dir, os.W_OK | os.X_OK):
+            return tmpfs_dir
+    return None
+
+
+class ClipBuffer:
+    """
+    A video clip kept in memory, spilled to a temporary file only when it grows past max_memory bytes.
+
+    Spilled clips are written to a memory backed filesystem (tmpfs) when available, so that clips never touch the
+    SD card of small hosts unless they are really big. The buffer can be read any number of times (e.g. once per
+    recipient) and must be closed when no longer needed.
+    """
+
+    def __init__(self, name: str, max_memory: int, spill_dir: Optional[str] = None):
+        self.name = name
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory, dir=spill_dir or get_tmpfs_dir())
+
+    @property
+    def file(self) -> IO[bytes]:
+        return self._file
+
+    @property
+    def size(self) -> int:
+        position = self._file.tell()
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        self._file.seek(position)
+        return size
+
+    @property
+    def spilled(self) -> bool:
+        return bool(getattr(self._file, "_rolled", False))
+
+    def write_from(self, stream: IO[bytes], chunk_size=64 * 1024) -> int:
+        """Copy a stream (e.g. the stdout of ffmpeg) to the buffer, returning the number of bytes written"""
+        shutil.copyfileobj(stream, self._file, chunk_size)
+        return self.size
+
+    def read(self) -> bytes:
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self):
+        self._file.close()
+
+    def __repr__(self):
+        return f"ClipBuffer(name={self.name!r}, size={self.size}, spilled={self.spilled})"
+
+
+def run_to_buffer(cmd: List[str], clip_buffer: ClipBuffer, timeout: Optional[float] = None) -> int:
+    """
+    Run a command writing a clip to its stdout (e.g. ffmpeg with "pipe:1" as output), collecting it in clip_buffer.
+
+    Raises:
+        subprocess.TimeoutExpired: If the command didn't complete within timeout seconds (it is killed)
+        subprocess.CalledProcessError: If the command exited with an error
+
+    Returns:
+        int: The size of the clip
+    """
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        process.kill()
+
+    watchdog = threading.Timer(timeout, kill) if timeout else None
+    if watchdog:
+        watchdog.daemon = True
+        watchdog.start()
+
+    try:
+        with process.stdout:
+            size = clip_buffer.write_from(process.stdout)
+        return_code = process.wait()
+    finally:
+        if watchdog:
+            watchdog.cancel()
+
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if return_code:
+        raise subprocess.CalledProcessError(return_code, cmd)
+
+    return size
@@ -0,0 +1,89 @@
+from typing import List
+
+# Quality knob of x264 for budgeted clips, when the bitrate cap is not reached
+DEFAULT_CRF = 26
+
+# Bitrate reserved to the audio track, if any
+AUDIO_KBPS = 64
+
+# Below this many bits per pixel per frame, H.264 baseline gets visibly blocky: lower fps / resolution instead
+MIN_BITS_PER_PIXEL = 0.06
+
+# Candidate longest sides, tried from the biggest to the smallest
+DIMENSION_STEPS = [1920, 1280, 960, 640, 480, 320]
+
+
+class ClipParameters:
+    """Encoding parameters chosen for a clip, and the budget they were chosen for"""
+
+    def __init__(self, duration: int, fps: int, max_dimension: int, video_kbps: int, crf: int, max_bytes: int):
+        self.duration = duration
+        self.fps = fps
+        self.max_dimension = max_dimension
+        self.video_kbps = video_kbps
+        self.crf = crf  # 0: encoder default
+        self.max_bytes = max_bytes
+
+    def get_filters(self) -> List[str]:
+        """ffmpeg video filters capping frame rate and resolution (keeping the aspect ratio and even sizes)"""
+        filters = []
+        if self.fps:
+            filters.append(f"fps={self.fps}")
+        if self.max_dimension:
+            d = self.max_dimension
+            filters.append(f"scale=w='if(gte(iw,ih),min(iw,{d}),-2)':h='if(gte(iw,ih),-2,min(ih,{d}))'")
+        return filters
+
+    def get_rate_control_args(self, constant_quality=True) -> List[str]:
+        """
+        ffmpeg arguments for CRF encoding, capped to the bitrate that fits the budget.
+
+        Encoders without CRF support (constant_quality=False, e.g. hardware ones) target the capped bitrate instead.
+        """
+        args = ["-crf", str(self.crf)] if self.crf and constant_quality else []
+        if self.video_kbps:
+            if not constant_quality:
+                args += ["-b:v", f"{self.video_kbps}k"]
+            args += ["-maxrate", f"{self.video_kbps}k", "-bufsize", f"{self.video_kbps * 2}k"]
+        return args
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def plan_clip_encoding(duration: int, max_bytes: int = 0, max_fps: int = 0, max_dimension: int = 0) -> ClipParameters:
+    """
+    Choose frame rate, resolution and bitrate cap so that a clip of the given duration fits max_bytes.
+
+    The bitrate is what the budget allows (minus some container and audio overhead). If that bitrate is too
+    low for the capped frame rate and resolution, the frame rate is lowered first (down to 5 fps), then the
+    resolution, until each pixel gets enough bits to look decent.
+
+    Args:
+        duration (int): Duration of the clip in seconds
+        max_bytes (int): Size budget of the clip. 0 disables the budget.
+        max_fps (int): Maximum frame rate. 0 keeps the source frame rate.
+        max_dimension (int): Maximum length of the longest side. 0 keeps the source resolution.
+    """
+    duration = max(1, duration)
+
+    if not max_bytes:
+        return ClipParameters(duration, max_fps, max_dimension, 0, 0, 0)
+
+    # Leave 10% for the container and the rate control overshoot
+    video_kbps = max(32, int(max_bytes * 8 * 0.9 / duration / 1000) - AUDIO_KBPS)
+
+    max_fps = max_fps or 15
+    fps_steps = sorted({fps for fps in (max_fps, 10, 5) if fps <= max_fps}, reverse=True)
+    if max_dimension:
+        dimension_steps = [max_dimension] + [d for d in DIMENSION_STEPS if d < max_dimension]
+    else:
+        dimension_steps = DIMENSION_STEPS
+
+    # Assume a 16:9 source, the most common for webcams
+    candidates = [(dimension, fps) for dimension in dimension_steps for fps in fps_steps]
+    for dimension, fps in candidates:
+        if video_kbps * 1000 / (dimension * dimension * 9 / 16 * fps) >= MIN_BITS_PER_PIXEL:
+            break
+
+    return ClipParameters(duration, fps, dimension, video_kbps, DEFAULT_CRF, max_bytes)
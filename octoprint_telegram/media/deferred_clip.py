@@ -0,0 +1,28 @@
+from typing import Callable, Union
+
+from .clip_buffer import ClipBuffer
+
+
+class DeferredClip:
+    """
+    A clip captured as is (e.g. a webcam stream copied without re-encoding), whose encoding has been deferred
+    because the host was under pressure.
+
+    finish() encodes it, which may first wait for the pressure to drop: it must be called from a thread that nobody
+    waits for. close() releases the captured footage, and must be called in any case.
+    """
+
+    def __init__(self, name: str, encode: Callable[[], Union[str, ClipBuffer]], discard: Callable[[], None]):
+        self.name = name
+        self._encode = encode
+        self._discard = discard
+
+    def finish(self) -> Union[str, ClipBuffer]:
+        """Encode the clip, returning the encoded clip (a path, or a ClipBuffer)"""
+        return self._encode()
+
+    def close(self):
+        self._discard()
+
+    def __repr__(self):
+        return f"DeferredClip(name={self.name!r})"
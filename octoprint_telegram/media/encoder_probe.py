@@ -0,0 +1,327 @@
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+# Hardware and software H.264 encoders, in order of preference
+H264_ENCODERS = ["h264_v4l2m2m", "h264_omx", "h264_vaapi", "libx264", "libopenh264"]
+
+# x264 presets, from the fastest to the one with the best quality
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow"]
+
+ENCODER_LINE_REGEX = re.compile(r"^\s*V[.A-Z]{5}\s+(\S+)", re.MULTILINE)
+
+
+class EncoderProbe:
+    """
+    Probes the tools and the encoding capabilities of the host, and caches the results.
+
+    Tool lookups (ffmpeg, nice, ionice, number of CPUs) are cheap and done when the probe is created or
+    refreshed: the ffmpeg version is read again only when the ffmpeg binary changes. The probe checks which of the
+    H.264 encoders built into ffmpeg actually work on the host, and benchmarks a short synthetic clip at several
+    x264 presets and resolutions with the same thread budget used for gifs. Results are persisted in a json file
+    and reused as long as the tools and the CPU count don't change.
+
+    The probe only runs while is_busy() is false (i.e. while not printing), and through wrap_command (e.g. with
+    nice / ionice): if the printer gets busy, the probe is interrupted and resumed once it is idle again.
+    """
+
+    BENCHMARK_SECONDS = 2
+    BENCHMARK_FPS = 15
+    BENCHMARK_RESOLUTIONS = ["640x480", "1280x720"]
+    # Required ratio between encoded seconds and wall seconds: gifs are encoded at low priority, while printing,
+    # so leave plenty of headroom for the rest of the system
+    SPEED_MARGIN = 1.8
+    # Bumped when the probe results change format or meaning, to invalidate cached results
+    PROBE_VERSION = 2
+    # How often to check whether the printer is idle again, while the probe is deferred
+    BUSY_POLL_SECONDS = 60
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        get_ffmpeg_path: Callable[[], Optional[str]],
+        cache_path: str,
+        is_busy: Optional[Callable[[], bool]] = None,
+        wrap_command: Optional[Callable[[List[str]], List[str]]] = None,
+    ):
+        self._logger = logger.getChild("EncoderProbe")
+        self._get_ffmpeg_path = get_ffmpeg_path
+        self._cache_path = cache_path
+        self._is_busy = is_busy or (lambda: False)
+        self._wrap_command = wrap_command or (lambda cmd: cmd)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._ffmpeg_version_key = None  # (path, mtime) of the ffmpeg binary whose version is cached
+        self._ffmpeg_version = None
+        self.deferred = False  # Whether the probe is waiting for the printer to be idle
+        self.capabilities = {}
+        self.refresh_tools()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def ffmpeg_path(self) -> Optional[str]:
+        return self.capabilities.get("ffmpeg_path")
+
+    @property
+    def ionice_path(self) -> Optional[str]:
+        return self.capabilities.get("ionice_path")
+
+    @property
+    def nice_path(self) -> Optional[str]:
+        return self.capabilities.get("nice_path")
+
+    @property
+    def cpu_count(self) -> int:
+        return self.capabilities.get("cpu_count") or 1
+
+    def refresh_tools(self):
+        """Look up the tools again, dropping benchmark results if they changed"""
+        ffmpeg_path = self._get_ffmpeg_path()
+
+        try:
+            cpu_count = multiprocessing.cpu_count()
+        except NotImplementedError:
+            cpu_count = 1
+
+        tools = {
+            "ffmpeg_path": ffmpeg_path,
+            "ffmpeg_version": self._get_cached_ffmpeg_version(ffmpeg_path),
+            "nice_path": shutil.which("nice"),
+            "ionice_path": shutil.which("ionice"),
+            "cpu_count": cpu_count,
+            "probe_version": self.PROBE_VERSION,
+        }
+
+        with self._lock:
+            if any(self.capabilities.get(k) != v for k, v in tools.items()):
+                self.capabilities = dict(tools)
+                cached = self._load_cache()
+                if cached and all(cached.get(k) == v for k, v in tools.items()):
+                    self.capabilities = cached
+
+    def get_video_encoder(self) -> str:
+        """The preferred H.264 encoder that passed the probe, libx264 if none did or the probe didn't run yet"""
+        encoders = self.capabilities.get("encoders") or []
+        return encoders[0] if encoders else "libx264"
+
+    def get_recommended_preset(self, width=0, height=0) -> Optional[str]:
+        """
+        Get the best quality x264 preset that encodes a clip of the given output resolution faster than real time.
+
+        The speeds benchmarked at the resolution closest to the given one are scaled by the ratio of their pixel
+        counts. Returns None if the benchmark didn't run yet.
+        """
+        benchmarks = self.capabilities.get("benchmarks") or {}
+        if not benchmarks:
+            return None
+
+        pixels = width * height if width and height else 1280 * 720
+        resolution = min(benchmarks, key=lambda r: abs(self._get_pixels(r) - pixels))
+        scale = self._get_pixels(resolution) / pixels
+
+        recommended = X264_PRESETS[0]  # Even the fastest preset is too slow: use it anyway
+        for preset in X264_PRESETS:
+            speed = benchmarks[resolution].get(preset)
+            if speed is None or speed * scale < self.SPEED_MARGIN:
+                break  # Slower presets won't do any better
+            recommended = preset
+        return recommended
+
+    def start(self, force=False):
+        """
+        Run the probe in background, unless cached results are available.
+
+        If the printer is busy, the probe waits for it to be idle (see deferred).
+        """
+        self.refresh_tools()
+
+        if self.is_running:
+            return
+        if not force and "benchmarks" in self.capabilities:
+            self._logger.debug("Using cached encoder benchmark: %s", self.capabilities.get("recommended_presets"))
+            return
+        if not self.ffmpeg_path:
+            return
+
+        self._thread = threading.Thread(target=self._run, name="TelegramEncoderProbe", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                if self._is_busy():
+                    if not self.deferred:
+                        self._logger.info("Deferring the encoder probe until the printer is idle")
+                        self.deferred = True
+                    time.sleep(self.BUSY_POLL_SECONDS)
+                    continue
+
+                self.deferred = False
+                if self._probe():
+                    return
+                self._logger.info("Encoder probe interrupted, the printer is busy")
+        except Exception:
+            self._logger.exception("Caught an exception probing encoders")
+        finally:
+            self.deferred = False
+
+    def _probe(self) -> bool:
+        """Probe the encoders, returning False if interrupted because the printer got busy"""
+        self._logger.info("Probing encoders")
+
+        ffmpeg_path = self.ffmpeg_path
+        detected_encoders = self._get_encoders(ffmpeg_path)
+        used_threads = max(1, self.cpu_count // 2)
+
+        # An encoder built into ffmpeg may still miss its hardware or drivers: try encoding with each one
+        encoders = []
+        for encoder in H264_ENCODERS:
+            if encoder in detected_encoders:
+                if self._is_busy():
+                    return False
+                if self._encode_test_clip(ffmpeg_path, encoder, "320x240", 1, used_threads) is not None:
+                    encoders.append(encoder)
+
+        benchmarks = {}
+        if "libx264" in encoders:
+            for resolution in self.BENCHMARK_RESOLUTIONS:
+                benchmarks[resolution] = {}
+                for preset in X264_PRESETS:
+                    if self._is_busy():
+                        return False
+                    speed = self._encode_test_clip(
+                        ffmpeg_path, "libx264", resolution, self.BENCHMARK_SECONDS, used_threads, ["-preset", preset]
+                    )
+                    benchmarks[resolution][preset] = speed
+                    if speed is None or speed < self.SPEED_MARGIN:
+                        break  # Slower presets won't do any better
+
+        with self._lock:
+            self.capabilities["benchmarks"] = benchmarks
+            recommended_presets = {
+                resolution: self.get_recommended_preset(*self._get_size(resolution)) for resolution in benchmarks
+            }
+            self.capabilities.update(
+                {
+                    "detected_encoders": [e for e in H264_ENCODERS if e in detected_encoders],
+                    "encoders": encoders,
+                    "benchmark_threads": used_threads,
+                    "recommended_presets": recommended_presets,
+                    "probed_at": time.time(),
+                }
+            )
+            capabilities = dict(self.capabilities)
+
+        self._save_cache(capabilities)
+        self._logger.info("Encoders probed: %s, recommended presets: %s", encoders, recommended_presets)
+        return True
+
+    def _encode_test_clip(
+        self, ffmpeg_path, encoder, resolution, seconds, threads, encoder_args: Optional[List[str]] = None
+    ) -> Optional[float]:
+        """Return how many times faster than real time a synthetic clip is encoded, or None on failure"""
+        cmd = [
+            ffmpeg_path,
+            "-hide_banner",
+            "-nostdin",
+            "-loglevel", "error",
+            "-f", "lavfi",
+            "-i", f"testsrc2=size={resolution}:rate={self.BENCHMARK_FPS}",
+            "-t", str(seconds),
+            "-threads", str(threads),
+            "-c:v", encoder,
+            *(encoder_args or []),
+            "-vf", "format=yuv420p",
+            "-f", "null",
+            "-",
+        ]  # fmt: skip
+        cmd = self._wrap_command(cmd)
+
+        start = time.monotonic()
+        try:
+            subprocess.run(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=True,
+                timeout=seconds * 10 + 10,
+            )
+        except (OSError, subprocess.SubprocessError):
+            self._logger.debug("Test encode with %s %s at %s failed", encoder, encoder_args, resolution, exc_info=True)
+            return None
+
+        return round(seconds / max(time.monotonic() - start, 0.001), 2)
+
+    @staticmethod
+    def _get_size(resolution: str) -> Tuple[int, int]:
+        width, height = resolution.split("x")
+        return int(width), int(height)
+
+    @classmethod
+    def _get_pixels(cls, resolution: str) -> int:
+        width, height = cls._get_size(resolution)
+        return width * height
+
+    def _get_cached_ffmpeg_version(self, ffmpeg_path) -> Optional[str]:
+        try:
+            key = (ffmpeg_path, os.path.getmtime(ffmpeg_path)) if ffmpeg_path else None
+        except OSError:
+            key = (ffmpeg_path, None)
+
+        if key != self._ffmpeg_version_key:
+            self._ffmpeg_version = self._get_ffmpeg_version(ffmpeg_path)
+            self._ffmpeg_version_key = key
+        return self._ffmpeg_version
+
+    @staticmethod
+    def _get_ffmpeg_version(ffmpeg_path) -> Optional[str]:
+        if not ffmpeg_path:
+            return None
+
+        try:
+            output = subprocess.run(
+                [ffmpeg_path, "-hide_banner", "-version"],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True,
+                timeout=10,
+            ).stdout
+            return output.splitlines()[0].strip() if output else None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    @staticmethod
+    def _get_encoders(ffmpeg_path) -> set:
+        output = subprocess.run(
+            [ffmpeg_path, "-hide_banner", "-encoders"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+            timeout=10,
+        ).stdout
+        return set(ENCODER_LINE_REGEX.findall(output or ""))
+
+    def _load_cache(self) -> dict:
+        try:
+            with open(self._cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, capabilities):
+        try:
+            os.makedirs(os.path.dirname(self._cache_path), exist_ok=True)
+            with open(self._cache_path, "w") as f:
+                json.dump(capabilities, f)
+        except OSError:
+            self._logger.exception("Caught an exception saving encoder probe results")
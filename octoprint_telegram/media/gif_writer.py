@@ -0,0 +1,87 @@
+import struct
+from typing import IO, Optional, Tuple
+
+_NETSCAPE_LOOP = b"\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00"
+
+
+def _skip_sub_blocks(data: bytes, pos: int) -> int:
+    """Return the position following the data sub-blocks starting at pos"""
+    while True:
+        size = data[pos]
+        pos += 1
+        if size == 0:
+            return pos
+        pos += size
+
+
+def get_gif_size(gif_content: bytes) -> Tuple[int, int]:
+    """Return the logical screen size (width, height) of a GIF"""
+    if gif_content[:3] != b"GIF":
+        raise ValueError("Not a GIF")
+    return struct.unpack("<HH", gif_content[6:10])
+
+
+class AnimatedGifWriter:
+    """
+    Writes an animated GIF frame by frame, so that frames don't need to be kept in memory until the end.
+
+    Frames are single image GIFs (e.g. as saved by Pillow). Their image data is copied as is, with their color
+    table written as the local color table of the frame: nothing is decoded nor re-encoded. The canvas has the
+    size of the first frame, smaller frames are drawn at its top left corner.
+    """
+
+    def __init__(self, fp: IO[bytes], fps: float):
+        self._fp = fp
+        self._delay = max(2, round(100 / max(0.1, fps)))  # Centiseconds, browsers ignore delays below 2
+        self.frame_count = 0
+        self.size: Optional[Tuple[int, int]] = None
+
+    def write_frame(self, gif_content: bytes) -> int:
+        """Append a frame, returning the offset in fp where its blocks start"""
+        width, height = get_gif_size(gif_content)
+        flags = gif_content[10]
+        pos = 13
+        color_table = b""
+        if flags & 0x80:
+            color_table_bits = flags & 0x07
+            color_table = gif_content[pos : pos + 3 * 2 ** (color_table_bits + 1)]
+            pos += len(color_table)
+
+        # Skip extensions up to the image descriptor
+        while gif_content[pos] == 0x21:
+            pos = _skip_sub_blocks(gif_content, pos + 2)
+        if gif_content[pos] != 0x2C:
+            raise ValueError("GIF has no image")
+
+        descriptor = bytearray(gif_content[pos : pos + 10])
+        pos += 10
+        if descriptor[9] & 0x80:
+            # The frame has its own local color table already, copied along with the image data
+            color_table = b""
+            color_table_end = pos + 3 * 2 ** ((descriptor[9] & 0x07) + 1)
+        else:
+            if not color_table:
+                raise ValueError("GIF has no color table")
+            descriptor[9] = (descriptor[9] & 0x40) | 0x80 | color_table_bits
+            color_table_end = pos
+
+        image_data_end = _skip_sub_blocks(gif_content, color_table_end + 1)  # + LZW minimum code size byte
+
+        if self.size is None:
+            self.size = (width, height)
+            self._fp.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0) + _NETSCAPE_LOOP)
+
+        start = self._fp.tell()
+        # Graphic control extension: no disposal (frames cover each other), delay, no transparency
+        self._fp.write(b"\x21\xf9\x04\x04" + struct.pack("<H", self._delay) + b"\x00\x00")
+        self._fp.write(bytes(descriptor))
+        self._fp.write(color_table)
+        self._fp.write(gif_content[pos:image_data_end])
+        self.frame_count += 1
+        return start
+
+    def close(self):
+        """Write the GIF trailer. Raises ValueError if no frame was written."""
+        if not self.frame_count:
+            raise ValueError("Can't write a GIF without frames")
+        self._fp.write(b"\x3b")
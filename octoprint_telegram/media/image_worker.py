@@ -0,0 +1,176 @@
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import threading
+from typing import Any, Callable, List, Optional, Tuple, TypeVar
+
+from .image_worker_main import read_message, write_message
+
+T = TypeVar("T")
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_worker_main.py")
+
+
+class WorkerLostError(Exception):
+    pass
+
+
+class _WorkerProcess:
+    """A worker process, running one operation at a time (see image_worker_main)"""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def call(self, fn: Callable, args, kwargs, timeout: float) -> Tuple[str, Any]:
+        """
+        Run fn in the worker, returning ("ok", result) or ("error", exception raised by fn).
+
+        Raises:
+            WorkerLostError: If the worker can't be used (it died, or the request can't be sent to it)
+            TimeoutError: If the worker didn't answer within timeout seconds (it is killed)
+        """
+        try:
+            write_message(self.process.stdin, (fn.__module__, fn.__qualname__, args, kwargs))
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            raise WorkerLostError(f"Can't send {fn.__name__} to the image worker: {e}") from e
+
+        response = {}
+
+        def read_response():
+            try:
+                response["message"] = read_message(self.process.stdout)
+            except Exception as e:
+                response["error"] = e
+
+        reader = threading.Thread(target=read_response, name="TelegramImageWorkerReader", daemon=True)
+        reader.start()
+        reader.join(timeout)
+        if reader.is_alive():
+            self.kill()
+            raise TimeoutError(f"Image operation {fn.__name__} timed out after {timeout}s")
+
+        if response.get("message") is None:
+            raise WorkerLostError(f"Image worker process died: {response.get('error', 'no response')}")
+        return response["message"]
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+    def close(self):
+        # Workers exit when their stdin is closed
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+
+
+class ImageWorkerPool:
+    """
+    Runs CPU-heavy image operations (decode, resize, encode) in a small pool of low priority worker processes.
+
+    Pillow releases the GIL only in some of its C sections, so heavy image work done in OctoPrint's own process
+    competes with the serial communication threads. Workers are started lazily on first use and, if they can't be
+    created (or crash), the operation is run synchronously in the calling thread instead. The pool is disabled
+    (max_workers=0) unless configured.
+
+    Functions submitted to the pool must be module level functions or static methods of the plugin modules, and
+    their arguments and results must be picklable: images are exchanged as encoded bytes.
+
+    Workers are plain Python processes running image_worker_main, not forks of OctoPrint's process (forking a
+    multithreaded process can leave the child with locks held by threads that don't exist in it), nor
+    multiprocessing children (which import OctoPrint's main module). They only import Pillow and the modules of
+    the requested operations.
+    """
+
+    # Seconds after which a worker is considered hung: it is killed and the operation fails
+    RESULT_TIMEOUT = 120
+
+    def __init__(self, logger: logging.Logger, max_workers: int = 0):
+        self._logger = logger.getChild("ImageWorkerPool")
+        self._lock = threading.Lock()
+        self._max_workers = max(0, max_workers)
+        self._slots = threading.BoundedSemaphore(max(1, self._max_workers))
+        self._idle: List[_WorkerProcess] = []
+        self._unavailable = False
+
+    def configure(self, max_workers: int):
+        """Change the number of worker processes. 0 runs image operations in OctoPrint's process."""
+        max_workers = max(0, max_workers)
+        if max_workers == self._max_workers:
+            return
+
+        self._logger.debug("Changing number of image worker processes to %s", max_workers)
+        with self._lock:
+            self._max_workers = max_workers
+            self._slots = threading.BoundedSemaphore(max(1, max_workers))
+            self._unavailable = False
+        self.shutdown()
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run fn(*args, **kwargs) in a worker process and wait for its result"""
+        if self._max_workers <= 0 or self._unavailable:
+            return fn(*args, **kwargs)
+
+        with self._slots:
+            worker = self._get_worker()
+            if worker is None:
+                return fn(*args, **kwargs)
+
+            try:
+                status, value = worker.call(fn, args, kwargs, self.RESULT_TIMEOUT)
+            except TimeoutError:
+                # Running it again synchronously would likely hang the calling thread: give up instead
+                self._logger.error("Image worker hung running %s, killed it", fn.__name__)
+                raise
+            except WorkerLostError as e:
+                self._logger.warning("%s, running %s synchronously", e, fn.__name__)
+                worker.kill()
+                return fn(*args, **kwargs)
+
+            self._release_worker(worker)
+            if status == "error":
+                raise value  # Raised by the operation itself
+            return value
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._idle = self._idle, []
+
+        for worker in workers:
+            worker.close()
+
+    def _get_worker(self) -> Optional[_WorkerProcess]:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.poll() is None:
+                    return worker
+
+        try:
+            worker = _WorkerProcess()
+            self._logger.debug("Started image worker process %s", worker.process.pid)
+            return worker
+        except OSError:
+            self._logger.warning(
+                "Can't start image worker processes, image operations will run in OctoPrint's process", exc_info=True
+            )
+            self._unavailable = True
+            return None
+
+    def _release_worker(self, worker: _WorkerProcess):
+        with self._lock:
+            if len(self._idle) < self._max_workers:
+                self._idle.append(worker)
+                return
+        worker.close()  # The pool was shrunk in the meantime
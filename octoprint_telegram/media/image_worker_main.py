@@ -0,0 +1,89 @@
+"""
+Entry point of the image worker processes started by ImageWorkerPool, run as a script.
+
+A worker runs image operations (module level functions or static methods of the plugin modules) one at a time,
+for as long as its stdin stays open. Requests and responses are length-prefixed pickles exchanged over stdin and
+stdout. Only the modules holding the requested operations are imported: the plugin package itself (and so
+OctoPrint, Flask...) is not, which keeps workers quick to start and small.
+
+This module must only import the standard library, since it is also imported by ImageWorkerPool.
+"""
+
+import importlib
+import os
+import pickle
+import struct
+import sys
+import types
+from typing import IO, Any, Optional
+
+PACKAGE_NAME = "octoprint_telegram"
+
+_HEADER = struct.Struct("!I")
+
+
+def write_message(stream: IO[bytes], message: Any):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(data)))
+    stream.write(data)
+    stream.flush()
+
+
+def read_message(stream: IO[bytes]) -> Optional[Any]:
+    """Read a message, returning None if the stream was closed"""
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    (size,) = _HEADER.unpack(header)
+    data = stream.read(size)
+    if len(data) < size:
+        return None
+    return pickle.loads(data)
+
+
+def _resolve(module_name: str, qualname: str):
+    if module_name.split(".")[0] != PACKAGE_NAME:
+        raise ValueError(f"{module_name} is not a module of the plugin")
+    target = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        target = getattr(target, name)
+    return target
+
+
+def main():
+    try:
+        os.nice(19)
+    except (AttributeError, OSError):
+        pass
+
+    # Make the plugin modules importable without running the __init__ of the plugin package. When run as a
+    # script, the directory of this file comes first in sys.path: drop it, so that its modules aren't top level.
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if sys.path and os.path.abspath(sys.path[0] or ".") == os.path.dirname(os.path.abspath(__file__)):
+        sys.path.pop(0)
+    package = types.ModuleType(PACKAGE_NAME)
+    package.__path__ = [package_dir]
+    sys.modules[PACKAGE_NAME] = package
+
+    requests, responses = sys.stdin.buffer, sys.stdout.buffer
+    sys.stdout = sys.stderr  # Nothing else may be written to the responses stream
+
+    while True:
+        request = read_message(requests)
+        if request is None:
+            return
+
+        module_name, qualname, args, kwargs = request
+        try:
+            response = ("ok", _resolve(module_name, qualname)(*args, **kwargs))
+        except Exception as e:
+            response = ("error", e)
+
+        try:
+            write_message(responses, response)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            write_message(responses, ("error", RuntimeError(f"Can't send the result of {qualname}: {e}")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import logging
+import threading
+import time
+from typing import IO, Callable, List, Optional
+
+from .gif_writer import AnimatedGifWriter
+from .snapshot_clip import SnapshotClipBuilder
+
+
+class PrintRecap:
+    """
+    A time-compressed clip of a whole print, written while printing.
+
+    Frames are taken at layer changes, at most one every interval seconds. Each frame is downscaled, encoded and
+    appended to the recap file as soon as it is taken, so that at the end of the print only the GIF trailer is left
+    to write. The recap is bounded: once it holds MAX_FRAMES frames, every other frame is dropped (compacting the
+    file in place) and the interval is doubled, so that the recap keeps covering the whole print evenly whatever
+    its duration.
+
+    The image work is done by run (see SnapshotClipBuilder). The recap file is released with discard when the
+    recap is stopped, unless it was handed over by finish().
+    """
+
+    MAX_FRAMES = SnapshotClipBuilder.MAX_FRAMES
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        fps: float = 10,
+        max_dimension: int = 480,
+        run: Optional[Callable] = None,
+        discard: Optional[Callable[[str], None]] = None,
+    ):
+        self._logger = logger.getChild("PrintRecap")
+        self.fps = fps
+        self.max_dimension = max_dimension
+        self._run = run or (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+        self._discard = discard or (lambda path: None)
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        self._file: Optional[IO[bytes]] = None
+        self._writer: Optional[AnimatedGifWriter] = None
+        self._frame_offsets: List[int] = []
+        self._interval = 0.0
+        self._last_frame_time = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self._writer is not None
+
+    def start(self, interval: float, path: str):
+        """Start recording a new print to path, dropping the recap of the previous one"""
+        self.stop()
+
+        with self._lock:
+            self._path = path
+            self._file = open(path, "w+b")
+            self._writer = AnimatedGifWriter(self._file, self.fps)
+            self._frame_offsets = []
+            self._interval = max(1.0, interval)
+            self._last_frame_time = 0.0
+        self._logger.debug("Print recap started, one frame every %ss at most", self._interval)
+
+    def stop(self):
+        with self._lock:
+            path = self._close()
+        if path:
+            self._discard(path)
+
+    def finish(self) -> Optional[str]:
+        """
+        Complete the recap, handing its file over to the caller (who must discard it).
+        Returns None if there is no recap or it has no frames.
+        """
+        with self._lock:
+            if self._writer is None:
+                return None
+
+            if self._frame_offsets:
+                self._logger.debug("Print recap finished with %s frames", len(self._frame_offsets))
+                self._writer.close()
+                path, self._path = self._path, None
+                self._close()
+                return path
+
+        self.stop()
+        return None
+
+    def claim_frame(self, now=None) -> bool:
+        """Return whether a new frame is due, reserving its time slot if so"""
+        now = now or time.monotonic()
+        with self._lock:
+            if self._writer is None or now - self._last_frame_time < self._interval:
+                return False
+            self._last_frame_time = now
+            return True
+
+    def add_frame(self, image_content: bytes, flipH=False, flipV=False, rotate=False):
+        with self._lock:
+            writer = self._writer
+        if writer is None:
+            return
+
+        # Decoding and encoding is the slow part: done without holding the lock
+        frame = self._run(
+            SnapshotClipBuilder.prepare_frame, image_content, self.max_dimension, flipH, flipV, rotate, writer.size
+        )
+
+        with self._lock:
+            if writer is not self._writer:
+                return  # The print ended in the meantime
+
+            if len(self._frame_offsets) >= self.MAX_FRAMES:
+                self._drop_alternate_frames()
+                self._interval *= 2
+                self._logger.debug("Print recap full, now taking one frame every %ss", self._interval)
+
+            self._frame_offsets.append(writer.write_frame(frame))
+            self._file.flush()
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "active": self._writer is not None,
+                "frames": len(self._frame_offsets),
+                "interval": self._interval,
+                "bytes": self._file.tell() if self._file else 0,
+            }
+
+    def _drop_alternate_frames(self):
+        """Keep every other frame, moving them towards the beginning of the file. Must be called holding the lock."""
+        end = self._file.tell()
+        frame_ends = self._frame_offsets[1:] + [end]
+        kept_offsets = []
+        write_position = self._frame_offsets[0]
+
+        # Frames only move backwards: each one is read before anything is written over it
+        for start, frame_end in list(zip(self._frame_offsets, frame_ends))[::2]:
+            self._file.seek(start)
+            frame = self._file.read(frame_end - start)
+            self._file.seek(write_position)
+            self._file.write(frame)
+            kept_offsets.append(write_position)
+            write_position += len(frame)
+
+        self._file.truncate(write_position)
+        self._file.seek(write_position)
+        self._frame_offsets = kept_offsets
+
+    def _close(self) -> Optional[str]:
+        """Close the recap file, returning its path if it wasn't handed over. Must be called holding the lock."""
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                self._logger.exception("Caught an exception closing the print recap")
+
+        path = self._path
+        self._path = self._file = self._writer = None
+        self._frame_offsets = []
+        return path
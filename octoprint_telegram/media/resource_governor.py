@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+PRINTER_IDLE = "idle"
+PRINTER_PAUSED = "paused"
+PRINTER_PRINTING = "printing"
+
+
+class EncodePolicy:
+    """Priorities and resources granted to a background encoder"""
+
+    def __init__(self, printer_state: str, nice: int, ionice_class: int, threads: int, reason: str = ""):
+        self.printer_state = printer_state
+        self.nice = nice
+        self.ionice_class = ionice_class  # 2: best-effort (lowest level), 3: idle
+        self.threads = threads
+        self.throttled = False
+        self.reason = reason
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class ResourceGovernor:
+    """
+    Decides the CPU / IO priority and the number of threads of background encoders (ffmpeg), according to the
+    printer state and to the host load.
+
+    While printing, encoders run at the lowest CPU and IO priority, leaving at least one core to OctoPrint.
+    When the host shows a risk of starving the serial communication (high CPU pressure or load while printing),
+    all encodes are throttled to a single thread, and callers may defer the encoding of footage already captured
+    until the pressure drops (up to MAX_DEFER_SECONDS, see wait_for_capacity()). Captures themselves are never
+    deferred, since that would move the time window they show. Unlike CPU limiters such as cpulimit, processes are never stopped and resumed,
+    so encode times stay predictable.
+    """
+
+    MAX_DEFER_SECONDS = 30
+    DEFER_POLL_SECONDS = 2
+    # Thresholds above which printing is considered at risk
+    MAX_CPU_PRESSURE = 40.0  # Percentage of time some tasks were waiting for a CPU, over the last 10 seconds
+    MAX_LOAD_PER_CPU = 1.0
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        get_printer_state: Callable[[], str],
+        get_cpu_count: Callable[[], int],
+        get_nice_path: Callable[[], Optional[str]],
+        get_ionice_path: Callable[[], Optional[str]],
+    ):
+        self._logger = logger.getChild("ResourceGovernor")
+        self._get_printer_state = get_printer_state
+        self._get_cpu_count = get_cpu_count
+        self._get_nice_path = get_nice_path
+        self._get_ionice_path = get_ionice_path
+        self._lock = threading.Lock()
+        self._stats = {"encodes": 0, "throttled": 0, "deferred": 0, "deferred_seconds": 0.0, "last_policy": None}
+
+    def get_policy(self) -> EncodePolicy:
+        """Get the policy for a new encode. Never waits: see wait_for_capacity() to defer encodes."""
+        policy = self._compute_policy()
+
+        if policy.throttled:
+            self._logger.info("Throttling encode to %s thread: %s", policy.threads, policy.reason)
+
+        with self._lock:
+            self._stats["encodes"] += 1
+            self._stats["throttled"] += int(policy.throttled)
+            self._stats["last_policy"] = policy.to_dict()
+
+        return policy
+
+    def wait_for_capacity(self) -> float:
+        """
+        Wait until encodes are no longer throttled, up to MAX_DEFER_SECONDS. Only to be called by threads that
+        nobody waits for, e.g. to encode footage already captured.
+
+        Returns:
+            float: The seconds waited
+        """
+        start = time.monotonic()
+        deferred = False
+
+        while True:
+            policy = self._compute_policy()
+            if not policy.throttled or time.monotonic() - start >= self.MAX_DEFER_SECONDS:
+                break
+
+            if not deferred:
+                self._logger.info("Deferring a non-urgent encode: %s", policy.reason)
+                deferred = True
+            time.sleep(self.DEFER_POLL_SECONDS)
+
+        deferred_seconds = round(time.monotonic() - start, 1) if deferred else 0.0
+        with self._lock:
+            self._stats["deferred"] += int(deferred)
+            self._stats["deferred_seconds"] += deferred_seconds
+
+        return deferred_seconds
+
+    def wrap_command(self, cmd: List[str], policy: EncodePolicy) -> List[str]:
+        """Prefix a command with nice / ionice according to the policy"""
+        prefix = []
+
+        nice_path = self._get_nice_path()
+        if nice_path:
+            prefix += [nice_path, "-n", str(policy.nice)]
+
+        ionice_path = self._get_ionice_path()
+        if ionice_path:
+            prefix += [ionice_path, "-c", str(policy.ionice_class)]
+            if policy.ionice_class == 2:
+                prefix += ["-n", "7"]
+
+        return prefix + cmd
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {**self._stats, "cpu_pressure": self._read_cpu_pressure(), "load_per_cpu": self._read_load()}
+
+    def get_pressure(self) -> str:
+        """Return why the host is at risk of starving OctoPrint (high CPU pressure or load), or "" if it isn't"""
+        cpu_pressure = self._read_cpu_pressure()
+        if cpu_pressure is not None:
+            return f"CPU pressure {cpu_pressure}%" if cpu_pressure > self.MAX_CPU_PRESSURE else ""
+
+        load_per_cpu = self._read_load()
+        if load_per_cpu is not None and load_per_cpu > self.MAX_LOAD_PER_CPU:
+            return f"load {load_per_cpu:.2f} per CPU"
+        return ""
+
+    def _compute_policy(self) -> EncodePolicy:
+        cpu_count = max(1, self._get_cpu_count())
+
+        try:
+            printer_state = self._get_printer_state()
+        except Exception:
+            printer_state = PRINTER_PRINTING  # Be conservative
+
+        if printer_state == PRINTER_IDLE:
+            return EncodePolicy(printer_state, nice=10, ionice_class=2, threads=max(1, cpu_count - 1))
+
+        if printer_state == PRINTER_PAUSED:
+            return EncodePolicy(printer_state, nice=15, ionice_class=2, threads=max(1, cpu_count // 2))
+
+        policy = EncodePolicy(printer_state, nice=19, ionice_class=3, threads=max(1, (cpu_count - 1) // 2))
+
+        pressure = self.get_pressure()
+        if pressure:
+            policy.reason = f"{pressure} while printing"
+            policy.throttled = True
+            policy.threads = 1
+
+        return policy
+
+    @staticmethod
+    def _read_cpu_pressure() -> Optional[float]:
+        """Read the "some avg10" CPU pressure stall information (Linux >= 4.20), if available"""
+        try:
+            with open("/proc/pressure/cpu") as f:
+                for line in f:
+                    if line.startswith("some"):
+                        fields = dict(field.split("=") for field in line.split()[1:])
+                        return float(fields["avg10"])
+        except (OSError, KeyError, ValueError):
+            pass
+        return None
+
+    def _read_load(self) -> Optional[float]:
+        try:
+            return round(os.getloadavg()[0] / max(1, self._get_cpu_count()), 2)
+        except (AttributeError, OSError):
+            return None
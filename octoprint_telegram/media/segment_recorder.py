@@ -0,0 +1,179 @@
+import csv
+import logging
+import math
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+STREAM_CODEC_REGEX = re.compile(r"Stream #\d+:\d+.*?: Video: (\w+)")
+STREAM_RESOLUTION_REGEX = re.compile(r"\b(\d{2,5})x(\d{2,5})\b")
+
+
+class SegmentRecorder:
+    """
+    Continuously records a webcam stream into a bounded ring of short segments.
+
+    The stream is copied without re-encoding into SEGMENT_SECONDS long matroska segments, which ffmpeg's segment
+    muxer overwrites in a circle. The muxer also keeps a list of the latest complete segments, so that a clip of
+    what happened before a command or an event can be built immediately by concatenating them.
+    ffmpeg is started through wrap_command, if given (e.g. to run it with nice / ionice).
+    """
+
+    SEGMENT_SECONDS = 2
+    LIST_FILENAME = "segments.csv"
+    RESTART_DELAY = 10
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        ffmpeg_path: str,
+        stream_url: str,
+        directory: str,
+        buffer_seconds=30,
+        wrap_command: Optional[Callable[[List[str]], List[str]]] = None,
+    ):
+        self._logger = logger.getChild("SegmentRecorder")
+        self.ffmpeg_path = ffmpeg_path
+        self.stream_url = stream_url
+        self.directory = directory
+        self.codec: Optional[str] = None
+        self.resolution: Optional[Tuple[int, int]] = None  # (width, height) of the input stream
+
+        self._list_size = max(1, math.ceil(buffer_seconds / self.SEGMENT_SECONDS))
+        self._wrap_command = wrap_command
+        self._lock = threading.Lock()  # Guards starting ffmpeg against stop()
+        self._process: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="TelegramSegmentRecorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread = None
+
+        # Once the stop event is set, no new ffmpeg is started (see _run): the current one is the last one
+        with self._lock:
+            process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_recent_segments(self, duration) -> Tuple[List[str], float]:
+        """
+        Get the paths of the latest complete segments covering at least the given duration, oldest first, and the
+        number of seconds they cover (up to SEGMENT_SECONDS more than duration: trim the beginning to get the exact
+        duration).
+
+        Returns an empty list if the recorder is not running, is lagging behind or hasn't buffered enough yet.
+        """
+        list_path = os.path.join(self.directory, self.LIST_FILENAME)
+
+        try:
+            # The list is rewritten each time a segment is completed: if it's old, ffmpeg is stuck
+            if time.time() - os.path.getmtime(list_path) > 2 * self.SEGMENT_SECONDS + 5:
+                return [], 0.0
+
+            with open(list_path, newline="") as f:
+                entries = [row for row in csv.reader(f) if len(row) >= 3]
+        except (OSError, csv.Error):
+            return [], 0.0
+
+        segments = []
+        buffered = 0.0
+        for filename, start, end in reversed([entry[:3] for entry in entries]):
+            segment_path = os.path.join(self.directory, filename)
+            if not os.path.isfile(segment_path):
+                break
+            segments.insert(0, segment_path)
+            buffered += float(end) - float(start)
+            if buffered >= duration:
+                return segments, buffered
+
+        return [], 0.0
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            cmd = [
+                self.ffmpeg_path,
+                "-nostdin",
+                "-nostats",
+                "-y",
+                # Give up if the stream stops sending data
+                "-rw_timeout", "15000000",
+                "-i", self.stream_url,
+                "-map", "0:v",
+                "-c", "copy",
+                "-f", "segment",
+                "-segment_time", str(self.SEGMENT_SECONDS),
+                "-segment_format", "matroska",
+                "-reset_timestamps", "1",
+                "-segment_list", os.path.join(self.directory, self.LIST_FILENAME),
+                "-segment_list_type", "csv",
+                "-segment_list_size", str(self._list_size),
+                # Leave some spare segments, so that listed ones aren't overwritten while a clip is being built
+                "-segment_wrap", str(self._list_size + 3),
+                os.path.join(self.directory, "segment_%03d.mkv"),
+            ]  # fmt: skip
+
+            if self._wrap_command:
+                cmd = self._wrap_command(cmd)
+
+            self._logger.debug("Starting segment recorder: %s", cmd)
+
+            try:
+                with self._lock:
+                    if self._stop_event.is_set():
+                        return
+                    process = self._process = subprocess.Popen(
+                        cmd,
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.PIPE,
+                        universal_newlines=True,
+                        errors="replace",
+                    )
+
+                # Keep draining stderr, looking for the codec and the resolution of the input stream
+                for line in process.stderr:
+                    if self.codec is None:
+                        match = STREAM_CODEC_REGEX.search(line)
+                        if match:
+                            self.codec = match.group(1)
+                            resolution_match = STREAM_RESOLUTION_REGEX.search(line, match.end())
+                            if resolution_match:
+                                self.resolution = (int(resolution_match.group(1)), int(resolution_match.group(2)))
+                            self._logger.debug(
+                                "Stream %s has codec %s, resolution %s", self.stream_url, self.codec, self.resolution
+                            )
+
+                return_code = process.wait()
+                if not self._stop_event.is_set():
+                    self._logger.warning(
+                        "Segment recorder for %s exited with code %s, restarting it in %ss",
+                        self.stream_url,
+                        return_code,
+                        self.RESTART_DELAY,
+                    )
+            except Exception:
+                self._logger.exception("Caught an exception running the segment recorder for %s", self.stream_url)
+
+            self._stop_event.wait(self.RESTART_DELAY)
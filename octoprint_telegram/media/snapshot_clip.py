@@ -0,0 +1,121 @@
+import io
+from typing import IO, Callable, Optional
+
+from PIL import Image
+
+from ..utils import ImageUtils
+from .avi_writer import MjpegAviWriter
+from .gif_writer import AnimatedGifWriter
+
+CLIP_FORMAT_GIF = "gif"
+CLIP_FORMAT_AVI = "avi"
+
+
+class SnapshotClipBuilder:
+    """
+    Builds a clip out of webcam snapshots, without ffmpeg: an animated GIF, or a Motion JPEG AVI.
+
+    Frames are written to fp one at a time, as they are taken: each one is decoded (in draft mode for JPEG
+    sources), downscaled, transformed and encoded right away, so that memory usage stays bounded to a single
+    frame whatever the duration of the clip and the resolution of the webcam. GIF frames are reduced to a 256
+    colors palette, AVI frames are JPEG images: much cheaper to encode, at the cost of bigger files.
+
+    The image work (preparing frames) is done by run, e.g. ImageWorkerPool.run to do it in worker processes.
+    By default it's done in the calling thread. Call close() once all frames were added.
+    """
+
+    MAX_FRAMES = 120
+
+    def __init__(
+        self,
+        fp: IO[bytes],
+        fps: float = 2,
+        max_dimension: int = 480,
+        clip_format: str = CLIP_FORMAT_GIF,
+        run: Optional[Callable] = None,
+    ):
+        if clip_format not in (CLIP_FORMAT_GIF, CLIP_FORMAT_AVI):
+            raise ValueError(f"Unknown clip format {clip_format}")
+
+        self.fps = max(0.1, fps)
+        self.max_dimension = max(16, max_dimension)
+        self.clip_format = clip_format
+        self._run = run or (lambda fn, *args, **kwargs: fn(*args, **kwargs))
+        self._writer = (
+            MjpegAviWriter(fp, self.fps) if clip_format == CLIP_FORMAT_AVI else AnimatedGifWriter(fp, self.fps)
+        )
+
+    @property
+    def frame_count(self) -> int:
+        return self._writer.frame_count
+
+    def add_frame(self, image_content: bytes, flipH=False, flipV=False, rotate=False):
+        if self.frame_count >= self.MAX_FRAMES:
+            raise ValueError(f"A clip can't have more than {self.MAX_FRAMES} frames")
+
+        self._writer.write_frame(
+            self._run(
+                SnapshotClipBuilder.prepare_frame,
+                image_content,
+                self.max_dimension,
+                flipH,
+                flipV,
+                rotate,
+                self._writer.size,
+                self.clip_format,
+            )
+        )
+
+    def close(self):
+        """Finish writing the clip. Raises ValueError if it has no frames."""
+        self._writer.close()
+
+    @staticmethod
+    def prepare_frame(
+        image_content: bytes,
+        max_dimension: int,
+        flipH=False,
+        flipV=False,
+        rotate=False,
+        size=None,
+        clip_format=CLIP_FORMAT_GIF,
+    ) -> bytes:
+        """
+        Decode, downscale and transform a snapshot into a clip frame, encoded as a single image GIF or as a JPEG.
+        If size is given, the frame is resized to it (all the frames of a clip must have the same size).
+        """
+        with io.BytesIO(image_content) as image_buffer:
+            with Image.open(image_buffer) as image:
+                target_size = ImageUtils.get_target_size(image.size, max_dimension)
+                if size:
+                    target_size = tuple(size[::-1] if rotate else size)  # size is the one after rotating
+
+                # JPEG snapshots that are fine as they are go in AVI clips untouched
+                if (
+                    clip_format == CLIP_FORMAT_AVI
+                    and image.format == "JPEG"
+                    and image.size == target_size
+                    and not (flipH or flipV or rotate)
+                ):
+                    return image_content
+
+                if image.format == "JPEG":
+                    image.draft("RGB", target_size)
+
+                frame = image.convert("RGB")
+                if frame.size != target_size:
+                    frame = frame.resize(target_size, Image.LANCZOS)
+
+        if flipH:
+            frame = frame.transpose(Image.FLIP_LEFT_RIGHT)
+        if flipV:
+            frame = frame.transpose(Image.FLIP_TOP_BOTTOM)
+        if rotate:
+            frame = frame.transpose(Image.ROTATE_90)
+
+        with io.BytesIO() as output:
+            if clip_format == CLIP_FORMAT_AVI:
+                frame.save(output, format="JPEG", quality=80)
+            else:
+                frame.quantize(colors=256, method=Image.FASTOCTREE).save(output, format="GIF")
+            return output.getvalue()
@@ -0,0 +1,94 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from ..utils import ImageUtils
+
+
+class ThumbnailCache:
+    """
+    Print thumbnails read from storage, kept in memory by content hash.
+
+    A file is read again only when its modification time or size change, and files with the same content (e.g. the
+    thumbnails of copies of a gcode) share a single entry. Thumbnails bigger than max_dimension are downscaled once,
+    when read, since Telegram would downscale them anyway. The cache is bounded by the total size of its entries,
+    evicting the least recently used ones.
+    """
+
+    # Longest side of the photos shown by Telegram
+    MAX_DIMENSION = 1280
+
+    def __init__(self, logger: logging.Logger, max_bytes: int = 8 * 1024 * 1024, max_dimension: int = MAX_DIMENSION):
+        self._logger = logger.getChild("ThumbnailCache")
+        self.max_bytes = max_bytes
+        self.max_dimension = max_dimension
+        self._lock = threading.Lock()
+        self._digests = {}  # (path, mtime, size) -> content digest
+        self._contents = OrderedDict()  # content digest -> thumbnail, least recently used first
+        self._size = 0
+        self._stats = {"hits": 0, "reads": 0, "evictions": 0}
+
+    def get(self, path: str) -> bytes:
+        """The thumbnail stored at path, downscaled if needed"""
+        stat = os.stat(path)
+        file_key = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            digest = self._digests.get(file_key)
+            if digest in self._contents:
+                self._contents.move_to_end(digest)
+                self._stats["hits"] += 1
+                return self._contents[digest]
+
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+
+        with self._lock:
+            self._stats["reads"] += 1
+            thumbnail = self._contents.get(digest)
+        if thumbnail is None:
+            thumbnail = self._downscale(content)
+
+        with self._lock:
+            self._digests[file_key] = digest
+            if digest not in self._contents:
+                self._contents[digest] = thumbnail
+                self._size += len(thumbnail)
+            self._contents.move_to_end(digest)
+            self._evict()
+
+        return thumbnail
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {**self._stats, "entries": len(self._contents), "bytes": self._size}
+
+    def _downscale(self, content: bytes) -> bytes:
+        try:
+            with io.BytesIO(content) as image_buffer:
+                with Image.open(image_buffer) as image:
+                    target_size = ImageUtils.get_target_size(image.size, self.max_dimension)
+                    if target_size == image.size:
+                        return content
+
+                    # PNG keeps the transparency of the thumbnails
+                    with io.BytesIO() as output:
+                        image.resize(target_size, Image.LANCZOS).save(output, format="PNG", optimize=True)
+                        return output.getvalue()
+        except Exception:
+            self._logger.exception("Caught an exception downscaling a thumbnail, sending it as it is")
+            return content
+
+    def _evict(self):
+        # The entry just added is kept even if alone it exceeds max_bytes
+        while self._size > self.max_bytes and len(self._contents) > 1:
+            digest, thumbnail = self._contents.popitem(last=False)
+            self._size -= len(thumbnail)
+            self._stats["evictions"] += 1
+            self._digests = {key: value for key, value in self._digests.items() if value != digest}
@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+class WebcamUnavailableError(Exception):
+    """Raised when a request to a webcam is skipped because the webcam is known to be dead"""
+
+
+class WebcamHealth:
+    """Health state of a single webcam url (snapshot or stream)"""
+
+    CLOSED = "closed"  # Healthy, requests are allowed
+    OPEN = "open"  # Known dead, requests are skipped until retry_at
+    HALF_OPEN = "half_open"  # A single trial request is in flight
+
+    def __init__(self, kind: str, url: str):
+        self.kind = kind
+        self.url = url
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = 0.0
+        self.retry_at = 0.0
+        # Smoothed latency and latency variation, estimated like TCP's SRTT / RTTVAR
+        self.latency = None
+        self.latency_var = 0.0
+        self.last_success = None
+        self.last_failure = None
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "url": self.url,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "latency": self.latency,
+            "latency_var": self.latency_var,
+            "retry_in": max(0.0, self.retry_at - time.monotonic()) if self.state == self.OPEN else 0.0,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+        }
+
+
+class WebcamHealthTracker:
+    """
+    Tracks the health of webcams and acts as a circuit breaker for them.
+
+    After FAILURE_THRESHOLD consecutive failures a webcam is marked as dead (breaker open), and requests to it are
+    skipped immediately instead of waiting for a full timeout. Dead webcams are probed in background, with an
+    exponentially increasing cooldown; once the cooldown expires, a single request is let through (half-open) and
+    its outcome decides whether the webcam is healthy again.
+
+    Latencies of successful requests are used to compute adaptive timeouts for webcams with a history of slow or
+    irregular responses.
+    """
+
+    FAILURE_THRESHOLD = 2
+    MIN_COOLDOWN = 30.0
+    MAX_COOLDOWN = 600.0
+    PROBE_INTERVAL = 10.0
+    MIN_TIMEOUT = 3.0
+    LATENCY_ALPHA = 0.125
+    LATENCY_BETA = 0.25
+
+    def __init__(self, logger: logging.Logger, probe: Optional[Callable[[str, str], bool]] = None):
+        self._logger = logger.getChild("WebcamHealthTracker")
+        self._probe = probe
+        self._lock = threading.Lock()
+        self._health: Dict[str, WebcamHealth] = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _key(kind: str, url: str) -> str:
+        return f"{kind}:{url}"
+
+    def _get(self, kind: str, url: str) -> WebcamHealth:
+        key = self._key(kind, url)
+        health = self._health.get(key)
+        if health is None:
+            health = self._health[key] = WebcamHealth(kind, url)
+        return health
+
+    def allow_request(self, kind: str, url: str) -> bool:
+        """Return whether a request to the webcam url should be attempted"""
+        with self._lock:
+            health = self._get(kind, url)
+
+            if health.state == WebcamHealth.CLOSED:
+                return True
+
+            if health.state == WebcamHealth.OPEN and time.monotonic() >= health.retry_at:
+                # Let a single trial request through
+                health.state = WebcamHealth.HALF_OPEN
+                return True
+
+            return False
+
+    def get_timeout(self, kind: str, url: str, configured_timeout: float) -> float:
+        """
+        Get the timeout to use for a request to the webcam url.
+
+        Until enough history is available the configured timeout is used. Then the timeout adapts to the observed
+        latency (smoothed latency + 4 * latency variation, as TCP does for retransmission timeouts), without ever
+        exceeding the configured timeout.
+        """
+        with self._lock:
+            health = self._health.get(self._key(kind, url))
+            if health is None or health.latency is None:
+                return configured_timeout
+
+            adaptive_timeout = max(self.MIN_TIMEOUT, 2 * (health.latency + 4 * health.latency_var))
+            return min(configured_timeout, adaptive_timeout)
+
+    def record_success(self, kind: str, url: str, latency: Optional[float] = None):
+        with self._lock:
+            health = self._get(kind, url)
+
+            if health.state != WebcamHealth.CLOSED:
+                self._logger.info("Webcam %s is available again", url)
+
+            health.state = WebcamHealth.CLOSED
+            health.consecutive_failures = 0
+            health.cooldown = 0.0
+            health.last_success = time.time()
+
+            if latency is not None:
+                if health.latency is None:
+                    health.latency = latency
+                    health.latency_var = latency / 2
+                else:
+                    health.latency_var = (1 - self.LATENCY_BETA) * health.latency_var + self.LATENCY_BETA * abs(
+                        health.latency - latency
+                    )
+                    health.latency = (1 - self.LATENCY_ALPHA) * health.latency + self.LATENCY_ALPHA * latency
+
+    def record_failure(self, kind: str, url: str):
+        with self._lock:
+            health = self._get(kind, url)
+            health.consecutive_failures += 1
+            health.last_failure = time.time()
+
+            if health.state == WebcamHealth.HALF_OPEN or health.consecutive_failures >= self.FAILURE_THRESHOLD:
+                health.cooldown = min(self.MAX_COOLDOWN, max(self.MIN_COOLDOWN, health.cooldown * 2))
+                health.retry_at = time.monotonic() + health.cooldown
+                if health.state != WebcamHealth.OPEN:
+                    self._logger.warning(
+                        "Webcam %s failed %s times in a row, skipping it for %ss",
+                        url,
+                        health.consecutive_failures,
+                        health.cooldown,
+                    )
+                health.state = WebcamHealth.OPEN
+
+    def get_status(self) -> Dict[str, dict]:
+        with self._lock:
+            return {key: health.to_dict() for key, health in self._health.items()}
+
+    def start(self):
+        if self._thread is not None or self._probe is None:
+            return
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._probe_loop, name="WebcamHealthProbe", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread = None
+
+    def _probe_loop(self):
+        while not self._stop_event.wait(self.PROBE_INTERVAL):
+            with self._lock:
+                due = [
+                    (health.kind, health.url)
+                    for health in self._health.values()
+                    if health.state == WebcamHealth.OPEN and time.monotonic() >= health.retry_at
+                ]
+
+            for kind, url in due:
+                if not self.allow_request(kind, url):
+                    continue
+
+                self._logger.debug("Probing dead webcam %s", url)
+                start = time.monotonic()
+                try:
+                    ok = self._probe(kind, url)
+                except Exception:
+                    self._logger.debug("Probe of webcam %s raised an exception", url, exc_info=True)
+                    ok = False
+
+                if ok:
+                    self.record_success(kind, url, time.monotonic() - start)
+                else:
+                    self.record_failure(kind, url)
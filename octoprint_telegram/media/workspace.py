@@ -0,0 +1,192 @@
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+
+class WorkspaceFullError(OSError):
+    """Raised when a new file can't be allocated without exceeding the workspace quota"""
+
+
+class _WorkspaceFile:
+    def __init__(self, path: str):
+        self.path = path
+        self.refcount = 1
+        self.last_used = time.monotonic()
+        self.warned = False  # Whether it was reported as never released
+
+
+class MediaWorkspace:
+    """
+    A managed directory for temporary media files (gifs, concat lists...).
+
+    Each job gets its own uniquely named file, so overlapping jobs never overwrite each other. A file is referenced
+    by the job that allocated it and by anyone who acquires it (e.g. an upload in flight), and is never deleted while
+    referenced. discard() drops a reference and deletes the file once unreferenced, release() drops a reference but
+    keeps the file until it gets evicted.
+
+    The disk usage is bounded by quota_bytes: before a new file is allocated, files left over by crashes (not tracked
+    by the workspace) and then released files are evicted, least recently used first. If the referenced files alone
+    exceed the quota, new allocations are refused with WorkspaceFullError. A background thread periodically removes
+    unreferenced and untracked files older than max_age.
+    """
+
+    CLEANUP_INTERVAL = 60
+
+    def __init__(self, logger: logging.Logger, directory: str, quota_bytes=256 * 1024 * 1024, max_age=15 * 60):
+        self._logger = logger.getChild("MediaWorkspace")
+        self.directory = directory
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._files: "OrderedDict[str, _WorkspaceFile]" = OrderedDict()  # Least recently used first
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Wipe the workspace and start the periodic cleanup"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._cleanup_loop, name="TelegramMediaWorkspace", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread = None
+
+    def allocate(self, filename: str) -> str:
+        """
+        Reserve a new unique path for a file, based on filename. The caller holds a reference to it, to be dropped
+        with discard() (or release() to keep the file until evicted).
+
+        Raises:
+            WorkspaceFullError: If the files still referenced exceed the quota
+        """
+        base, ext = os.path.splitext(os.path.basename(filename))
+        path = os.path.join(self.directory, f"{base}_{uuid.uuid4().hex[:12]}{ext}")
+
+        with self._lock:
+            used_bytes = self._evict(self.quota_bytes)
+            if used_bytes >= self.quota_bytes:
+                raise WorkspaceFullError(
+                    f"Media workspace full: {used_bytes} bytes referenced, quota is {self.quota_bytes} bytes"
+                )
+            self._files[path] = _WorkspaceFile(path)
+
+        return path
+
+    def acquire(self, path: str) -> bool:
+        """Add a reference to a workspace file. Returns False if the path doesn't belong to the workspace."""
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is None:
+                return False
+            entry.refcount += 1
+            entry.last_used = time.monotonic()
+            self._files.move_to_end(path)
+            return True
+
+    def release(self, path: str):
+        """Drop a reference to a workspace file, keeping it until evicted once unreferenced"""
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is None:
+                return
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.last_used = time.monotonic()
+            self._files.move_to_end(path)
+
+    def discard(self, path: str):
+        """Drop a reference to a workspace file, deleting it right away once unreferenced"""
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is None:
+                return
+            entry.refcount = max(0, entry.refcount - 1)
+            if entry.refcount:
+                return
+            del self._files[path]
+
+        self._remove(path)
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "referenced": sum(1 for entry in self._files.values() if entry.refcount),
+                "bytes": sum(size for _, size, _ in self._list_files()),
+                "quota_bytes": self.quota_bytes,
+            }
+
+    def _list_files(self) -> List[Tuple[str, int, float]]:
+        """List the (path, size, mtime) of the files in the workspace directory"""
+        files = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+        except FileNotFoundError:
+            pass
+        return files
+
+    def _evict(self, max_bytes: int, max_age=None) -> int:
+        """
+        Delete unreferenced files until the workspace uses less than max_bytes, and those older than max_age if
+        given: untracked files first (oldest first), then released ones (least recently used first). Must be called
+        holding the lock.
+
+        Returns:
+            int: The bytes still used
+        """
+        files = self._list_files()
+        used_bytes = sum(size for _, size, _ in files)
+        sizes: Dict[str, int] = {path: size for path, size, _ in files}
+
+        untracked = sorted((mtime, path) for path, _, mtime in files if path not in self._files)
+        candidates = [(path, time.time() - mtime) for mtime, path in untracked]
+        now = time.monotonic()
+        candidates += [(path, now - entry.last_used) for path, entry in self._files.items() if not entry.refcount]
+
+        for path, age in candidates:
+            if used_bytes < max_bytes and (max_age is None or age <= max_age):
+                continue
+            self._logger.debug("Evicting %s", path)
+            self._files.pop(path, None)
+            self._remove(path)
+            used_bytes -= sizes.get(path, 0)
+
+        return used_bytes
+
+    def _cleanup_loop(self):
+        while not self._stop_event.wait(self.CLEANUP_INTERVAL):
+            try:
+                with self._lock:
+                    self._evict(self.quota_bytes, self.max_age)
+
+                    # Referenced files are never deleted, but jobs last a few minutes at most
+                    now = time.monotonic()
+                    for path, entry in self._files.items():
+                        if entry.refcount and not entry.warned and now - entry.last_used > self.max_age:
+                            self._logger.warning("%s is still referenced after %ss", path, self.max_age)
+                            entry.warned = True
+            except Exception:
+                self._logger.exception("Caught an exception cleaning up the media workspace")
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            self._logger.exception("Caught an exception removing %s", path)
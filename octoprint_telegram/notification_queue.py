@@ -0,0 +1,82 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+
+class NotificationQueue:
+    """
+    Runs event notifications on a dedicated thread, in the order the events were received.
+
+    Building a notification may take long (webcam captures, ffmpeg, uploads to Telegram), so event handlers only
+    enqueue a snapshot of the event and return right away, without holding up the OctoPrint thread that
+    dispatched it (e.g. the event bus, or the printer communication thread for gcode hooks).
+    """
+
+    def __init__(self, logger: logging.Logger, handler: Callable[[str, dict, dict], None], max_size=100):
+        self._logger = logger.getChild("NotificationQueue")
+        self._handler = handler
+        self._queue = queue.Queue(maxsize=max_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {"processed": 0, "dropped": 0, "failed": 0, "last_lag": 0.0, "max_lag": 0.0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="TelegramNotifications", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the worker once the notifications already queued are sent, waiting for them up to timeout seconds"""
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(max(0.0, deadline - time.monotonic()) if deadline is not None else None)
+        if thread.is_alive():
+            self._logger.warning("Gave up waiting for %s pending notifications", self._queue.qsize())
+
+    def put(self, event: str, payload: dict, kwargs: dict) -> bool:
+        """Enqueue a notification without blocking. Returns False if it was dropped because the queue is full."""
+        try:
+            self._queue.put_nowait((time.monotonic(), event, payload, kwargs))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            self._logger.warning("Notification queue full, dropped event %s", event)
+            return False
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {**self._stats, "depth": self._queue.qsize(), "running": self._thread is not None}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            enqueued_at, event, payload, kwargs = item
+            lag = time.monotonic() - enqueued_at
+            if lag > 5:
+                self._logger.debug("Event %s waited %.1fs in the notification queue", event, lag)
+
+            failed = False
+            try:
+                self._handler(event, payload, kwargs)
+            except Exception:
+                failed = True
+                self._logger.exception("Caught an exception handling event %s", event)
+
+            with self._lock:
+                self._stats["processed"] += 1
+                self._stats["failed"] += int(failed)
+                self._stats["last_lag"] = round(lag, 3)
+                self._stats["max_lag"] = round(max(self._stats["max_lag"], lag), 3)
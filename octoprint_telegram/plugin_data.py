@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Set
+
+
+class PluginDataProvider:
+    """
+    Last data fetched from a third-party plugin, refreshed in the background.
+
+    Reading the data never waits for the plugin: a stale value triggers a refresh in the background and is served
+    as it is. Only when no data was ever fetched, the reader may wait for the first refresh, up to a given time.
+    """
+
+    def __init__(self, logger: logging.Logger, name: str, fetch: Callable[[], Optional[dict]], interval: float):
+        self._logger = logger.getChild(name)
+        self.name = name
+        self.interval = interval
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._value: Optional[dict] = None
+        self._updated_at: Optional[float] = None
+        self._attempted_at: Optional[float] = None
+        self._read_at: Optional[float] = None
+        self._refreshed = None  # threading.Event of the refresh in progress, if any
+        self._stats = {"refreshes": 0, "errors": 0, "last_duration": 0.0}
+
+    def get(self, wait: float = 0) -> dict:
+        """The last data fetched, refreshing it in the background if older than interval seconds"""
+        self._read_at = time.monotonic()
+        if self.is_due():
+            self.refresh()
+        refreshed = self._refreshed
+        if self._value is None and refreshed is not None and wait > 0:
+            refreshed.wait(wait)
+        return self._value or {}
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the data was last updated, or None if it was never fetched"""
+        updated_at = self._updated_at
+        return time.monotonic() - updated_at if updated_at is not None else None
+
+    def is_due(self) -> bool:
+        """Whether a refresh is due, i.e. the last attempt is older than interval seconds (failed ones included)"""
+        attempted_at = self._attempted_at
+        return attempted_at is None or time.monotonic() - attempted_at >= self.interval
+
+    def was_read_recently(self) -> bool:
+        """Whether the data was read within the last interval seconds"""
+        read_at = self._read_at
+        return read_at is not None and time.monotonic() - read_at < self.interval
+
+    def update(self, values: dict):
+        """Merge into the data values known from elsewhere, e.g. from the payload of a plugin event"""
+        with self._lock:
+            self._value = {**(self._value or {}), **values}
+            self._updated_at = time.monotonic()
+
+    def refresh(self) -> threading.Event:
+        """Fetch the data in the background, unless already being fetched. Returns an event set once done."""
+        with self._lock:
+            if self._refreshed is not None:
+                return self._refreshed
+            self._refreshed = refreshed = threading.Event()
+            self._attempted_at = time.monotonic()
+        threading.Thread(target=self._run_refresh, name=f"TelegramPluginData-{self.name}", daemon=True).start()
+        return refreshed
+
+    def get_status(self) -> dict:
+        age = self.age
+        with self._lock:
+            return {**self._stats, "age": round(age, 1) if age is not None else None, "interval": self.interval}
+
+    def _run_refresh(self):
+        started = time.monotonic()
+        failed = False
+        try:
+            value = self._fetch()
+            if value is not None:
+                with self._lock:
+                    self._value = value
+                    self._updated_at = time.monotonic()
+        except Exception as e:
+            failed = True
+            self._logger.debug("Can't refresh data: %s", e)
+        finally:
+            with self._lock:
+                refreshed, self._refreshed = self._refreshed, None
+                self._stats["refreshes"] += 1
+                self._stats["errors"] += int(failed)
+                self._stats["last_duration"] = round(time.monotonic() - started, 3)
+            refreshed.set()
+
+
+class PluginDataProviders:
+    """
+    The third-party plugin data providers, refreshed at their own interval while active (i.e. while printing).
+
+    Only the wanted providers (i.e. those whose data the notification templates use, see set_wanted()) and those
+    read within their last interval are refreshed: the others, and all of them when not active, are refreshed
+    only when read or when their plugins fire events.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger.getChild("PluginDataProviders")
+        self._providers: Dict[str, PluginDataProvider] = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._wanted: Set[str] = set()
+        self.active = False
+
+    def add(self, name: str, fetch: Callable[[], Optional[dict]], interval: float) -> PluginDataProvider:
+        provider = PluginDataProvider(self._logger, name, fetch, interval)
+        self._providers[name] = provider
+        return provider
+
+    def __getitem__(self, name: str) -> PluginDataProvider:
+        return self._providers[name]
+
+    def set_wanted(self, names: Iterable[str]):
+        """Set the names of the providers to keep refreshed while active. Unknown names are ignored."""
+        self._wanted = set(names)
+
+    def set_active(self, active: bool):
+        if active and not self.active:
+            # Don't wait for the first interval to get the data of the new print
+            for name, provider in self._providers.items():
+                if self._is_needed(name, provider):
+                    provider.refresh()
+        self.active = active
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="TelegramPluginData", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._thread = None
+
+    def get_status(self) -> dict:
+        return {
+            "active": self.active,
+            "wanted": sorted(self._wanted & set(self._providers)),
+            **{name: provider.get_status() for name, provider in self._providers.items()},
+        }
+
+    def _run(self):
+        while not self._stop_event.wait(1):
+            if not self.active:
+                continue
+            for name, provider in self._providers.items():
+                if provider.is_due() and self._is_needed(name, provider):
+                    provider.refresh()
+
+    def _is_needed(self, name: str, provider: PluginDataProvider) -> bool:
+        return name in self._wanted or provider.was_read_recently()
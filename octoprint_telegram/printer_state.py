@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+from octoprint.printer import PrinterCallback
+
+# Keys of the pushed printer data kept in the snapshot, matching the output of PrinterInterface.get_current_data()
+_CURRENT_DATA_KEYS = ("state", "job", "progress", "currentZ", "offsets", "resends")
+
+_PRINTING_FLAGS = {"printing": True, "paused": False, "pausing": False, "resuming": False, "cancelling": False}
+_PAUSED_FLAGS = {"printing": False, "paused": True, "pausing": False, "resuming": False, "cancelling": False}
+_IDLE_FLAGS = {
+    "printing": False,
+    "paused": False,
+    "pausing": False,
+    "resuming": False,
+    "cancelling": False,
+    "finishing": False,
+}
+
+# State (text, flags) a printer is in right after each job event
+_JOB_EVENT_STATES = {
+    "PrintStarted": ("Printing", _PRINTING_FLAGS),
+    "PrintResumed": ("Printing", _PRINTING_FLAGS),
+    "PrintPaused": ("Paused", _PAUSED_FLAGS),
+    "PrintDone": ("Operational", _IDLE_FLAGS),
+    "PrintFailed": ("Operational", _IDLE_FLAGS),
+    "PrintCancelled": ("Operational", _IDLE_FLAGS),
+}
+
+
+class PrinterStateCache(PrinterCallback):
+    """
+    Latest printer state, pushed by OctoPrint to this printer callback.
+
+    get_current_data() and get_current_temperatures() build a deep copy of the whole state at each call. Here
+    instead, every push replaces the snapshot as a whole (copy-on-write): readers just take the current reference,
+    with no locks and no copies, and always see a consistent state. Snapshots are shared, so they must not be
+    modified by readers.
+    Until the first push, reads fall back to the printer getters.
+
+    Pushes lag behind job events: on_job_event() patches the snapshot with what the event payload tells (state and
+    file) and marks it stale until the next push. get_fresh_data() waits for that push, to be called off the event
+    dispatch thread.
+    """
+
+    FRESH_DATA_TIMEOUT = 2
+
+    def __init__(self, logger: logging.Logger, printer):
+        self._logger = logger.getChild("PrinterStateCache")
+        self._printer = printer
+        self._data: Optional[dict] = None
+        self._temperatures: Optional[dict] = None
+        self._pushed = threading.Condition()
+        self._stale_pushes: Optional[int] = None  # Value of pushes when the snapshot became stale
+        self.pushes = 0
+
+    def get_data(self) -> dict:
+        """Snapshot of the printer data, in the format of PrinterInterface.get_current_data()"""
+        data = self._data
+        return data if data is not None else self._printer.get_current_data()
+
+    def get_fresh_data(self, timeout: Optional[float] = None) -> dict:
+        """
+        Like get_data(), but if a job event made the snapshot stale, wait up to timeout seconds for the next push,
+        and read the printer data from the printer if it doesn't come. Blocks, not for the event dispatch thread.
+        """
+        deadline = time.monotonic() + (self.FRESH_DATA_TIMEOUT if timeout is None else timeout)
+        with self._pushed:
+            while self._stale_pushes is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._logger.debug("No printer data pushed in time, reading it from the printer")
+                    return self._printer.get_current_data()
+                self._pushed.wait(remaining)
+        return self.get_data()
+
+    def get_temperatures(self) -> dict:
+        """Snapshot of the temperatures, in the format of PrinterInterface.get_current_temperatures()"""
+        temperatures = self._temperatures
+        return temperatures if temperatures is not None else self._printer.get_current_temperatures()
+
+    def get_completion(self) -> float:
+        return ((self.get_data().get("progress") or {}).get("completion")) or 0.0
+
+    def get_status(self) -> dict:
+        return {
+            "pushes": self.pushes,
+            "has_data": self._data is not None,
+            "has_temperatures": self._temperatures is not None,
+            "stale": self._stale_pushes is not None,
+        }
+
+    def on_job_event(self, event: str, payload: Optional[dict]):
+        """Update the snapshot after a job event (see _JOB_EVENT_STATES), until the next push brings the full state"""
+        try:
+            with self._pushed:
+                data = self._data
+                if data is not None:
+                    data = dict(data)
+                    text, flags = _JOB_EVENT_STATES.get(event, (None, {}))
+                    if text:
+                        state = dict(data.get("state") or {})
+                        state["text"] = text
+                        state["flags"] = {**(state.get("flags") or {}), **flags}
+                        data["state"] = state
+
+                    payload = payload or {}
+                    if payload.get("path"):
+                        job = dict(data.get("job") or {})
+                        job_file = dict(job.get("file") or {})
+                        job_file.update(
+                            {key: payload[key] for key in ("name", "path", "origin", "size") if key in payload}
+                        )
+                        job_file["display"] = payload.get("name", job_file.get("display"))
+                        job["file"] = job_file
+                        data["job"] = job
+
+                    self._data = data
+
+                if self._stale_pushes is None:
+                    self._stale_pushes = self.pushes
+        except Exception:
+            self._logger.exception("Caught an exception updating printer data for %s", event)
+
+    ##########
+    ### PrinterCallback
+    ##########
+
+    def on_printer_send_initial_data(self, data):
+        self._set_data(data)
+        temps = data.get("temps") or []
+        if temps:
+            self._set_temperatures(temps[-1])
+
+    def on_printer_send_current_data(self, data):
+        self._set_data(data)
+
+    def on_printer_add_temperature(self, data):
+        self._set_temperatures(data)
+
+    def _set_data(self, data):
+        try:
+            # Only the top level is copied: nested dicts in pushed data are never modified after being sent
+            snapshot = {key: data.get(key) for key in _CURRENT_DATA_KEYS}
+            with self._pushed:
+                self._data = snapshot
+                self.pushes += 1
+                self._stale_pushes = None
+                self._pushed.notify_all()
+        except Exception:
+            self._logger.exception("Caught an exception storing printer data")
+
+    def _set_temperatures(self, data):
+        try:
+            offsets = (self._data or {}).get("offsets") or {}
+            self._temperatures = {
+                key: {
+                    "actual": value.get("actual"),
+                    "target": value.get("target"),
+                    "offset": offsets.get(key, 0),
+                }
+                for key, value in data.items()
+                if isinstance(value, dict)
+            }
+        except Exception:
+            self._logger.exception("Caught an exception storing temperatures")
@@ -0,0 +1,130 @@
+import logging
+import re
+import time
+from typing import List, Optional
+
+# Named groups and named backreferences of user patterns, renamed to keep them unique in the combined pattern
+_GROUP_NAME_REGEX = re.compile(r"\(\?P([<=])(\w+)")
+
+# Message settings that a trigger can set for its own notification, overriding the SerialTrigger message ones
+MESSAGE_SETTINGS = ("text", "image", "gif", "silent")
+
+
+class SerialTrigger:
+    """
+    A serial line that must trigger a notification, configured by the user.
+
+    message holds the message settings of the trigger (see MESSAGE_SETTINGS), the missing ones being those of the
+    SerialTrigger message.
+    """
+
+    def __init__(self, name: str, pattern: str, regex=False, debounce: float = 60, message: Optional[dict] = None):
+        self.name = name
+        self.pattern = pattern
+        self.regex = regex
+        self.debounce = max(0.0, debounce)
+        self.message = message or {}
+        self.compiled = re.compile(pattern if regex else re.escape(pattern))
+        self.last_fired = None
+
+    def get_match_values(self, match: "re.Match") -> dict:
+        """Template values of a match: numbered groups by index (from 0, the whole match) and named groups by name"""
+        values = {index: value for index, value in enumerate([match.group(0), *match.groups()])}
+        values.update(match.groupdict())
+        return values
+
+
+class SerialTriggerMatcher:
+    """
+    Matches the lines received from the printer against all the serial triggers at once.
+
+    The triggers are compiled into a single regular expression, an alternation of the trigger patterns each wrapped
+    in its own named group: a line is matched with a single scan whatever the number of triggers, and the trigger
+    that matched is the last group closed by the match. Patterns are matched at the beginning of the lines.
+    Only when a trigger matches, its own pattern is run again to extract its groups. If it is in its debounce time,
+    the triggers that follow it are tried one by one.
+    """
+
+    def __init__(self, logger: logging.Logger, trigger_settings: List[dict]):
+        self._logger = logger.getChild("SerialTriggerMatcher")
+        self.triggers: List[SerialTrigger] = []
+
+        for trigger_setting in trigger_settings or []:
+            try:
+                pattern = str(trigger_setting.get("pattern") or "")
+                if not pattern:
+                    continue
+                # A missing or empty debounce gets the default, while 0 disables debouncing
+                debounce = trigger_setting.get("debounce", 60)
+                # An empty text uses the SerialTrigger message
+                message = {
+                    key: trigger_setting[key]
+                    for key in MESSAGE_SETTINGS
+                    if trigger_setting.get(key) is not None and trigger_setting.get(key) != ""
+                }
+                self.triggers.append(
+                    SerialTrigger(
+                        str(trigger_setting.get("name") or pattern),
+                        pattern,
+                        bool(trigger_setting.get("regex")),
+                        float(debounce) if debounce not in (None, "") else 60,
+                        message,
+                    )
+                )
+            except (re.error, TypeError, ValueError, AttributeError) as e:
+                self._logger.warning("Ignoring invalid serial trigger %s: %s", trigger_setting, e)
+
+        self._combined = None
+        if self.triggers:
+            try:
+                self._combined = re.compile(
+                    "|".join(
+                        f"(?P<_trigger{index}>{self._rename_groups(trigger.compiled.pattern, index)})"
+                        for index, trigger in enumerate(self.triggers)
+                    )
+                )
+            except re.error:
+                # E.g. numbered backreferences, whose numbers change in the combined pattern
+                self._logger.warning("Serial triggers can't be combined, they will be matched one by one")
+
+    def match(self, line: str, now: Optional[float] = None) -> Optional[dict]:
+        """
+        Match a line against the triggers.
+
+        Returns:
+            Optional[dict]: The event payload for the first matching trigger not in its debounce time, or None
+        """
+        if not self.triggers:
+            return None
+
+        if self._combined is not None:
+            combined_match = self._combined.match(line)
+            if combined_match is None:
+                return None
+            # The triggers before the one that matched don't match the line
+            candidates = self.triggers[int(combined_match.lastgroup[len("_trigger") :]) :]
+        else:
+            candidates = self.triggers
+
+        for trigger in candidates:
+            trigger_match = trigger.compiled.match(line)
+            if trigger_match is None:
+                continue
+
+            now = now or time.monotonic()
+            if trigger.last_fired is not None and now - trigger.last_fired < trigger.debounce:
+                continue
+            trigger.last_fired = now
+
+            return {
+                "serial_trigger": trigger.name,
+                "serial_line": line.strip(),
+                "serial_match": trigger.get_match_values(trigger_match),
+                "serial_message": dict(trigger.message),
+            }
+
+        return None
+
+    @staticmethod
+    def _rename_groups(pattern: str, index: int) -> str:
+        return _GROUP_NAME_REGEX.sub(lambda m: f"(?P{m.group(1)}_t{index}_{m.group(2)}", pattern)
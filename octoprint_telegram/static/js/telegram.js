@@ -41,6 +41,7 @@ $(function () {
     self.bind_cmd = {}
     self.markupFrom = []
     self.requirements = ko.observable({})
+    self.webcams = ko.observableArray([])
 
     self.isChatsTableLoading = ko.observable(false)
     self.isTestingToken = ko.observable(false)
@@ -69,6 +70,31 @@ $(function () {
         })
     }
 
+    self.probeEncoders = function () {
+      OctoPrint.simpleApiCommand(self.pluginIdentifier, 'probeEncoders', {})
+        .done(() => {
+          // The benchmark takes a while: refresh the results when it is likely done
+          setTimeout(self.requestRequirements, 30000)
+        })
+    }
+
+    self.recommendedPresets = ko.pureComputed(() => {
+      const probe = self.requirements().encoder_probe || {}
+      const presets = probe.recommended_presets || {}
+      const text = Object.keys(presets).map(resolution => `${presets[resolution]} at ${resolution}`).join(', ')
+      if (probe.deferred) return 'benchmark deferred until the printer is idle'
+      if (probe.running) return 'benchmark in progress...'
+      const encoders = (probe.encoders || []).join(', ')
+      return (text || 'not benchmarked yet') + (encoders ? ` (working encoders: ${encoders})` : '')
+    })
+
+    self.requestWebcams = function () {
+      OctoPrint.simpleApiGet(self.pluginIdentifier + '?webcams')
+        .done((response) => {
+          self.webcams(response.webcams || [])
+        })
+    }
+
     self.requestBindings = function () {
       OctoPrint.simpleApiGet(self.pluginIdentifier + '?bindings')
         .done((response) => self.fromBindings(response))
@@ -162,6 +188,16 @@ $(function () {
           </div>
         `
 
+        // Webcams selection
+        const webcamsSelect = `
+          <div style="margin-bottom: 10px;" data-bind="visible: webcams().length > 1">
+            <span>&#x1F4F9; Webcams to use</span>
+            <select multiple size="3" class="input-block-level"
+              data-bind="options: webcams, selectedOptions: settings.settings.plugins.telegram.messages.${eventName}.cameras"></select>
+            <span class="help-block"><small>Select none to use all webcams.</small></span>
+          </div>
+        `
+
         // Markup buttons group
         const currentMarkup = self.settings.settings.plugins.telegram.messages[eventName].markup() || 'off'
         self.markupFrom[index] = currentMarkup
@@ -200,6 +236,8 @@ $(function () {
               ${silentSwitch}
             </div>
 
+            ${webcamsSelect}
+
             <div style="text-align: center;">
               ${markupButtonsGroup}
             </div>
@@ -232,7 +270,8 @@ $(function () {
           chat_id: self.currChatID,
           accept_commands: $('#telegram-editchat-acceptcommands-chkbox').prop('checked') || false,
           send_notifications: $('#telegram-editchat-sendnotifications-chkbox').prop('checked') || false,
-          allow_users: $('#telegram-editchat-allowusers-chkbox').prop('checked') || false
+          allow_users: $('#telegram-editchat-allowusers-chkbox').prop('checked') || false,
+          cameras: $('#telegram-editchat-cameras-select').val() || []
         }
       ).done(function () {
         self.requestData()
@@ -432,6 +471,24 @@ $(function () {
       `)
       ko.applyBindings(self, $('#telegram-editchat-sendnotifications-chkbox')[0])
 
+      // Webcams
+      $('#telegram-edit-chat-form').append(`
+          <div class="control-group" id="telegram-editchat-cameras" data-bind="visible: webcams().length > 1">
+            <label class="control-label">Webcams</label>
+            <div class="controls">
+              <select multiple size="3" id="telegram-editchat-cameras-select"
+                data-bind="options: webcams, selectedOptions: settings.settings.plugins.telegram.chats['${data.id}']['cameras']"></select>
+              <span class="help-block">
+                <small>
+                  Photos and gifs sent to this chat are taken only from the selected webcams. Select none to use all webcams.
+                  Notification messages can further restrict the webcams to use.
+                </small>
+              </span>
+            </div>
+          </div>
+      `)
+      ko.applyBindings(self, $('#telegram-editchat-cameras')[0])
+
       self.editChatDialog.modal('show')
     }
 
@@ -527,6 +584,7 @@ $(function () {
     self.onSettingsShown = function () {
       self.requestData()
       self.requestRequirements()
+      self.requestWebcams()
       self.requestBindings()
 
       self.testToken($('#telegram-settings-token').val())
@@ -558,7 +616,21 @@ $(function () {
         'notification_time',
         'message_at_print_done_delay',
         'PreImgDelay',
-        'PostImgDelay'
+        'PostImgDelay',
+        'image_max_dimension',
+        'image_quality',
+        'image_max_size',
+        'image_collage_max_dimension',
+        'image_collage_max_size',
+        'image_worker_processes',
+        'gif_memory_limit',
+        'gif_ring_buffer_seconds',
+        'gif_snapshot_fps',
+        'gif_snapshot_max_dimension',
+        'gif_max_size',
+        'gif_max_fps',
+        'gif_max_dimension',
+        'print_recap_interval'
       ]
       numericFields.forEach(field => {
         const observable = pluginSettings[field]
@@ -689,6 +761,31 @@ $(function () {
       return `Disable (${timerEmoji} ${formatted})`
     })
 
+    self.addSerialTrigger = function () {
+      self.settings.settings.plugins.telegram.serial_triggers.push({
+        name: ko.observable(''),
+        pattern: ko.observable(''),
+        regex: ko.observable(false),
+        debounce: ko.observable(60),
+        text: ko.observable(''),
+        image: ko.observable(true),
+        gif: ko.observable(false),
+        silent: ko.observable(false)
+      })
+    }
+
+    // Message settings of a serial trigger, created on the fly for triggers saved without them
+    self.serialTriggerSetting = function (trigger, name, defaultValue) {
+      if (!ko.isObservable(trigger[name])) {
+        trigger[name] = ko.observable(trigger[name] === undefined ? defaultValue : trigger[name])
+      }
+      return trigger[name]
+    }
+
+    self.removeSerialTrigger = function (trigger) {
+      self.settings.settings.plugins.telegram.serial_triggers.remove(trigger)
+    }
+
     self.resetNotificationMessages = function () {
       const message = 'Do you really want to reset all notification messages to default?<br>Remember to save once this dialog is closed.'
 
@@ -1,7 +1,10 @@
 import datetime
 import html
+import logging
+import string
 import time
-from typing import TYPE_CHECKING
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Iterable, List, Tuple, Union
 
 import octoprint.util
 
@@ -13,6 +16,35 @@ if TYPE_CHECKING:
 
 render_emojis = Emoji.render_emojis
 
+# Same logger as TMSG
+_logger = logging.getLogger("octoprint.plugins.telegram.TMSG")
+
+
+class UnavailableValue(str):
+    """Placeholder for template variables whose data was not fetched in time. Navigating it returns itself."""
+
+    def __getitem__(self, key):
+        return self
+
+
+UNAVAILABLE = UnavailableValue("[N/A]")
+
+# Template variables that need data from outside OctoPrint state (third-party plugin APIs, file metadata on disk),
+# by the variable that fetches it. They are fetched concurrently before a template is rendered.
+EXTERNAL_VARIABLE_SOURCES = {
+    "display_layer_progress": "display_layer_progress",
+    "current_layer": "display_layer_progress",
+    "total_layer": "display_layer_progress",
+    "total_height": "display_layer_progress",
+    "fan_speed": "display_layer_progress",
+    "change_filament_count": "display_layer_progress",
+    "change_filament_time_left": "display_layer_progress",
+    "change_filament_next_time": "display_layer_progress",
+    "metadata": "metadata",
+    "prusammu": "prusammu",
+    "resource_monitor": "resource_monitor",
+}
+
 # telegramMsgDict contains message settings.
 # Each entry has the following structure:
 #
@@ -44,6 +76,10 @@ render_emojis = Emoji.render_emojis
 #       - 'MarkdownV2': use MarkdownV2 markup
 #       - 'off'       : no markup
 #
+# - 'cameras' (list):
+#     The default message configuration. Names of the webcams whose photos and gifs are sent with the
+#     notification. An empty list means all webcams.
+#
 # - 'desc' (str):
 #     Human-readable description shown in settings/help.
 #
@@ -74,6 +110,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when OctoPrint starts",
     },
     "PrinterShutdown": {
@@ -82,6 +119,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when OctoPrint shuts down",
     },
     "PrintStarted": {
@@ -90,6 +128,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when a print starts",
     },
     "PrintPaused": {
@@ -98,6 +137,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when a print is paused",
     },
     "PrintResumed": {
@@ -106,6 +146,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when a print is resumed",
     },
     "PrintFailed": {
@@ -114,6 +155,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when a print fails",
     },
     "ZChange": {
@@ -122,6 +164,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when the printer's Z-height changes (new layer)",
     },
     "PrintDone": {
@@ -130,6 +173,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when a print completes successfully",
     },
     "StatusNotPrinting": {
@@ -138,6 +182,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "no_setting": True,
         "desc": "Triggered on user request when no print is running",
     },
@@ -147,6 +192,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "no_setting": True,
         "desc": "Triggered on user request when printer is not connected",
     },
@@ -160,6 +206,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when the printer requests user interaction, via 'echo:busy: paused for user' or '// action:paused' on the serial line",
     },
     "gCode_M600": {
@@ -168,6 +215,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when OctoPrint sends the M600 G-code (filament change) to the printer - only for prints started via OctoPrint",
     },
     "Error": {
@@ -176,6 +224,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered in case of an unrecoverable error (e.g., thermal runaway or connection loss)",
     },
     "plugin_octolapse_movie_done": {
@@ -188,6 +237,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when the timelapse movie is completed",
     },
     "Connected": {
@@ -196,6 +246,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when OctoPrint connects to the printer",
     },
     "Disconnected": {
@@ -204,6 +255,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when the printer disconnects from OctoPrint",
     },
     "Home": {
@@ -212,6 +264,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when OctoPrint sends the home command (G-code G28) to the printer",
     },
     "Alert": {
@@ -220,6 +273,7 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when OctoPrint sends the M300 G-code to sound the printer buzzer",
     },
     "UserNotif": {
@@ -228,14 +282,25 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when the printer sends 'echo:UserNotif TEXT' over serial, e.g. from a G-code like 'M118 E1 UserNotif TEXT'",
     },
+    "SerialTrigger": {
+        "text": "{emo:attention} {serial_trigger}: {serial_line}",
+        "image": True,
+        "silent": False,
+        "gif": False,
+        "markup": "off",
+        "cameras": [],
+        "desc": "Triggered when the printer sends a line matching one of the serial triggers configured in plugin settings",
+    },
     "PrusaMMU_Status": {
         "text": "Prusa MMU reported an update. Its status is: {prusammu[state]}. Previous tool: {prusammu[previousTool]}. Current tool: {prusammu[tool]}.",
         "image": True,
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when the Prusa MMU plugin reports a status / tool change",
     },
     "PrusaMMU_Error": {
@@ -244,12 +309,532 @@ telegramMsgDict = {
         "silent": False,
         "gif": False,
         "markup": "off",
+        "cameras": [],
         "desc": "Triggered when the Prusa MMU plugin reports an error",
     },
 }
 
 
+# --- Defines all template variables available for notification messages ---
+# To add new template variables, just add them as a @cached_property in LazyVariables class
+
+
+class LazyVariables:
+    """Context class that calculates template variables only when accessed"""
+
+    # Seconds to wait for third-party plugin data never fetched before. Once fetched, it is served without waiting.
+    PLUGIN_DATA_WAIT = 2
+    # Seconds to wait for all the external data of a template, after which missing variables render as UNAVAILABLE
+    PREFETCH_DEADLINE = 3
+
+    def __init__(self, parent: "TMSG", payload, kwargs, printer_data=None):
+        self.parent = parent
+        self.payload = payload
+        self.kwargs = kwargs
+        self.printer_data = printer_data
+        self._cache = {}
+
+    def _get_cached(self, key, calculator):
+        """
+        Get cached value or calculate it if not cached.
+
+        The cache prevents calculating the same template variable multiple times
+        within a single notification message. The cache is local to each
+        notification and does not persist between different notifications.
+
+        Args:
+            key: Cache key for the variable
+            calculator: Lambda function that calculates the variable value
+
+        Returns:
+            The calculated or cached variable value
+        """
+        if key not in self._cache:
+            # A value set meanwhile (e.g. the placeholder of a prefetch that missed its deadline) is kept
+            return self._cache.setdefault(key, calculator())
+        return self._cache[key]
+
+    def cached_property(func):
+        """Decorator that automatically uses function name as cache key"""
+
+        def wrapper(self):
+            property_name = func.__name__
+            return self._get_cached(property_name, lambda: func(self))
+
+        return property(wrapper)
+
+    def prefetch(self, names: Iterable[str], executor: ThreadPoolExecutor):
+        """
+        Fetch concurrently the external data needed by the given template variables, waiting for all of it up to
+        PREFETCH_DEADLINE seconds. Variables whose data misses the deadline are set to UNAVAILABLE.
+        """
+        sources = {EXTERNAL_VARIABLE_SOURCES[name] for name in names if name in EXTERNAL_VARIABLE_SOURCES}
+        sources.difference_update(self._cache)
+        if not sources:
+            return
+
+        futures = {source: executor.submit(getattr, self, source) for source in sources}
+        wait(futures.values(), timeout=self.PREFETCH_DEADLINE)
+
+        for source, future in futures.items():
+            if future.done():
+                continue
+            _logger.warning("Data of template variable %s not available in %ss", source, self.PREFETCH_DEADLINE)
+            for name, name_source in EXTERNAL_VARIABLE_SOURCES.items():
+                if name_source == source:
+                    self._cache.setdefault(name, UNAVAILABLE)
+
+    @cached_property
+    def status(self):
+        """Current printer data from OctoPrint API (as of when the event was received)"""
+        if self.printer_data is not None:
+            return self.printer_data
+        return self.parent.main.printer_state.get_data()
+
+    @cached_property
+    def event(self):
+        """Event that triggered the notification. If the event has an alias (bind_msg), it resolves to that."""
+        event = str(self.kwargs.get("event"))
+        event_bind_msg = telegramMsgDict.get(event, {}).get("bind_msg")
+        return event_bind_msg if event_bind_msg else event
+
+    @cached_property
+    def z(self):
+        """Current Z value"""
+        return self.parent.z
+
+    @cached_property
+    def temps(self):
+        """Full temperature data for all tools and bed from OctoPrint API"""
+        return self.parent.main.printer_state.get_temperatures()
+
+    @cached_property
+    def bed_temp(self):
+        """Current bed temperature"""
+        return self.temps.get("bed", {}).get("actual", 0.0)
+
+    @cached_property
+    def bed_target(self):
+        """Target bed temperature"""
+        return self.temps.get("bed", {}).get("target", 0.0)
+
+    @cached_property
+    def e1_temp(self):
+        """Current temperature of extruder 1 (tool0)"""
+        return self.temps.get("tool0", {}).get("actual", 0.0)
+
+    @cached_property
+    def e1_target(self):
+        """Target temperature of extruder 1 (tool0)"""
+        return self.temps.get("tool0", {}).get("target", 0.0)
+
+    @cached_property
+    def e2_temp(self):
+        """Current temperature of extruder 2 (tool1)"""
+        return self.temps.get("tool1", {}).get("actual", 0.0)
+
+    @cached_property
+    def e2_target(self):
+        """Target temperature of extruder 2 (tool1)"""
+        return self.temps.get("tool1", {}).get("target", 0.0)
+
+    @cached_property
+    def e3_temp(self):
+        """Current temperature of extruder 3 (tool2)"""
+        return self.temps.get("tool2", {}).get("actual", 0.0)
+
+    @cached_property
+    def e3_target(self):
+        """Target temperature of extruder 3 (tool2)"""
+        return self.temps.get("tool2", {}).get("target", 0.0)
+
+    @cached_property
+    def e4_temp(self):
+        """Current temperature of extruder 4 (tool3)"""
+        return self.temps.get("tool3", {}).get("actual", 0.0)
+
+    @cached_property
+    def e4_target(self):
+        """Target temperature of extruder 4 (tool3)"""
+        return self.temps.get("tool3", {}).get("target", 0.0)
+
+    @cached_property
+    def e5_temp(self):
+        """Current temperature of extruder 5 (tool4)"""
+        return self.temps.get("tool4", {}).get("actual", 0.0)
+
+    @cached_property
+    def e5_target(self):
+        """Target temperature of extruder 5 (tool4)"""
+        return self.temps.get("tool4", {}).get("target", 0.0)
+
+    @cached_property
+    def percent(self):
+        """Current percentage of the print progress"""
+        progress = self.status.get("progress", {})
+        completion = progress.get("completion")
+        return int(completion if completion is not None else 0)
+
+    @cached_property
+    def time_done(self):
+        """Elapsed time of the current print"""
+        progress = self.status.get("progress", {})
+        print_time = progress.get("printTime") or 0
+        return octoprint.util.get_formatted_timedelta(datetime.timedelta(seconds=print_time))
+
+    @cached_property
+    def time_left(self):
+        """Remaining time of the current print"""
+        progress = self.status.get("progress", {})
+        print_time_left = progress.get("printTimeLeft")
+        if print_time_left is not None:
+            return octoprint.util.get_formatted_timedelta(datetime.timedelta(seconds=print_time_left))
+        return "[Unknown]"
+
+    @cached_property
+    def time_finish(self):
+        """Estimated finish time of the current print"""
+        progress = self.status.get("progress", {})
+        print_time_left = progress.get("printTimeLeft")
+        if print_time_left is not None:
+            return self.parent.main.calculate_ETA(print_time_left)
+
+    @cached_property
+    def display_layer_progress(self):
+        """A dictionary containing data provided by the DisplayLayerProgress plugin"""
+        return self.parent.main.plugin_data["display_layer_progress"].get(wait=self.PLUGIN_DATA_WAIT)
+
+    @cached_property
+    def current_layer(self):
+        """Current layer number, provided by the DisplayLayerProgress plugin"""
+        layer_info = self.display_layer_progress.get("layer") or {}
+        return layer_info.get("current", "?")
+
+    @cached_property
+    def total_layer(self):
+        """Total number of layers, provided by the DisplayLayerProgress plugin"""
+        layer_info = self.display_layer_progress.get("layer") or {}
+        return layer_info.get("total", "?")
+
+    @cached_property
+    def total_height(self):
+        """Total height of the object being printed, provided by the DisplayLayerProgress plugin"""
+        height_info = self.display_layer_progress.get("height") or {}
+        return height_info.get("totalFormatted", "?")
+
+    @cached_property
+    def fan_speed(self):
+        """Fan speed, provided by the DisplayLayerProgress plugin"""
+        return self.display_layer_progress.get("fanSpeed", "?")
+
+    @cached_property
+    def change_filament_count(self):
+        """Number of filament changes occurred, provided by the DisplayLayerProgress plugin"""
+        print_info = self.display_layer_progress.get("print") or {}
+        return print_info.get("changeFilamentCount", "?")
+
+    @cached_property
+    def change_filament_time_left(self):
+        """Remaining time until the next filament change, provided by the DisplayLayerProgress plugin"""
+        print_info = self.display_layer_progress.get("print") or {}
+        return print_info.get("changeFilamentTimeLeft", "?")
+
+    @cached_property
+    def change_filament_next_time(self):
+        """Estimated time of the next filament change, provided by the DisplayLayerProgress plugin"""
+        print_info = self.display_layer_progress.get("print") or {}
+        return print_info.get("estimatedChangedFilamentTime", "?")
+
+    @cached_property
+    def owner(self):
+        """The name of the user who started the print"""
+        return self.status["job"].get("user") or ""
+
+    @cached_property
+    def user(self):
+        """The name of the user who performed the action that triggered the notification (e.g., paused or canceled the print)"""
+        return self.payload.get("user") or ""
+
+    @cached_property
+    def file(self):
+        """File name of the file currently being printed"""
+        file = self.status.get("job", {}).get("file", {}).get("name", "")
+        # Print job events (PrintStarted, PrintDone...) name their file in the payload, along with its origin
+        keys = ("name", "filename", "gcode", "file") if "origin" in self.payload else ("filename", "gcode", "file")
+        for key in keys:
+            value = self.payload.get(key)
+            if value:
+                file = value
+                break
+        return file
+
+    @cached_property
+    def path(self):
+        """Full path of the file currently being printed"""
+        if "origin" in self.payload and self.payload.get("path"):
+            return self.payload["path"]
+        return self.status.get("job", {}).get("file", {}).get("path", "")
+
+    @cached_property
+    def metadata(self):
+        """A dictionary containing metadata of the file currently being printed"""
+        if not self.path:
+            return {}
+        return self.parent.main._file_manager.get_metadata(octoprint.filemanager.FileDestinations.LOCAL, self.path)
+
+    @cached_property
+    def error_msg(self):
+        """The error message string. Only useful for 'Error' event notifications."""
+        return self.payload.get("error", "")
+
+    @cached_property
+    def UserNotif_Text(self):
+        """The text received via the serial message echo:UserNotif TEXT, which is triggered by printing a G-code like: M118 E1 UserNotif TEXT."""
+        return self.payload.get("UserNotif", "")
+
+    @cached_property
+    def serial_trigger(self):
+        """The name of the serial trigger that matched the line received from the printer"""
+        return self.payload.get("serial_trigger", "")
+
+    @cached_property
+    def serial_line(self):
+        """The line received from the printer that matched a serial trigger"""
+        return self.payload.get("serial_line", "")
+
+    @cached_property
+    def serial_match(self):
+        """A dictionary containing the groups captured by the serial trigger pattern, by number (e.g. {serial_match[1]}) or by name"""
+        return self.payload.get("serial_match", {})
+
+    @cached_property
+    def prusammu(self):
+        """A dictionary containing the current state of the Prusa MMU, provided by the Prusa MMU plugin."""
+        return self.parent.main.plugin_data["prusammu"].get(wait=self.PLUGIN_DATA_WAIT)
+
+    @cached_property
+    def resource_monitor(self):
+        """A dictionary containing data provided by the Resource Monitor plugin."""
+        return self.parent.main.plugin_data["resource_monitor"].get(wait=self.PLUGIN_DATA_WAIT)
+
+    @cached_property
+    def enclosure(self):
+        """A dictionary containing the data provided by the Enclosure plugin, such as the temperatures measured by the sensors or the configured target temperature."""
+        enclosure = {"current_temps": {}, "humidity": {}, "target_temps": {}}
+        enclosure_plugin_id = "enclosure"
+        enclosure_module = self.parent.main._plugin_manager.get_plugin(enclosure_plugin_id, True)
+
+        if enclosure_module:
+            enclosure_implementation = self.parent.main._plugin_manager.plugins[enclosure_plugin_id].implementation
+
+            for rpi_input in enclosure_implementation.rpi_inputs:
+                if rpi_input["input_type"] == "temperature_sensor":
+                    index_id = str(rpi_input["index_id"])
+                    label = rpi_input.get("label") or "Enclosure"
+                    temp = rpi_input.get("temp_sensor_temp", "")
+                    humidity = rpi_input.get("temp_sensor_humidity", "")
+
+                    if temp != "":
+                        enclosure["current_temps"][index_id] = {"label": label, "temp": temp}
+
+                    if humidity != "":
+                        enclosure["humidity"][index_id] = {"label": label, "humidity": humidity}
+
+            for rpi_output in enclosure_implementation.rpi_outputs:
+                if rpi_output["output_type"] == "temp_hum_control":
+                    index_id = str(rpi_output["index_id"])
+                    label = rpi_output.get("label") or "Enclosure"
+                    temp = rpi_output.get("temp_ctr_set_value", "")
+
+                    if temp != "":
+                        enclosure["target_temps"][index_id] = {"label": label, "temp": temp}
+
+        return enclosure
+
+
+# Only variables of LazyVariables decorated with @cached_property can be used in templates
+TEMPLATE_VARIABLES = frozenset(name for name, attr in LazyVariables.__dict__.items() if isinstance(attr, property))
+
+
+class MarkupEscapedValue:
+    """
+    Wrapper for template variable values that applies markup escaping at string conversion time.
+
+    This ensures that escaping happens AFTER template variable resolution and dictionary/list
+    navigation is complete. This allows users to write templates like {status[job][user]}
+    where the escaping is applied only to the final resolved value, not to intermediate
+    dictionary keys during navigation.
+
+    The wrapper maintains the markup context and applies the appropriate escaping
+    (HTML, Markdown, MarkdownV2) only when the final value is converted to string.
+    """
+
+    def __init__(self, value, markup):
+        self.value = value
+        self.markup = markup
+
+    def __getitem__(self, key):
+        try:
+            # Support dictionary/list navigation
+            return MarkupEscapedValue(self.value[key], self.markup)
+        except Exception:
+            _logger.exception("Caught an exception navigating dict/list")
+            # Return an error placeholder if attempting to access non-existent key or invalid index
+            return MarkupEscapedValue("[ERROR]", self.markup)
+
+    def __str__(self):
+        # Apply markup escaping only at final string conversion
+        val = str(self.value)
+        if self.markup == "HTML":
+            return html.escape(val)
+        elif self.markup == "Markdown":
+            return escape_markdown(val, 1)
+        elif self.markup == "MarkdownV2":
+            return escape_markdown(val, 2)
+        return val
+
+
+class SecureTemplateContext(dict):
+    """
+    Secure context for template variable access.
+
+    Only `lazy_vars` attributes decorated with `@cached_property` can be accessed from templates.
+    Unknown or not allowed variables are returned as literal placeholders.
+    """
+
+    def __init__(self, lazy_vars, markup):
+        self.lazy_vars = lazy_vars
+        self.markup = markup
+
+    def __getitem__(self, key):
+        # If variable is not in allowed_vars, return it as a literal
+        if key not in TEMPLATE_VARIABLES:
+            return "{" + key + "}"
+
+        # Get the lazy value and wrap it with markup escaping
+        try:
+            lazy_value = getattr(self.lazy_vars, key)
+            return MarkupEscapedValue(lazy_value, self.markup)
+        except Exception:
+            _logger.exception("Caught an exception getting lazy_vars property")
+            # Return an error placeholder if getting the lazy_vars property raised an exception
+            return "[ERROR]"
+
+
+def split_field_name(field_name: str) -> Tuple[Union[str, int], List[Tuple[bool, Union[str, int]]]]:
+    """
+    Split a replacement field name as str.format does, e.g. "a.b[0]" into ("a", [(True, "b"), (False, 0)]).
+
+    Returns the first name and the list of (is_attribute, key) accessors that follow it. Numeric names and keys
+    are returned as ints.
+    """
+
+    def to_key(text):
+        return int(text) if text.isdecimal() else text
+
+    end = len(field_name)
+    for i, char in enumerate(field_name):
+        if char in ".[":
+            end = i
+            break
+    name = field_name[:end]
+
+    accessors = []
+    i = end
+    while i < len(field_name):
+        if field_name[i] == ".":
+            i += 1
+            j = i
+            while j < len(field_name) and field_name[j] not in ".[":
+                j += 1
+            if j == i:
+                raise ValueError("Empty attribute in format string")
+            accessors.append((True, field_name[i:j]))
+        else:
+            i += 1
+            j = field_name.find("]", i)
+            if j < 0:
+                raise ValueError("Missing ']' in format string")
+            if j == i:
+                raise ValueError("Empty attribute in format string")
+            accessors.append((False, to_key(field_name[i:j])))
+            j += 1
+            if j < len(field_name) and field_name[j] not in ".[":
+                raise ValueError("Only '.' or '[' may follow ']' in format field specifier")
+        i = j
+
+    return to_key(name), accessors
+
+
+class NotificationTemplate:
+    """
+    A notification message template, compiled once to be rendered many times.
+
+    Emojis are rendered and replacement fields are parsed at compile time, so that rendering only has to resolve
+    the referenced template variables (in variables) and join the pieces, with the same semantics as
+    str.format_map(SecureTemplateContext).
+    """
+
+    def __init__(self, template: str, markup: str):
+        self.template = template
+        self.markup = markup
+        self.variables = set()  # Names of the template variables referenced by the template
+        self._text = render_emojis(template or "")
+        self._parts = []  # (literal text, parsed replacement field or None)
+        self._nested = False  # Format specs with nested fields are left to str.format_map
+
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(self._text):
+            if field_name is None:
+                self._parts.append((literal, None))
+                continue
+
+            name, accessors = split_field_name(field_name)
+            if not isinstance(name, str) or not name:
+                raise ValueError("Format string contains positional fields")
+            if format_spec and "{" in format_spec:
+                self._nested = True
+
+            if name in TEMPLATE_VARIABLES:
+                self.variables.add(name)
+            self._parts.append((literal, (name, accessors, conversion, format_spec)))
+
+    def render(self, lazy_vars: LazyVariables) -> str:
+        context = SecureTemplateContext(lazy_vars, self.markup)
+
+        if self._nested:
+            return self._text.format_map(context)
+
+        pieces = []
+        for literal, field in self._parts:
+            pieces.append(literal)
+            if field is None:
+                continue
+
+            name, accessors, conversion, format_spec = field
+            value = context[name]
+            for is_attribute, key in accessors:
+                value = getattr(value, key) if is_attribute else value[key]
+
+            if conversion == "s":
+                value = str(value)
+            elif conversion == "r":
+                value = repr(value)
+            elif conversion == "a":
+                value = ascii(value)
+
+            pieces.append(format(value, format_spec or ""))
+
+        return "".join(pieces)
+
+
 class TMSG:
+    # Z changes smaller than this are not layer changes: many of them in a row mean a spiral vase print
+    VASE_MODE_MAX_Z_STEP = 0.05
+    VASE_MODE_MIN_STEPS = 20
+    # In vase mode, Z notifications are sent every this percentage of progress, checked at most every some seconds
+    VASE_MODE_PROGRESS_STEP = 10
+    VASE_MODE_PROGRESS_CHECK_INTERVAL = 30
+
     def __init__(self, main: "TelegramPlugin"):
         self.main = main
         self._logger = main._logger.getChild("TMSG")
@@ -259,6 +844,18 @@ class TMSG:
         self.last_notification_time = 0
         self.last_prusammu_state = ""
 
+        # State of the ZChange gate, kept as plain values so that most Z changes are dropped at almost no cost
+        self.notification_height = 0.0
+        self.notification_time = 0
+        self.small_z_steps = 0
+        self.vase_mode = False
+        self.last_progress_check = 0.0
+        self.last_progress_notified = 0.0
+        self.load_settings()
+
+        self._templates = {}  # Compiled message templates, by (event or cache key, markup). See get_template()
+        self._prefetch_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="TelegramPrefetch")
+
         self.msgCmdDict = {
             "Alert": self._sendNotification,
             "Connected": self._sendNotification,
@@ -278,6 +875,7 @@ class TMSG:
             "PrintStarted": self._on_msgPrintStarted,
             "PrusaMMU_Error": self._on_msgPrusaMMU,
             "PrusaMMU_Status": self._on_msgPrusaMMU,
+            "SerialTrigger": self._sendNotification,
             "StatusNotConnected": self._sendNotification,
             "StatusNotPrinting": self._sendNotification,
             "StatusPrinting": self._sendNotification,
@@ -285,40 +883,43 @@ class TMSG:
             "ZChange": self._on_msgZChange,
         }
 
-    def startEvent(self, event, payload, **kwargs):
+    def startEvent(self, event, payload, printer_data=None, **kwargs):
         # Not all events have payload
         payload = payload or {}
 
-        status = self.main._printer.get_current_data()
+        # Printer data may have been captured when the event was received, if it was queued. Job events aren't
+        # captured, the printer state is only up to date after the next push.
+        status = printer_data or self.main.printer_state.get_fresh_data()
         self.z = status["currentZ"] or 0.0
         kwargs["event"] = event
+        kwargs["printer_data"] = status
         self.msgCmdDict[event](payload, **kwargs)
 
     def _on_msgZChange(self, payload, **kwargs):
-        status = self.main._printer.get_current_data()
-        if not status["state"]["flags"]["printing"] or not self.is_notification_necessary(
-            payload["new"], payload["old"]
-        ):
-            return
+        # Z changes reach here only if they passed is_event_wanted()
         self.z = payload["new"]
         self._logger.debug(
-            "Z-Change. new_z=%.2f old_z=%.2f last_z=%.2f notification_height=%.2f notification_time=%d",
+            "Z-Change. new_z=%.2f old_z=%.2f last_z=%.2f notification_height=%.2f notification_time=%d vase_mode=%s",
             self.z,
             payload["old"],
             self.last_z,
-            self.main._settings.get_float(["notification_height"]),
-            self.main._settings.get_int(["notification_time"]),
+            self.notification_height,
+            self.notification_time,
+            self.vase_mode,
         )
         self._sendNotification(payload, **kwargs)
 
     def _on_msgPrintStarted(self, payload, **kwargs):
-        self.last_z = 0.0
-        self.last_notification_time = time.time()
         self._sendNotification(payload, **kwargs)
 
     def _on_msgPrintDone(self, payload, **kwargs):
         self.main.shut_up = set()
         kwargs["delay"] = self.main._settings.get_int(["message_at_print_done_delay"])
+        recap_path = self.main.finish_print_recap()
+        if recap_path:
+            # The recap follows the notification, as a reply
+            kwargs["movie"] = recap_path
+            kwargs["media_as_reply"] = True
         self._sendNotification(payload, **kwargs)
 
     def _on_msgPrintFailed(self, payload, **kwargs):
@@ -331,301 +932,80 @@ class TMSG:
             self.last_prusammu_state = state
             self._sendNotification(payload, **kwargs)
 
+    def get_template(self, event, markup, text=None, cache_key=None) -> NotificationTemplate:
+        """
+        Get the compiled message template of an event, compiling it only if not cached or changed.
+        text replaces the message text of the event (e.g. the one of a serial trigger), cached under cache_key.
+        """
+        template = self.main._settings.get(["messages", event, "text"]) if text is None else text
+        key = (cache_key or event, markup)
+
+        compiled = self._templates.get(key)
+        if compiled is None or compiled.template != template:
+            compiled = NotificationTemplate(template, markup)
+            self._templates[key] = compiled
+
+        return compiled
+
+    def get_message_settings(self, event, payload) -> dict:
+        """
+        Get the text, image, gif, silent and markup settings of the message of an event. Serial triggers override
+        the SerialTrigger message settings with their own ones.
+        """
+        message_settings = {
+            key: self.main._settings.get(["messages", event, key]) for key in ("text", "image", "gif", "silent")
+        }
+        message_settings["markup"] = self.main._settings.get(["messages", event, "markup"]) or "off"
+
+        if event == "SerialTrigger":
+            message_settings.update(payload.get("serial_message") or {})
+
+        return message_settings
+
+    def get_used_variables(self) -> set:
+        """Names of the template variables used by the messages of the events notified to at least one chat"""
+        events = set()
+        for chat_id, chat_settings in (self.main._settings.get(["chats"]) or {}).items():
+            if chat_id == "zBOTTOMOFCHATS" or not chat_settings.get("send_notifications"):
+                continue
+            events.update(event for event, enabled in (chat_settings.get("notifications") or {}).items() if enabled)
+
+        variables = set()
+        for event in events:
+            if event not in self.msgCmdDict:
+                continue
+            # Events with an alias use the message of the alias, see LazyVariables.event
+            event = telegramMsgDict.get(event, {}).get("bind_msg") or event
+            markup = self.main._settings.get(["messages", event, "markup"]) or "off"
+            try:
+                variables.update(self.get_template(event, markup).variables)
+            except Exception:
+                self._logger.debug("Can't compile the message of event %s", event, exc_info=True)
+
+            # Serial triggers may have their own texts
+            if event == "SerialTrigger" and self.main.serial_triggers is not None:
+                for trigger in self.main.serial_triggers.triggers:
+                    if not trigger.message.get("text"):
+                        continue
+                    try:
+                        variables.update(
+                            self.get_template(
+                                event, markup, trigger.message["text"], f"SerialTrigger:{trigger.name}"
+                            ).variables
+                        )
+                    except Exception:
+                        self._logger.debug(
+                            "Can't compile the message of serial trigger %s", trigger.name, exc_info=True
+                        )
+        return variables
+
+    def clear_templates(self):
+        """Drop the compiled message templates, e.g. after the messages settings changed"""
+        self._templates = {}
+
     def _sendNotification(self, payload, **kwargs):
         try:
-            _logger = self._logger
-
-            # --- Defines all template variables available for notification messages ---
-            # To add new template variables, just add them as a @cached_property in LazyVariables class
-
-            class LazyVariables:
-                """Context class that calculates template variables only when accessed"""
-
-                def __init__(self, parent: "TMSG", payload, kwargs):
-                    self.parent = parent
-                    self.payload = payload
-                    self.kwargs = kwargs
-                    self._cache = {}
-
-                def _get_cached(self, key, calculator):
-                    """
-                    Get cached value or calculate it if not cached.
-
-                    The cache prevents calculating the same template variable multiple times
-                    within a single notification message. The cache is local to each
-                    notification and does not persist between different notifications.
-
-                    Args:
-                        key: Cache key for the variable
-                        calculator: Lambda function that calculates the variable value
-
-                    Returns:
-                        The calculated or cached variable value
-                    """
-                    if key not in self._cache:
-                        self._cache[key] = calculator()
-                    return self._cache[key]
-
-                def cached_property(func):
-                    """Decorator that automatically uses function name as cache key"""
-
-                    def wrapper(self):
-                        property_name = func.__name__
-                        return self._get_cached(property_name, lambda: func(self))
-
-                    return property(wrapper)
-
-                @cached_property
-                def status(self):
-                    """Current printer data from OctoPrint API"""
-                    return self.parent.main._printer.get_current_data()
-
-                @cached_property
-                def event(self):
-                    """Event that triggered the notification. If the event has an alias (bind_msg), it resolves to that."""
-                    event = str(self.kwargs.get("event"))
-                    event_bind_msg = telegramMsgDict.get(event, {}).get("bind_msg")
-                    return event_bind_msg if event_bind_msg else event
-
-                @cached_property
-                def z(self):
-                    """Current Z value"""
-                    return self.parent.z
-
-                @cached_property
-                def temps(self):
-                    """Full temperature data for all tools and bed from OctoPrint API"""
-                    return self.parent.main._printer.get_current_temperatures()
-
-                @cached_property
-                def bed_temp(self):
-                    """Current bed temperature"""
-                    return self.temps.get("bed", {}).get("actual", 0.0)
-
-                @cached_property
-                def bed_target(self):
-                    """Target bed temperature"""
-                    return self.temps.get("bed", {}).get("target", 0.0)
-
-                @cached_property
-                def e1_temp(self):
-                    """Current temperature of extruder 1 (tool0)"""
-                    return self.temps.get("tool0", {}).get("actual", 0.0)
-
-                @cached_property
-                def e1_target(self):
-                    """Target temperature of extruder 1 (tool0)"""
-                    return self.temps.get("tool0", {}).get("target", 0.0)
-
-                @cached_property
-                def e2_temp(self):
-                    """Current temperature of extruder 2 (tool1)"""
-                    return self.temps.get("tool1", {}).get("actual", 0.0)
-
-                @cached_property
-                def e2_target(self):
-                    """Target temperature of extruder 2 (tool1)"""
-                    return self.temps.get("tool1", {}).get("target", 0.0)
-
-                @cached_property
-                def e3_temp(self):
-                    """Current temperature of extruder 3 (tool2)"""
-                    return self.temps.get("tool2", {}).get("actual", 0.0)
-
-                @cached_property
-                def e3_target(self):
-                    """Target temperature of extruder 3 (tool2)"""
-                    return self.temps.get("tool2", {}).get("target", 0.0)
-
-                @cached_property
-                def e4_temp(self):
-                    """Current temperature of extruder 4 (tool3)"""
-                    return self.temps.get("tool3", {}).get("actual", 0.0)
-
-                @cached_property
-                def e4_target(self):
-                    """Target temperature of extruder 4 (tool3)"""
-                    return self.temps.get("tool3", {}).get("target", 0.0)
-
-                @cached_property
-                def e5_temp(self):
-                    """Current temperature of extruder 5 (tool4)"""
-                    return self.temps.get("tool4", {}).get("actual", 0.0)
-
-                @cached_property
-                def e5_target(self):
-                    """Target temperature of extruder 5 (tool4)"""
-                    return self.temps.get("tool4", {}).get("target", 0.0)
-
-                @cached_property
-                def percent(self):
-                    """Current percentage of the print progress"""
-                    progress = self.status.get("progress", {})
-                    completion = progress.get("completion")
-                    return int(completion if completion is not None else 0)
-
-                @cached_property
-                def time_done(self):
-                    """Elapsed time of the current print"""
-                    progress = self.status.get("progress", {})
-                    print_time = progress.get("printTime") or 0
-                    return octoprint.util.get_formatted_timedelta(datetime.timedelta(seconds=print_time))
-
-                @cached_property
-                def time_left(self):
-                    """Remaining time of the current print"""
-                    progress = self.status.get("progress", {})
-                    print_time_left = progress.get("printTimeLeft")
-                    if print_time_left is not None:
-                        return octoprint.util.get_formatted_timedelta(datetime.timedelta(seconds=print_time_left))
-                    return "[Unknown]"
-
-                @cached_property
-                def time_finish(self):
-                    """Estimated finish time of the current print"""
-                    progress = self.status.get("progress", {})
-                    print_time_left = progress.get("printTimeLeft")
-                    if print_time_left is not None:
-                        return self.parent.main.calculate_ETA(print_time_left)
-
-                @cached_property
-                def display_layer_progress(self):
-                    """A dictionary containing data provided by the DisplayLayerProgress plugin"""
-                    return self.parent.main.get_layer_progress_values() or {}
-
-                @cached_property
-                def current_layer(self):
-                    """Current layer number, provided by the DisplayLayerProgress plugin"""
-                    layer_info = self.display_layer_progress.get("layer") or {}
-                    return layer_info.get("current", "?")
-
-                @cached_property
-                def total_layer(self):
-                    """Total number of layers, provided by the DisplayLayerProgress plugin"""
-                    layer_info = self.display_layer_progress.get("layer") or {}
-                    return layer_info.get("total", "?")
-
-                @cached_property
-                def total_height(self):
-                    """Total height of the object being printed, provided by the DisplayLayerProgress plugin"""
-                    height_info = self.display_layer_progress.get("height") or {}
-                    return height_info.get("totalFormatted", "?")
-
-                @cached_property
-                def fan_speed(self):
-                    """Fan speed, provided by the DisplayLayerProgress plugin"""
-                    return self.display_layer_progress.get("fanSpeed", "?")
-
-                @cached_property
-                def change_filament_count(self):
-                    """Number of filament changes occurred, provided by the DisplayLayerProgress plugin"""
-                    print_info = self.display_layer_progress.get("print") or {}
-                    return print_info.get("changeFilamentCount", "?")
-
-                @cached_property
-                def change_filament_time_left(self):
-                    """Remaining time until the next filament change, provided by the DisplayLayerProgress plugin"""
-                    print_info = self.display_layer_progress.get("print") or {}
-                    return print_info.get("changeFilamentTimeLeft", "?")
-
-                @cached_property
-                def change_filament_next_time(self):
-                    """Estimated time of the next filament change, provided by the DisplayLayerProgress plugin"""
-                    print_info = self.display_layer_progress.get("print") or {}
-                    return print_info.get("estimatedChangedFilamentTime", "?")
-
-                @cached_property
-                def owner(self):
-                    """The name of the user who started the print"""
-                    return self.status["job"].get("user") or ""
-
-                @cached_property
-                def user(self):
-                    """The name of the user who performed the action that triggered the notification (e.g., paused or canceled the print)"""
-                    return self.payload.get("user") or ""
-
-                @cached_property
-                def file(self):
-                    """File name of the file currently being printed"""
-                    file = self.status.get("job", {}).get("file", {}).get("name", "")
-                    for key in ("filename", "gcode", "file"):
-                        value = self.payload.get(key)
-                        if value:
-                            file = value
-                            break
-                    return file
-
-                @cached_property
-                def path(self):
-                    """Full path of the file currently being printed"""
-                    return self.status.get("job", {}).get("file", {}).get("path", "")
-
-                @cached_property
-                def metadata(self):
-                    """A dictionary containing metadata of the file currently being printed"""
-                    if not self.path:
-                        return {}
-                    return self.parent.main._file_manager.get_metadata(
-                        octoprint.filemanager.FileDestinations.LOCAL, self.path
-                    )
-
-                @cached_property
-                def error_msg(self):
-                    """The error message string. Only useful for 'Error' event notifications."""
-                    return self.payload.get("error", "")
-
-                @cached_property
-                def UserNotif_Text(self):
-                    """The text received via the serial message echo:UserNotif TEXT, which is triggered by printing a G-code like: M118 E1 UserNotif TEXT."""
-                    return self.payload.get("UserNotif", "")
-
-                @cached_property
-                def prusammu(self):
-                    """A dictionary containing the current state of the Prusa MMU, provided by the Prusa MMU plugin."""
-                    return self.parent.main.send_octoprint_simpleapi_command("prusammu", "getmmu").json()
-
-                @cached_property
-                def resource_monitor(self):
-                    """A dictionary containing data provided by the Resource Monitor plugin."""
-                    return self.parent.main.send_octoprint_request("/plugin/resource_monitor/stats").json()
-
-                @cached_property
-                def enclosure(self):
-                    """A dictionary containing the data provided by the Enclosure plugin, such as the temperatures measured by the sensors or the configured target temperature."""
-                    enclosure = {"current_temps": {}, "humidity": {}, "target_temps": {}}
-                    enclosure_plugin_id = "enclosure"
-                    enclosure_module = self.parent.main._plugin_manager.get_plugin(enclosure_plugin_id, True)
-
-                    if enclosure_module:
-                        enclosure_implementation = self.parent.main._plugin_manager.plugins[
-                            enclosure_plugin_id
-                        ].implementation
-
-                        for rpi_input in enclosure_implementation.rpi_inputs:
-                            if rpi_input["input_type"] == "temperature_sensor":
-                                index_id = str(rpi_input["index_id"])
-                                label = rpi_input.get("label") or "Enclosure"
-                                temp = rpi_input.get("temp_sensor_temp", "")
-                                humidity = rpi_input.get("temp_sensor_humidity", "")
-
-                                if temp != "":
-                                    enclosure["current_temps"][index_id] = {"label": label, "temp": temp}
-
-                                if humidity != "":
-                                    enclosure["humidity"][index_id] = {"label": label, "humidity": humidity}
-
-                        for rpi_output in enclosure_implementation.rpi_outputs:
-                            if rpi_output["output_type"] == "temp_hum_control":
-                                index_id = str(rpi_output["index_id"])
-                                label = rpi_output.get("label") or "Enclosure"
-                                temp = rpi_output.get("temp_ctr_set_value", "")
-
-                                if temp != "":
-                                    enclosure["target_temps"][index_id] = {"label": label, "temp": temp}
-
-                    return enclosure
-
-            lazy_vars = LazyVariables(self, payload, kwargs)
+            lazy_vars = LazyVariables(self, payload, kwargs, kwargs.pop("printer_data", None))
 
             event = lazy_vars.event
 
@@ -633,11 +1013,9 @@ class TMSG:
 
             thumbnail = None
             try:
-                if event == "PrintStarted" and lazy_vars.path:
-                    metadata = self.main._file_manager.get_metadata(
-                        octoprint.filemanager.FileDestinations.LOCAL, lazy_vars.path
-                    )
-                    if metadata:
+                if event == "PrintStarted":
+                    metadata = lazy_vars.metadata  # Also used by templates, it's read only once
+                    if isinstance(metadata, dict):
                         thumbnail = metadata.get("thumbnail")
             except Exception:
                 self._logger.exception("Exception on getting thumbnail")
@@ -649,17 +1027,19 @@ class TMSG:
 
             kwargs["event"] = event
 
-            with_image = bool(self.main._settings.get(["messages", event, "image"]) or False)
+            message_settings = self.get_message_settings(event, payload)
+
+            with_image = bool(message_settings["image"] or False)
             kwargs["with_image"] = with_image
 
-            event_gif = bool(self.main._settings.get(["messages", event, "gif"]) or False)
+            event_gif = bool(message_settings["gif"] or False)
             send_gif_setting = bool(self.main._settings.get(["send_gif"]) or False)
             kwargs["with_gif"] = send_gif_setting and event_gif
 
-            silent = bool(self.main._settings.get(["messages", event, "silent"]) or False)
+            silent = bool(message_settings["silent"] or False)
             kwargs["silent"] = silent
 
-            markup = self.main._settings.get(["messages", event, "markup"]) or "off"
+            markup = message_settings["markup"]
             kwargs["markup"] = markup
 
             # Log locals for debugging (only accessed variables to avoid triggering lazy calculation)
@@ -673,83 +1053,14 @@ class TMSG:
 
             # Format the message
             try:
-
-                class MarkupEscapedValue:
-                    """
-                    Wrapper for template variable values that applies markup escaping at string conversion time.
-
-                    This ensures that escaping happens AFTER template variable resolution and dictionary/list
-                    navigation is complete. This allows users to write templates like {status[job][user]}
-                    where the escaping is applied only to the final resolved value, not to intermediate
-                    dictionary keys during navigation.
-
-                    The wrapper maintains the markup context and applies the appropriate escaping
-                    (HTML, Markdown, MarkdownV2) only when the final value is converted to string.
-                    """
-
-                    def __init__(self, value, markup):
-                        self.value = value
-                        self.markup = markup
-
-                    def __getitem__(self, key):
-                        try:
-                            # Support dictionary/list navigation
-                            return MarkupEscapedValue(self.value[key], self.markup)
-                        except Exception:
-                            _logger.exception("Caught an exception navigating dict/list")
-                            # Return an error placeholder if attempting to access non-existent key or invalid index
-                            return MarkupEscapedValue("[ERROR]", self.markup)
-
-                    def __str__(self):
-                        # Apply markup escaping only at final string conversion
-                        val = str(self.value)
-                        if self.markup == "HTML":
-                            return html.escape(val)
-                        elif self.markup == "Markdown":
-                            return escape_markdown(val, 1)
-                        elif self.markup == "MarkdownV2":
-                            return escape_markdown(val, 2)
-                        return val
-
-                class SecureTemplateContext(dict):
-                    """
-                    Secure context for template variable access.
-
-                    Only `lazy_vars` attributes decorated with `@cached_property` can be accessed from templates.
-                    Unknown or not allowed variables are returned as literal placeholders.
-                    """
-
-                    def __init__(self, lazy_vars, markup):
-                        self.lazy_vars = lazy_vars
-                        self.markup = markup
-
-                        # Only variables of lazy_vars decorated with @cached_property are allowed
-                        self.allowed_vars = {
-                            name for name, attr in type(lazy_vars).__dict__.items() if isinstance(attr, property)
-                        }
-
-                    def __getitem__(self, key):
-                        # If variable is not in allowed_vars, return it as a literal
-                        if key not in self.allowed_vars:
-                            return "{" + key + "}"
-
-                        # Get the lazy value and wrap it with markup escaping
-                        try:
-                            lazy_value = getattr(self.lazy_vars, key)
-                            return MarkupEscapedValue(lazy_value, self.markup)
-                        except Exception:
-                            _logger.exception("Caught an exception getting lazy_vars property")
-                            # Return an error placeholder if getting the lazy_vars property raised an exception
-                            return "[ERROR]"
-
-                message_template = self.main._settings.get(["messages", event, "text"])
-
-                # Render emojis
-                message = render_emojis(message_template)
-
-                # Render lazy vars
-                context = SecureTemplateContext(lazy_vars, markup)
-                message = message.format_map(context)
+                if event == "SerialTrigger" and (payload.get("serial_message") or {}).get("text"):
+                    template = self.get_template(
+                        event, markup, message_settings["text"], f"SerialTrigger:{payload.get('serial_trigger')}"
+                    )
+                else:
+                    template = self.get_template(event, markup)
+                lazy_vars.prefetch(template.variables, self._prefetch_executor)
+                message = template.render(lazy_vars)
             except Exception:
                 self._logger.exception("Caught an exception while formatting the message")
                 message = render_emojis(
@@ -763,16 +1074,54 @@ class TMSG:
         except Exception:
             self._logger.exception("Exception in _sendNotification")
 
+    def load_settings(self):
+        """Cache the settings used by the ZChange gate. To be called again when settings change."""
+        self.notification_height = self.main._settings.get_float(["notification_height"]) or 0.0
+        self.notification_time = self.main._settings.get_int(["notification_time"]) or 0
+
+    def is_event_wanted(self, event, payload) -> bool:
+        """
+        Cheap pre-filter run on the thread dispatching the event, before the event is queued.
+
+        Z changes come at every layer (or continuously in spiral vase prints and with Z hops), but only a few of
+        them lead to a notification: the others are dropped here, without reading printer data or settings.
+        """
+        if event == "PrintStarted":
+            self.last_z = 0.0
+            self.last_notification_time = time.time()
+            self.small_z_steps = 0
+            self.vase_mode = False
+            self.last_progress_check = 0.0
+            self.last_progress_notified = 0.0
+        elif event == "ZChange":
+            if not payload or not self.main._printer.is_printing():
+                return False
+            return self.is_notification_necessary(payload.get("new"), payload.get("old"))
+        return True
+
     # Helper to determine if notification will be send on gcode ZChange event.
-    # Depends on notification time and notification height.
+    # Depends on notification time and notification height (or print progress, in vase mode).
     def is_notification_necessary(self, new_z, old_z):
-        timediff = self.main._settings.get_int(["notification_time"])
+        timediff = self.notification_time
         if timediff and timediff > 0:
             # Check the timediff
             if self.last_notification_time + timediff * 60 <= time.time():
                 self.last_notification_time = time.time()
                 return True
-        zdiff = self.main._settings.get_float(["notification_height"])
+
+        # Spiral vase prints raise Z continuously: height steps become progress steps
+        if new_z is not None and old_z is not None:
+            if 0 < abs(new_z - old_z) < self.VASE_MODE_MAX_Z_STEP:
+                self.small_z_steps += 1
+                if not self.vase_mode and self.small_z_steps >= self.VASE_MODE_MIN_STEPS:
+                    self._logger.info("Continuous Z changes detected, notifying on print progress instead of height")
+                    self.vase_mode = True
+            else:
+                self.small_z_steps = 0
+        if self.vase_mode:
+            return self.is_progress_notification_necessary()
+
+        zdiff = self.notification_height
         if zdiff and zdiff > 0.0:
             if old_z is None or new_z is None or new_z < 0:
                 return False
@@ -785,3 +1134,19 @@ class TMSG:
                 self.last_z = new_z
                 return True
         return False
+
+    def is_progress_notification_necessary(self):
+        if not self.notification_height or self.notification_height <= 0.0:
+            return False
+
+        # Printer data is read at most every VASE_MODE_PROGRESS_CHECK_INTERVAL seconds
+        now = time.monotonic()
+        if now - self.last_progress_check < self.VASE_MODE_PROGRESS_CHECK_INTERVAL:
+            return False
+        self.last_progress_check = now
+
+        completion = self.main.printer_state.get_completion()
+        if completion >= self.last_progress_notified + self.VASE_MODE_PROGRESS_STEP:
+            self.last_progress_notified = completion
+            return True
+        return False
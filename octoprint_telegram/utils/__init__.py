@@ -1,4 +1,5 @@
 from .formatters import Formatters
+from .image_utils import ImageUtils
 from .string_utils import StringUtils
 
-__all__ = ["Formatters", "StringUtils"]
+__all__ = ["Formatters", "ImageUtils", "StringUtils"]
@@ -0,0 +1,273 @@
+import functools
+import io
+import math
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+
+class ImageUtils:
+    """Static utilities for image processing."""
+
+    # Lowest JPEG quality tried when searching for a quality that fits a byte budget
+    MIN_JPEG_QUALITY = 35
+
+    @staticmethod
+    def get_target_size(size: Tuple[int, int], max_dimension: int = 0) -> Tuple[int, int]:
+        """
+        Calculate the size an image must be scaled to so that its longest side fits max_dimension.
+
+        Args:
+            size (Tuple[int, int]): Original (width, height) of the image
+            max_dimension (int): Maximum length of the longest side. 0 disables the limit.
+
+        Returns:
+            Tuple[int, int]: The (width, height) the image should be scaled to, preserving the aspect ratio
+        """
+        width, height = size
+        if not max_dimension or max_dimension <= 0 or max(width, height) <= max_dimension:
+            return width, height
+
+        ratio = max_dimension / max(width, height)
+        return max(1, round(width * ratio)), max(1, round(height * ratio))
+
+    @staticmethod
+    def get_image_size(image_content: bytes) -> Optional[Tuple[int, int]]:
+        """Get the (width, height) of an image reading only its header, or None if it can't be read"""
+        try:
+            with Image.open(io.BytesIO(image_content)) as image:
+                return image.size
+        except Exception:
+            return None
+
+    @staticmethod
+    def encode_jpeg(image: Image.Image, quality: int = 75, max_bytes: int = 0) -> bytes:
+        """
+        Encode an image as JPEG, lowering the quality if needed to fit a byte budget.
+
+        The quality is searched with a bisection between MIN_JPEG_QUALITY and the requested quality.
+        If the image doesn't fit the budget even at the lowest quality, it is downscaled once
+        proportionally to the overshoot and encoded again.
+
+        Args:
+            image (Image.Image): The image to encode
+            quality (int): Preferred JPEG quality (1-95)
+            max_bytes (int): Maximum size of the encoded image in bytes. 0 disables the limit.
+
+        Returns:
+            bytes: The encoded JPEG
+        """
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        quality = max(1, min(int(quality), 95))
+
+        def _encode(img, q):
+            with io.BytesIO() as output:
+                img.save(output, format="JPEG", quality=q, optimize=True)
+                return output.getvalue()
+
+        encoded = _encode(image, quality)
+        if not max_bytes or max_bytes <= 0 or len(encoded) <= max_bytes:
+            return encoded
+
+        # Bisect the highest quality that fits the budget
+        best = None
+        low, high = min(ImageUtils.MIN_JPEG_QUALITY, quality), quality - 1
+        while low <= high:
+            mid = (low + high) // 2
+            candidate = _encode(image, mid)
+            if len(candidate) <= max_bytes:
+                best = candidate
+                low = mid + 1
+            else:
+                high = mid - 1
+
+        if best is not None:
+            return best
+
+        # Still too big at the lowest quality: downscale proportionally and try once more
+        smallest = _encode(image, ImageUtils.MIN_JPEG_QUALITY)
+        scale = (max_bytes / len(smallest)) ** 0.5 * 0.9
+        new_size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+        return _encode(image.resize(new_size, Image.LANCZOS), ImageUtils.MIN_JPEG_QUALITY)
+
+    @staticmethod
+    def process_snapshot(
+        image_content: bytes,
+        flipH: bool = False,
+        flipV: bool = False,
+        rotate: bool = False,
+        max_dimension: int = 0,
+        quality: int = 75,
+        max_bytes: int = 0,
+    ) -> bytes:
+        """
+        Transform and re-encode a webcam snapshot in a single pass.
+
+        JPEG sources are decoded in draft mode, letting libjpeg scale the image down by a power of two
+        while decoding, so that full-resolution pixels are never materialized when a smaller output is requested.
+        If a byte budget is set and the snapshot already fits it without any transformation or downscaling,
+        the original bytes are returned untouched.
+
+        Args:
+            image_content (bytes): The raw snapshot
+            flipH (bool): Flip the image horizontally
+            flipV (bool): Flip the image vertically
+            rotate (bool): Rotate the image by 90 degrees counterclockwise
+            max_dimension (int): Maximum length of the longest side. 0 disables the limit.
+            quality (int): JPEG quality used when the image has to be re-encoded
+            max_bytes (int): Maximum size of the output in bytes. 0 disables the limit.
+
+        Returns:
+            bytes: The processed JPEG image
+        """
+        with io.BytesIO(image_content) as image_buffer:
+            with Image.open(image_buffer) as image:
+                target_size = ImageUtils.get_target_size(image.size, max_dimension)
+                needs_resize = target_size != image.size
+                needs_transpose = any([flipH, flipV, rotate])
+                fits_budget = bool(max_bytes) and max_bytes > 0 and len(image_content) <= max_bytes
+
+                # Nothing to do: send the snapshot as it came from the webcam
+                if image.format == "JPEG" and fits_budget and not (needs_resize or needs_transpose):
+                    return image_content
+
+                if needs_resize and image.format == "JPEG":
+                    image.draft("RGB", target_size)
+
+                image.load()
+
+                processed = image
+                if processed.size != target_size:
+                    processed = processed.resize(target_size, Image.LANCZOS)
+
+                if flipH:
+                    processed = processed.transpose(Image.FLIP_LEFT_RIGHT)
+                if flipV:
+                    processed = processed.transpose(Image.FLIP_TOP_BOTTOM)
+                if rotate:
+                    processed = processed.transpose(Image.ROTATE_90)
+
+                return ImageUtils.encode_jpeg(processed, quality, max_bytes)
+
+    @staticmethod
+    def resize_image(image_content: bytes, size: Tuple[int, int], quality: int = 75) -> bytes:
+        """
+        Resize an image to an exact size and encode it as JPEG.
+
+        Args:
+            image_content (bytes): The source image
+            size (Tuple[int, int]): The (width, height) of the output image
+            quality (int): JPEG quality
+
+        Returns:
+            bytes: The resized JPEG image
+        """
+        with io.BytesIO(image_content) as image_buffer:
+            with Image.open(image_buffer) as image:
+                if image.format == "JPEG":
+                    image.draft("RGB", size)
+                return ImageUtils.encode_jpeg(image.resize(size, Image.LANCZOS), quality)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def get_collage_layout(
+        sizes: Tuple[Tuple[int, int], ...], max_dimension: int = 0
+    ) -> Tuple[Tuple[int, int], Tuple[Tuple[int, int, int, int], ...]]:
+        """
+        Calculate the geometry of a grid collage.
+
+        Results are cached, since the number of webcams and their resolutions rarely change
+        between two notifications.
+
+        Args:
+            sizes (Tuple[Tuple[int, int], ...]): The (width, height) of each frame, in display orientation
+            max_dimension (int): Maximum length of the longest side of the collage. 0 disables the limit.
+
+        Returns:
+            Tuple: The (width, height) of the collage and, for each frame, the (x, y, width, height)
+                box it must be scaled to and pasted at.
+        """
+        count = len(sizes)
+        cols = math.ceil(math.sqrt(count))
+        rows = math.ceil(count / cols)
+
+        cell_width = max(width for width, _ in sizes)
+        cell_height = max(height for _, height in sizes)
+
+        scale = 1.0
+        if max_dimension and max_dimension > 0:
+            scale = min(1.0, max_dimension / max(cols * cell_width, rows * cell_height))
+
+        cell_width = max(1, int(cell_width * scale))
+        cell_height = max(1, int(cell_height * scale))
+
+        boxes = []
+        for index, (width, height) in enumerate(sizes):
+            # Fit each frame in its cell, preserving its aspect ratio, and center it
+            ratio = min(cell_width / width, cell_height / height)
+            box_width, box_height = max(1, int(width * ratio)), max(1, int(height * ratio))
+            row, col = divmod(index, cols)
+            x = col * cell_width + (cell_width - box_width) // 2
+            y = row * cell_height + (cell_height - box_height) // 2
+            boxes.append((x, y, box_width, box_height))
+
+        return (cols * cell_width, rows * cell_height), tuple(boxes)
+
+    @staticmethod
+    def compose_collage(
+        frames: List[Tuple[bytes, bool, bool, bool]],
+        max_dimension: int = 0,
+        quality: int = 75,
+        max_bytes: int = 0,
+    ) -> bytes:
+        """
+        Tile several webcam snapshots in a single grid image, encoded once.
+
+        Args:
+            frames (List[Tuple[bytes, bool, bool, bool]]): For each webcam, the raw snapshot
+                and its flipH, flipV and rotate transformations
+            max_dimension (int): Maximum length of the longest side of the collage. 0 disables the limit.
+            quality (int): Preferred JPEG quality
+            max_bytes (int): Maximum size of the collage in bytes. 0 disables the limit.
+
+        Returns:
+            bytes: The collage as JPEG
+        """
+        images = []
+        try:
+            for image_content, flipH, flipV, rotate in frames:
+                image = Image.open(io.BytesIO(image_content))
+                images.append((image, flipH, flipV, rotate))
+
+            # Sizes in display orientation (90 degrees rotation swaps width and height)
+            sizes = tuple(
+                (image.height, image.width) if rotate else (image.width, image.height) for image, _, _, rotate in images
+            )
+            canvas_size, boxes = ImageUtils.get_collage_layout(sizes, max_dimension)
+
+            canvas = Image.new("RGB", canvas_size)
+            for (image, flipH, flipV, rotate), (x, y, width, height) in zip(images, boxes):
+                source_size = (height, width) if rotate else (width, height)
+
+                if image.format == "JPEG":
+                    image.draft("RGB", source_size)
+
+                tile = image.convert("RGB")
+                if tile.size != source_size:
+                    tile = tile.resize(source_size, Image.LANCZOS)
+
+                if flipH:
+                    tile = tile.transpose(Image.FLIP_LEFT_RIGHT)
+                if flipV:
+                    tile = tile.transpose(Image.FLIP_TOP_BOTTOM)
+                if rotate:
+                    tile = tile.transpose(Image.ROTATE_90)
+
+                canvas.paste(tile, (x, y))
+
+            return ImageUtils.encode_jpeg(canvas, quality, max_bytes)
+        finally:
+            for image, _, _, _ in images:
+                image.close()
@@ -0,0 +1,52 @@
+import logging
+import threading
+from unittest import mock
+
+from octoprint_telegram.printer_state import PrinterStateCache
+
+
+def make_cache():
+    printer = mock.Mock()
+    printer.get_current_data.return_value = {"state": {"text": "From printer"}}
+    cache = PrinterStateCache(logging.getLogger("test"), printer)
+    cache.on_printer_send_current_data(
+        {
+            "state": {"text": "Operational", "flags": {"operational": True, "printing": False}},
+            "job": {"file": {"name": None, "path": None}},
+            "progress": {"completion": None},
+            "currentZ": None,
+        }
+    )
+    return cache, printer
+
+
+def test_job_event_patches_snapshot_and_waits_for_push():
+    cache, printer = make_cache()
+    cache.on_job_event("PrintStarted", {"name": "part.gcode", "path": "dir/part.gcode", "origin": "local"})
+
+    data = cache.get_data()
+    assert data["state"]["text"] == "Printing"
+    assert data["state"]["flags"] == {
+        "operational": True,
+        "printing": True,
+        "paused": False,
+        "pausing": False,
+        "resuming": False,
+        "cancelling": False,
+    }
+    assert data["job"]["file"]["path"] == "dir/part.gcode"
+    assert cache.get_status()["stale"]
+
+    pushed = {"state": {"text": "Printing"}, "job": {"file": {"path": "dir/part.gcode"}}, "progress": {}}
+    threading.Timer(0.05, cache.on_printer_send_current_data, (pushed,)).start()
+    assert cache.get_fresh_data(timeout=5)["state"] == {"text": "Printing"}
+    assert not cache.get_status()["stale"]
+    printer.get_current_data.assert_not_called()
+
+
+def test_fresh_data_falls_back_to_printer():
+    cache, printer = make_cache()
+    cache.on_job_event("PrintDone", {})
+
+    assert cache.get_fresh_data(timeout=0.01) == {"state": {"text": "From printer"}}
+    printer.get_current_data.assert_called_once()
@@ -0,0 +1,36 @@
+import contextlib
+import logging
+from unittest import mock
+
+from octoprint_telegram import TelegramPlugin
+
+
+def make_plugin(clip_sizes):
+    plugin = TelegramPlugin.__new__(TelegramPlugin)
+    plugin._logger = logging.getLogger("test")
+    plugin.bot_url = "https://api.telegram.org/botTOKEN"
+    plugin.telegram_utils = mock.Mock()
+    plugin.media_workspace = mock.Mock()
+    plugin.telegram_action_context = lambda chat_id, action: contextlib.nullcontext()
+    plugin.get_clip_size = clip_sizes.get
+    plugin.read_clip = lambda clip: b"GIF89a"
+    return plugin
+
+
+def test_caption_goes_to_first_animation_not_oversize():
+    plugin = make_plugin({"big.gif": 51 * 1024 * 1024, "small.gif": 1024})
+    message_data = {"parse_mode": "HTML", "reply_markup": "{}", "disable_web_page_preview": True}
+
+    assert plugin.send_animations(123, ["big.gif", "small.gif"], message_data, caption="Print done")
+
+    (call,) = plugin.telegram_utils.send_telegram_request.call_args_list
+    assert call.kwargs["files"]["animation"][0] == "small.gif"
+    assert call.kwargs["data"]["caption"] == "Print done"
+    assert call.kwargs["data"]["parse_mode"] == "HTML"
+
+
+def test_nothing_sent_when_all_animations_oversize():
+    plugin = make_plugin({"big.gif": 51 * 1024 * 1024})
+
+    assert not plugin.send_animations(123, ["big.gif"], {}, caption="Print done")
+    plugin.telegram_utils.send_telegram_request.assert_not_called()
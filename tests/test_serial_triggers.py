@@ -0,0 +1,62 @@
+import logging
+
+from octoprint_telegram.serial_triggers import SerialTriggerMatcher
+
+logger = logging.getLogger("test")
+
+
+def test_default_debounce():
+    matcher = SerialTriggerMatcher(logger, [{"name": "filament", "pattern": "echo:Filament runout"}])
+
+    assert matcher.triggers[0].debounce == 60
+    assert matcher.match("echo:Filament runout", now=100) is not None
+    assert matcher.match("echo:Filament runout", now=130) is None
+    assert matcher.match("echo:Filament runout", now=161) is not None
+
+
+def test_empty_debounce_gets_default_and_zero_disables_it():
+    matcher = SerialTriggerMatcher(
+        logger,
+        [
+            {"name": "empty", "pattern": "a", "debounce": ""},
+            {"name": "none", "pattern": "b", "debounce": None},
+            {"name": "zero", "pattern": "c", "debounce": 0},
+        ],
+    )
+
+    assert [trigger.debounce for trigger in matcher.triggers] == [60, 60, 0]
+    assert matcher.match("c", now=100) is not None
+    assert matcher.match("c", now=100) is not None
+
+
+def test_debounced_trigger_falls_through_to_next_match():
+    trigger_settings = [
+        {"name": "specific", "pattern": "echo:busy: paused", "debounce": 60},
+        {"name": "generic", "pattern": "echo:busy", "debounce": 60},
+    ]
+
+    for combined in (True, False):
+        matcher = SerialTriggerMatcher(logger, trigger_settings)
+        if not combined:
+            matcher._combined = None
+
+        assert matcher.match("echo:busy: paused for user", now=100)["serial_trigger"] == "specific"
+        assert matcher.match("echo:busy: paused for user", now=110)["serial_trigger"] == "generic"
+        assert matcher.match("echo:busy: paused for user", now=120) is None
+
+
+def test_trigger_message_settings_in_payload():
+    matcher = SerialTriggerMatcher(
+        logger,
+        [
+            {"name": "runout", "pattern": "echo:Filament runout", "text": "Runout!", "image": False, "silent": True},
+            {"name": "shared", "pattern": "echo:busy", "text": "", "gif": None},
+        ],
+    )
+
+    assert matcher.match("echo:Filament runout", now=100)["serial_message"] == {
+        "text": "Runout!",
+        "image": False,
+        "silent": True,
+    }
+    assert matcher.match("echo:busy", now=100)["serial_message"] == {}
@@ -0,0 +1,48 @@
+import logging
+import os
+
+import pytest
+
+from octoprint_telegram.media import MediaWorkspace, WorkspaceFullError
+
+
+def make_workspace(tmp_path, quota_bytes=1000):
+    workspace = MediaWorkspace(logging.getLogger("test"), str(tmp_path / "workspace"), quota_bytes=quota_bytes)
+    os.makedirs(workspace.directory)
+    return workspace
+
+
+def write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+def test_untracked_files_evicted_then_full(tmp_path):
+    workspace = make_workspace(tmp_path)
+    leftover = os.path.join(workspace.directory, "leftover.gif")
+    write(leftover, 600)
+
+    first = workspace.allocate("a.gif")
+    write(first, 600)
+    second = workspace.allocate("b.gif")
+    write(second, 500)
+
+    assert not os.path.exists(leftover)
+    with pytest.raises(WorkspaceFullError):
+        workspace.allocate("c.gif")
+    assert os.path.exists(first) and os.path.exists(second)
+
+
+def test_referenced_files_never_deleted(tmp_path):
+    workspace = make_workspace(tmp_path)
+    path = workspace.allocate("a.gif")
+    write(path, 600)
+
+    assert workspace.acquire(path)  # e.g. an upload in flight
+    workspace.discard(path)
+    workspace._evict(0, max_age=0)
+    assert os.path.exists(path)
+
+    workspace.release(path)
+    workspace._evict(0, max_age=0)
+    assert not os.path.exists(path)